@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Launcher removing the files of the artifact store (outputs/artifacts) that are referenced by no simulation
+(Simulations and SimulationsBeta tables): matrices of the simulations deleted or computed again.
+
+The files written or reused recently (--grace-period, in hours) are kept, their reference may not be stored yet
+by a running simulation.
+
+Should be launched from the backEnd folder:
+    python collect_artifacts.py [--grace-period 1]
+"""
+
+# Python modules
+import argparse
+
+# Cydre modules
+from libraries import artifact_store as AS
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Removes the artifacts referenced by no simulation")
+    parser.add_argument('--grace-period', type=float, default=AS.ARTIFACT_GRACE_PERIOD / 3600,
+                        help="age (hours) under which the files are kept")
+    return parser.parse_args()
+
+
+def collect_artifacts(grace_period=AS.ARTIFACT_GRACE_PERIOD):
+    """
+    Removes the artifacts referenced by no simulation
+
+    Parameters
+    ----------
+    grace_period : float
+        age (s) under which the files are kept
+
+    Returns
+    -------
+    deleted : list of strings
+        references of the removed files
+    """
+    # Chargement de la base de données de l'API
+    from api2 import app, artifacts, referenced_artifacts
+
+    with app.app_context():
+        referenced = referenced_artifacts()
+    deleted = artifacts.collect_garbage(referenced, grace_period)
+    print(f"{len(referenced)} artifacts referenced, {len(deleted)} removed")
+    return deleted
+
+
+if __name__ == "__main__":
+    arguments = parse_arguments()
+    collect_artifacts(arguments.grace_period * 3600)
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 12 10:03:17 2026
+
+Launcher compiling the csv time series of the data folder into the memory-mapped store (data/store)
+Should be launched after each update of the time series (done at the end of update_timeseries.py)
+Files modified after the compilation are read from their csv file until the store is compiled again
+"""
+
+# Python modules
+import os
+import time
+
+# Cydre modules
+from setup_cydre_path import setup_cydre_path
+app_root = setup_cydre_path()
+
+import libraries.timeseries_store as TS
+
+
+start = time.time()
+
+#%% Path Definitions
+data_path = os.path.join(app_root, 'data')
+
+
+#%% Store compilation
+manifest = TS.build_timeseries_store(data_path)
+
+for variable_folder, description in manifest['variables'].items():
+    print(variable_folder, ':', len(description['stations']), 'stations')
+print('Date axis :', manifest['start'], '+', manifest['ndays'], 'days')
+
+end = time.time()
+print(end-start)
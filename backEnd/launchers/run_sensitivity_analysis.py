@@ -91,7 +91,7 @@ for params in param_combinations:
         # Create cydre application with updated parameters and run main modules
         cydre_app = init.create_cydre_app()        
         cydre_app.run_spatial_similarity(hydraulic_path, gdf_stations)
-        cydre_app.run_timeseries_similarity(data_path, cydre_app.Similarity.similar_watersheds)
+        cydre_app.run_timeseries_similarity(data_path, cydre_app.Similarity.similar_watersheds, engine='prefix')
         cydre_app.select_scenarios(cydre_app.Similarity.correlation_matrix)
         df_streamflow_forecast, df_storage_forecast = cydre_app.streamflow_forecast(data_path)
         
@@ -22,6 +22,7 @@ app_root = setup_cydre_path()
 import libraries.preprocessing.data.surfex as surfex
 import libraries.preprocessing.data.hydrometry as hydrometry
 import libraries.preprocessing.data.piezometry as piezometry
+import libraries.timeseries_store as TS
 
 
 #%% Path Definitions
@@ -86,3 +87,7 @@ for station_ID in hydro_stations['ID']:
         Climatic.temperature.to_csv(os.path.join(surfex_path, 'temperature', station_ID+'.csv'))
     except:
         print(f"Error updating data for the hydrological station {station_ID}")        
+
+
+#%% Compiling the updated time series in the memory-mapped store
+TS.build_timeseries_store(data_path)
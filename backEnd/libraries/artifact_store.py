@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 24 10:37:52 2026
+
+Content-addressed store of the large numeric results of the simulations.
+
+The correlation matrices and the scenarios matrices are written as compressed binary files (npz: values, index
+and columns arrays), named after the sha256 of their content, in app_root/outputs/artifacts. The Results column of
+the simulations only keeps a reference to the file ('artifact:<sha256>'), so that its size and its parsing cost do
+not depend on the number of watersheds and years. Identical matrices (same simulation run again) share the same file.
+
+The files no longer referenced are removed when their simulations are deleted or replaced (ArtifactStore.delete),
+and by a sweep of the files referenced by no simulation (ArtifactStore.collect_garbage, collect_artifacts.py).
+The files written or reused for less than ARTIFACT_GRACE_PERIOD are kept: their reference may not be stored yet.
+
+3 main functions:
+    - get_store: artifact store of the application (one per process).
+    - resolve_artifacts: replaces the references of a Results document by the matrices, in the json format
+      used before (to_json(orient='split')), for the clients reading the whole document.
+    - references: references of a Results document.
+"""
+
+import os
+import io
+import time
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+
+
+# Folder (relative to app_root) where the artifacts are written
+ARTIFACTS_FOLDER = os.path.join('outputs', 'artifacts')
+# Prefix of the references stored in the Results documents
+ARTIFACT_PREFIX = 'artifact:'
+# Duration (s) during which a file written or reused is not removed
+ARTIFACT_GRACE_PERIOD = 3600
+# Paths of the Results documents (API simulations and SimulationsBeta rows) where the references are stored
+REFERENCE_PATHS = ('$.similarity.corr_matrix', '$.scenarios', '$.selected_scenarios')
+
+# Stores already opened in the process (one per app_root)
+_opened_stores = {}
+
+
+def get_store(app_root):
+    """
+    Gets the artifact store of the application (created once per process)
+    """
+    store = _opened_stores.get(app_root)
+    if store is None:
+        store = ArtifactStore(os.path.join(app_root, ARTIFACTS_FOLDER))
+        _opened_stores[app_root] = store
+    return store
+
+
+def is_reference(value):
+    return isinstance(value, str) and value.startswith(ARTIFACT_PREFIX)
+
+
+class ArtifactStore():
+    """
+    Compressed binary files of dataframes, addressed by the sha256 of their content
+
+    Attributes
+    ----------
+    path : string
+        folder of the files (one subfolder per first two characters of the hash)
+
+    Methods
+    -------
+    put_frame(df)
+        writes the dataframe (if not already stored) and returns its reference
+    get_frame(reference)
+        reads the dataframe of a reference
+    delete(reference)
+        removes the file of a reference
+    collect_garbage(referenced)
+        removes the files of the references not in referenced
+    """
+
+    def __init__(self, path):
+
+        self.path = path
+        self._lock = threading.Lock()
+
+
+    def __file(self, digest):
+        return os.path.join(self.path, digest[:2], f"{digest}.npz")
+
+
+    def put_frame(self, df):
+        arrays = {'values': np.asarray(df.values),
+                  'index': np.asarray(df.index),
+                  'columns': np.asarray(df.columns)}
+        for name in ('index', 'columns'):
+            if arrays[name].dtype == object:
+                arrays[name] = arrays[name].astype(str)
+
+        # Hash of the content (the npz file itself holds the time of writing)
+        digest = hashlib.sha256()
+        for name, array in arrays.items():
+            digest.update(f"{name}:{array.dtype.str}:{array.shape}\n".encode())
+            digest.update(np.ascontiguousarray(array).tobytes())
+        digest = digest.hexdigest()
+
+        file_path = self.__file(digest)
+        try:
+            # Already stored: its date is refreshed, so that it is not removed before its reference is stored
+            os.utime(file_path)
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            buffer = io.BytesIO()
+            np.savez_compressed(buffer, **arrays)
+            # Written under a temporary name then renamed: a file with the final name is always complete
+            with self._lock:
+                tmp_path = f"{file_path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'wb') as file:
+                    file.write(buffer.getvalue())
+                os.replace(tmp_path, file_path)
+        return ARTIFACT_PREFIX + digest
+
+
+    def get_frame(self, reference):
+        with np.load(self.__file(reference[len(ARTIFACT_PREFIX):]), allow_pickle=False) as arrays:
+            return pd.DataFrame(arrays['values'], index=arrays['index'], columns=arrays['columns'].tolist())
+
+
+    def delete(self, reference, grace_period=ARTIFACT_GRACE_PERIOD):
+        """
+        Removes the file of a reference, unless it has been written or reused for less than grace_period seconds
+
+        Returns
+        -------
+        deleted : bool
+            True if the file has been removed
+        """
+        file_path = self.__file(reference[len(ARTIFACT_PREFIX):])
+        try:
+            if time.time() - os.path.getmtime(file_path) < grace_period:
+                return False
+            os.remove(file_path)
+        except OSError:
+            return False
+        return True
+
+
+    def collect_garbage(self, referenced, grace_period=ARTIFACT_GRACE_PERIOD):
+        """
+        Removes the files whose reference is not in referenced (references of all the stored simulations)
+
+        Returns
+        -------
+        deleted : list of strings
+            references of the removed files
+        """
+        deleted = []
+        if not os.path.isdir(self.path):
+            return deleted
+        for folder in os.listdir(self.path):
+            for file_name in os.listdir(os.path.join(self.path, folder)):
+                if not file_name.endswith('.npz'):
+                    continue
+                reference = ARTIFACT_PREFIX + file_name[:-len('.npz')]
+                if reference not in referenced and self.delete(reference, grace_period):
+                    deleted.append(reference)
+        return deleted
+
+
+    def read_frame(self, value):
+        """
+        Dataframe of a Results entry: reference to an artifact, or json (orient='split') of the former documents
+        """
+        if is_reference(value):
+            return self.get_frame(value)
+        return pd.read_json(io.StringIO(value), orient='split')
+
+
+def resolve_artifacts(store, document):
+    """
+    Copy of a Results document where the references are replaced by the json (orient='split') of the dataframes
+    """
+    if isinstance(document, dict):
+        return {key: resolve_artifacts(store, value) for key, value in document.items()}
+    if isinstance(document, list):
+        return [resolve_artifacts(store, value) for value in document]
+    if is_reference(document):
+        return store.get_frame(document).to_json(orient='split')
+    return document
+
+
+def references(document):
+    """
+    Set of the artifact references of a Results document
+    """
+    if isinstance(document, dict):
+        return set().union(*(references(value) for value in document.values()))
+    if isinstance(document, list):
+        return set().union(*(references(value) for value in document))
+    if is_reference(document):
+        return {document}
+    return set()
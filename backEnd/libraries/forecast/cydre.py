@@ -11,6 +11,7 @@ Driver of the application for the hydrological projections
 from numpy import NaN
 
 # Cydre modules
+from libraries import simulation_cache as SC
 from libraries.forecast import user_configuration as UC
 from libraries.forecast import time_management as TI
 from libraries.forecast import similarity as SIM
@@ -91,10 +92,23 @@ class Cydre():
         self.Similarity.get_similar_watersheds(self.UserConfiguration.user_watershed_id, gdf_stations)
     
             
-    def run_timeseries_similarity(self, data_path, similar_watersheds):
+    def run_timeseries_similarity(self, data_path, similar_watersheds, engine='windows'):
+        # Results of a simulation with the same similarity parameters, data and similar watersheds
+        key = SC.stage_key(self.params, data_path, 'timeseries_similarity')
+        inputs = SC.inputs_fingerprint(self.date, list(similar_watersheds), engine)
+        cached = SC.simulation_cache.get(key, 'timeseries_similarity', inputs)
+        if cached is not None:
+            self.Similarity.correlation_matrix, self.Similarity.user_similarity_period = cached
+            return
+        
         self.Similarity.timeseries_similarity(data_path=data_path,
                                               user_watershed_id = self.UserConfiguration.user_watershed_id,
-                                              similar_watersheds = similar_watersheds)
+                                              similar_watersheds = similar_watersheds,
+                                              engine = engine)
+        
+        SC.simulation_cache.put(key, 'timeseries_similarity', inputs,
+                                (self.Similarity.correlation_matrix, getattr(self.Similarity, 'user_similarity_period', None)))
+        
         
     def select_scenarios(self, corr_matrix={}):
         """
@@ -114,6 +128,17 @@ class Cydre():
 
         """
 
+        # Scenarios of a simulation with the same selection parameters and correlation matrices
+        key = SC.stage_key(self.params, self.data_path, 'select_scenarios')
+        inputs = SC.inputs_fingerprint(self.date, corr_matrix)
+        cached = SC.simulation_cache.get(key, 'select_scenarios', inputs)
+        if cached is not None:
+            # The target scenarios are excluded from the given matrices as in the calculation below
+            for correlation_matrix in corr_matrix.values():
+                SE.Selection.drop_target_scenarios(correlation_matrix, self.date.year, self.UserConfiguration.user_watershed_id)
+            self.selected_scenarios, self.scenarios, self.scenarios_grouped = cached
+            return self.scenarios_grouped, self.selected_scenarios , self.scenarios.replace(NaN, 0)
+        
         # Initialization of the forecast scenarios dictionnary
         self.selected_scenarios = {}
         
@@ -143,10 +168,21 @@ class Cydre():
         
         # Group all scenarios in one dataframe
         self.scenarios_grouped = Selection.group_scenarios(self.scenarios)
+        
+        SC.simulation_cache.put(key, 'select_scenarios', inputs, (self.selected_scenarios, self.scenarios, self.scenarios_grouped))
         return self.scenarios_grouped, self.selected_scenarios , self.scenarios.replace(NaN, 0)
     
     
     def streamflow_forecast(self, data_path):
+        
+        # Forecast ensemble of a simulation with the same user configuration, data and scenarios
+        key = SC.stage_key(self.params, data_path, 'streamflow_forecast')
+        inputs = SC.inputs_fingerprint(self.date, self.scenarios_grouped, self.user_Qi)
+        cached = SC.simulation_cache.get(key, 'streamflow_forecast', inputs)
+        if cached is not None:
+            (self.Forecast, self.dry_events, self.wet_events,
+             self.df_streamflow_forecast, self.df_storage_forecast, self.df_station_forecast) = cached
+            return self.df_streamflow_forecast, self.df_storage_forecast
 
         # Create an instance of the Forecast class
         forecast_params = self.params.getgroup("UserConfig")
@@ -180,4 +216,8 @@ class Cydre():
         except: 
             raise ValueError("There are no past events with a correlation coefficient above the defined threshold")
         print(self.scenarios_grouped)
+        
+        SC.simulation_cache.put(key, 'streamflow_forecast', inputs,
+                                (self.Forecast, self.dry_events, self.wet_events,
+                                 self.df_streamflow_forecast, self.df_storage_forecast, self.df_station_forecast))
         return self.df_streamflow_forecast, self.df_storage_forecast
\ No newline at end of file
@@ -10,16 +10,27 @@ Shifts the flow chronicles in order that all start at the same value,
 """
 
 # Modules
-import os
 import pandas as pd
 import numpy as np
 from datetime import timedelta
 
 # Cydre modules
+from libraries import timeseries_store as TS
 from libraries.forecast import time_management as TI
 from libraries.forecast import statistics as ST
 
 
+# Variables of the forecast windows, as named in the merged time series of a watershed
+# (streamflow, recharge, runoff, storage and precipitation)
+FORECAST_VARIABLES = ['Q_streamflow', 'Q_recharge', 'Q_runoff', 'Q_storage', 'Q']
+
+# Folders of the variables read to build the forecast windows (storage = recharge + runoff - streamflow)
+FORECAST_FOLDERS = {'streamflow': 'hydrometry/specific_discharge',
+                    'recharge': 'climatic/surfex/recharge',
+                    'runoff': 'climatic/surfex/runoff',
+                    'precipitation': 'climatic/surfex/precipitation'}
+
+
 class Forecast():
     """
     Attributes
@@ -36,6 +47,12 @@ class Forecast():
         Forecast on streamflow
     Q_XXX_forecast: vector
         Forecast on XXX
+    forecast_windows: 3-D array
+        Forecast of all the variables (FORECAST_VARIABLES) of the selected scenarios (scenarios x time steps x variables)
+    forecast_windows_normalized: 3-D array
+        Same, normalized to have the same initial flow as the reference watershed
+    precipitation_events: dataframe
+        precipitation events of each of the scenarios (see precipitation_events_statistics)
     scenario_watershed: vector
         list of identifier of the selected watersheds
     correlation_coeff: vector
@@ -103,100 +120,187 @@ class Forecast():
         -------
         self: 
             Modifies the initialized XXX_forecast
+            forecast_windows, forecast_windows_normalized: arrays (scenarios x horizon x FORECAST_VARIABLES)
+            of the kept scenarios, described in scenarios_with_chronicles
 
         """         
         
-        # Loop through each combination of watershed and year of the selected scenarios
+        # 1- SCENARIOS: initial day of the forecast in each of the selected years
+        candidates = []
         for (year, watershed_id), coeff in scenarios.items():
-            
+            if year == simulation_date.year:
+                # If it is the same year, there is not any possible forecast
+                print('There is no prospective data for the year {y}'.format(y=year))
+                continue
             try:
-                if year == simulation_date.year:
-                    # If it is the same year, there is not any possible forecast
-                    print('There is no prospective data for the year {y}'.format(y=year))
-                else:
-                    # Extract watershed timeseries (streamflow, recharge, runoff and volume)
-                    df_watershed = self.__extract_timeseries(data_path, watershed_id)
-                    comp_ti = pd.to_datetime(str(year)+'-'+simulation_date.strftime('%m-%d'))
-                    
-                    # Recalculate time origin
-                    #forecast_date = self.__recalculate_time_origin(comp_ti, df_watershed)
-                    forecast_date = comp_ti
-                    
-                    # Time series smoothing for noise reduction
-                    #df_watershed = self.__timeseries_smoothing(df_watershed)
-                    
-                    # Subset of the time series for the forecast period
-                    df_subset, comp_Qi = self.__extract_forecast_period(df_watershed,
-                                                                       year,
-                                                                       forecast_date,
-                                                                       user_Qi)
-                    
-                    # Time series normalization to impose the same "initial" flow
-                    df_normalized = self.__timeseries_normalization(df_subset, user_Qi, comp_Qi)
-                    
-                   # Store timeseries
-                    if len(df_normalized) == self.forecast_horizon:
-                        # Creates the forecasted vectors for each of the time series
-                        self.Q_streamflow_forecast.append(df_subset['Q_streamflow'])
-                        self.Q_recharge_forecast.append(df_subset['Q_recharge'])
-                        self.Q_runoff_forecast.append(df_subset['Q_runoff'])
-                        self.Q_storage_forecast.append(df_subset['Q_storage'])
-                        self.Q_streamflow_forecast_normalized.append(df_normalized['Q_streamflow'])
-                        self.Q_recharge_forecast_normalized.append(df_normalized['Q_recharge'])
-                        self.Q_runoff_forecast_normalized.append(df_normalized['Q_runoff'])
-                        self.Q_storage_forecast_normalized.append(df_normalized['Q_storage'])
-                        self.precipitation.append(df_subset['Q'])
-                        # Update the list of effectively selected scenarios
-                        self.scenario_watershed.append(watershed_id)
-                        self.scenario_year.append(year)
-                        self.correlation_coeff.append(coeff)
-            except:
-                print('There is an issue with the watershed {w} for the year {y}'.format(w=watershed_id,
-                                                                                         y=year))
+                comp_ti = pd.Timestamp(year=int(year), month=simulation_date.month, day=simulation_date.day)
+            except ValueError:
+                # 29th Feb. in a non leap year
+                print('There is an issue with the watershed {w} for the year {y}'.format(w=watershed_id, y=year))
+                continue
+            candidates.append((watershed_id, year, coeff, comp_ti))
+        
+        # 2- GATHER: initial day and forecast period of all the scenarios (scenarios x horizon+1 x variables)
+        windows, present = self.__gather_forecast_windows(data_path, candidates)
+        
+        for (watershed_id, year, _, _), initial in zip(candidates, present[:, 0]):
+            if not initial:
+                print('There is an issue with the watershed {w} for the year {y}'.format(w=watershed_id, y=year))
+        
+        # Only the scenarios with data on the whole forecast period are kept
+        complete = present.all(axis=1)
+        candidates = [candidate for candidate, keep in zip(candidates, complete) if keep]
+        windows = windows[complete]
+        
+        # 3- NORMALIZATION: same "initial" flow for all the scenarios
+        normalization_factor = user_Qi['Q_streamflow'].values[0] / windows[:, 0, 0]
+        self.forecast_windows = windows[:, 1:, :]
+        self.forecast_windows_normalized = self.forecast_windows * normalization_factor[:, None, None]
+        
+        # 4- STORE TIMESERIES: one serie per scenario and variable, indexed by the dates of the scenario year
+        for i, (watershed_id, year, coeff, comp_ti) in enumerate(candidates):
+            dates = pd.DatetimeIndex(comp_ti + pd.to_timedelta(np.arange(1, self.forecast_horizon + 1), unit='D'), name='t')
+            series = self.__window_series(self.forecast_windows[i], dates)
+            normalized = self.__window_series(self.forecast_windows_normalized[i], dates)
+            
+            self.Q_streamflow_forecast.append(series['Q_streamflow'])
+            self.Q_recharge_forecast.append(series['Q_recharge'])
+            self.Q_runoff_forecast.append(series['Q_runoff'])
+            self.Q_storage_forecast.append(series['Q_storage'])
+            self.Q_streamflow_forecast_normalized.append(normalized['Q_streamflow'])
+            self.Q_recharge_forecast_normalized.append(normalized['Q_recharge'])
+            self.Q_runoff_forecast_normalized.append(normalized['Q_runoff'])
+            self.Q_storage_forecast_normalized.append(normalized['Q_storage'])
+            self.precipitation.append(series['Q'])
+            # Update the list of effectively selected scenarios
+            self.scenario_watershed.append(watershed_id)
+            self.scenario_year.append(year)
+            self.correlation_coeff.append(coeff)
+            
         # Necessary to be performed again as some scenarios may have been removed (for the same year)
         self.scenarios_with_chronicles = pd.DataFrame({'watershed':self.scenario_watershed,
                                                        'year':self.scenario_year,
                                                        'coeff':self.correlation_coeff})
     
     
-    def separate_wet_and_dry_events(self, Q_to_forecast, precipitation, precipitation_threshold=2,
-                                    minimal_period=3, total_volume_threshold=40):
-        
-        # Liste pour stocker les indices et les années identifiées
-        idx_wet_years = []
-        all_idx = set(range(len(precipitation)))
+    def __gather_forecast_windows(self, data_path, candidates):
+        """
+        Initial day and forecast period of the scenarios for all the forecast variables.
+        The watersheds compiled in the store are gathered with one fancy indexing per variable,
+        the other ones are read from their csv files.
+
+        Parameters
+        ----------
+        data_path : string
+            location of the data stored
+        candidates : list of tuples
+            (watershed_id, year, coeff, comp_ti) of each scenario, comp_ti being the initial day of the forecast
 
-        # Parcourir chaque série temporelle de précipitations (par année) avec l'index
-        for idx, serie in enumerate(precipitation):
+        Returns
+        -------
+        windows : 3-D array (scenarios x horizon+1 x variables)
+            values of FORECAST_VARIABLES, the first day being the initial day
+        present : 2-D array of bool (scenarios x horizon+1)
+            True where all the variables are available
+
+        """
+        length = self.forecast_horizon + 1
+        windows = np.full((len(candidates), length, len(FORECAST_VARIABLES)), np.nan)
+        present = np.zeros((len(candidates), length), dtype=bool)
+        
+        store = TS.get_store(data_path)
+        in_store = np.array([self.__is_in_store(store, data_path, candidate[0]) for candidate in candidates], dtype=bool)
+        
+        # Watersheds compiled in the store: dense arrays
+        gathered = np.flatnonzero(in_store)
+        if len(gathered):
+            offsets = [(candidates[i][3] - store.dates[0]).days for i in gathered]
+            found = np.ones((len(gathered), length), dtype=bool)
+            values = {}
+            for variable, folder in FORECAST_FOLDERS.items():
+                rows = [store.station_index(folder, candidates[i][0]) for i in gathered]
+                values[variable], variable_found = store.gather(folder, rows, offsets, length)
+                found &= variable_found
             
-            # Initialiser les compteurs et variables
-            consecutive_days = 0
-            total_precipitation = 0
-            event_detected = False
+            values['storage'] = values['recharge'] + values['runoff'] - values['streamflow']
+            windows[gathered] = np.stack([values['streamflow'], values['recharge'], values['runoff'],
+                                          values['storage'], values['precipitation']], axis=-1)
+            present[gathered] = found
+        
+        # Other watersheds: merged time series of the csv files
+        watersheds_df = {}
+        for i in np.flatnonzero(~in_store):
+            watershed_id, year, _, comp_ti = candidates[i]
+            try:
+                if watershed_id not in watersheds_df:
+                    watersheds_df[watershed_id] = self.__extract_timeseries(data_path, watershed_id)
+                df_watershed = watersheds_df[watershed_id]
+                
+                # Initial day
+                comp_Qi = df_watershed[df_watershed.index == comp_ti]
+                if len(comp_Qi):
+                    windows[i, 0] = comp_Qi[FORECAST_VARIABLES].values[0]
+                    present[i, 0] = True
+                
+                # Forecast period
+                period = pd.date_range(start=comp_ti + timedelta(days=1), periods=self.forecast_horizon)
+                df_subset = df_watershed[df_watershed.index.isin(period)]
+                if df_subset.index.equals(period):
+                    windows[i, 1:] = df_subset[FORECAST_VARIABLES].values
+                    present[i, 1:] = True
+            except:
+                present[i] = False
+        
+        return windows, present
+    
+    
+    def __is_in_store(self, store, data_path, watershed_id):
+        # All the forecast variables of the watershed are compiled in the store and up to date
+        if store is None:
+            return False
+        for folder in FORECAST_FOLDERS.values():
+            try:
+                stamp = TS.file_stamp(TS.timeseries_path(data_path, folder, watershed_id))
+            except OSError:
+                return False
+            if not store.is_current(folder, watershed_id, stamp) or store.variables[folder]['columns'] != ['Q']:
+                return False
+        return True
+    
+    
+    def __window_series(self, window, dates):
+        return {variable: pd.Series(window[:, k], index=dates, name=variable)
+                for k, variable in enumerate(FORECAST_VARIABLES)}
+    
+    
+    def separate_wet_and_dry_events(self, Q_to_forecast, precipitation, precipitation_threshold=2,
+                                    minimal_period=3, total_volume_threshold=40):
+        """
+        Separates the scenarios with a significant precipitation event during the forecast period (wet)
+        from the other ones (dry)
 
-            # Parcourir chaque jour dans la série
-            for day, value in serie.items():
-                if value >= precipitation_threshold:
-                    consecutive_days += 1
-                    total_precipitation += value
-                else:
-                    # Vérifier si un événement significatif a été trouvé
-                    if consecutive_days >= minimal_period and total_precipitation >= total_volume_threshold:
-                        event_detected = True
-                        break
-                    # Réinitialiser les compteurs
-                    consecutive_days = 0
-                    total_precipitation = 0
+        Parameters
+        ----------
+        Q_to_forecast : list of series
+            flows of each of the scenarios
+        precipitation : list of series (or 2-D array, scenarios x time steps)
+            precipitation of each of the scenarios over the forecast period
+        precipitation_threshold, minimal_period, total_volume_threshold :
+            see precipitation_events_statistics
 
-            # Vérifier une dernière fois à la fin de la série
-            if consecutive_days >= minimal_period and total_precipitation >= total_volume_threshold:
-                event_detected = True
+        Returns
+        -------
+        dry_events, wet_events : lists of series
+            flows of the dry and wet scenarios
 
-            # Ajouter l'index et l'année à la liste si un événement significatif a été détecté
-            if event_detected:
-                idx_wet_years.append(idx)
-                
-        idx_dry_years = list(all_idx - set(idx_wet_years))
+        """
+        self.precipitation_events = self.precipitation_events_statistics(precipitation,
+                                                                         precipitation_threshold=precipitation_threshold,
+                                                                         minimal_period=minimal_period,
+                                                                         total_volume_threshold=total_volume_threshold)
+        wet = self.precipitation_events['wet'].values
+        idx_wet_years = np.flatnonzero(wet)
+        idx_dry_years = np.flatnonzero(~wet)
         
         dry_events = [Q_to_forecast[idx_dry] for idx_dry in idx_dry_years]
         wet_events = [Q_to_forecast[idx_wet] for idx_wet in idx_wet_years]
@@ -204,6 +308,65 @@ class Forecast():
         return dry_events, wet_events
     
     
+    @staticmethod
+    def precipitation_events_statistics(precipitation, precipitation_threshold=2, minimal_period=3, total_volume_threshold=40):
+        """
+        Precipitation events of all the scenarios at once.
+        A run is a sequence of consecutive days with at least precipitation_threshold mm, 
+        it is a significant event if it lasts at least minimal_period days with at least total_volume_threshold mm in total.
+
+        Parameters
+        ----------
+        precipitation : list of series (or 2-D array, scenarios x time steps)
+            precipitation of each of the scenarios (mm/day)
+        precipitation_threshold : float
+            minimal precipitation of the days of a run (mm)
+        minimal_period : int
+            minimal number of days of a significant event
+        total_volume_threshold : float
+            minimal total precipitation of a significant event (mm)
+
+        Returns
+        -------
+        events : dataframe (one line per scenario)
+            'events' : number of significant events
+            'longest_run' : number of days of the longest run
+            'max_volume' : total precipitation of the wettest run (mm)
+            'wet' : at least one significant event
+
+        """
+        precipitation = np.vstack(precipitation).astype(float) if len(precipitation) else np.empty((0, 0))
+        nscenarios, ndays = precipitation.shape
+        
+        # Starts and ends of the runs: +1 and -1 in the difference of the thresholded days (padded with dry days)
+        wet_days = np.zeros((nscenarios, ndays + 2), dtype=np.int8)
+        wet_days[:, 1:-1] = precipitation >= precipitation_threshold
+        steps = np.diff(wet_days, axis=1)
+        scenarios, starts = np.nonzero(steps == 1)
+        _, ends = np.nonzero(steps == -1)
+        lengths = ends - starts
+        
+        # Volume of each run: sums between the starts and the ends on the flattened array
+        values = np.append(np.where(wet_days[:, 1:-1], precipitation, 0.).ravel(), 0.)
+        bounds = np.empty(2 * len(starts), dtype=np.int64)
+        bounds[0::2] = scenarios * ndays + starts
+        bounds[1::2] = scenarios * ndays + ends
+        volumes = np.add.reduceat(values, bounds)[0::2] if len(bounds) else np.empty(0)
+        
+        # Statistics by scenario
+        significant = (lengths >= minimal_period) & (volumes >= total_volume_threshold)
+        events = np.bincount(scenarios[significant], minlength=nscenarios)
+        longest_run = np.zeros(nscenarios, dtype=np.int64)
+        np.maximum.at(longest_run, scenarios, lengths)
+        max_volume = np.zeros(nscenarios)
+        np.maximum.at(max_volume, scenarios, volumes)
+        
+        return pd.DataFrame({'events': events,
+                             'longest_run': longest_run,
+                             'max_volume': max_volume,
+                             'wet': events > 0})
+    
+    
     #NICOLAS: nom à moidifier timeseries_statistics
     def timeseries_forecast(self, Q_to_forecast, weight=False):
         """
@@ -232,25 +395,15 @@ class Forecast():
             # Takes the relative correlation coefficient as a weighting factor of the scenario
             
             # Generate streamflow projection by weightening timeseries with the correlation coefficient
-            self.q10 = []
-            self.q50 = []
-            self.q90 = []
             
             # prob is the relative importance of the scenario
             prob = self.correlation_coeff/np.sum(self.correlation_coeff)
             print(np.sum(prob))
             
-            for serie in Q_to_forecast.T:
-                # Statistics for each of the columns, ie for each of the dates
-                self.q10.append(ST.Statistics.quantile_with_weights(sample=serie,
-                                                                    weights=prob,
-                                                                    quantile=0.1))
-                self.q50.append(ST.Statistics.quantile_with_weights(sample=serie,
-                                                                    weights=prob,
-                                                                    quantile=0.5))
-                self.q90.append(ST.Statistics.quantile_with_weights(sample=serie,
-                                                                    weights=prob,
-                                                                    quantile=0.9))
+            # Statistics for each of the columns, ie for each of the dates, all computed at once
+            self.q10, self.q50, self.q90 = ST.Statistics.quantiles_with_weights(samples=Q_to_forecast,
+                                                                               weights=prob,
+                                                                               quantiles=[0.1, 0.5, 0.9])
         
         else:
             # Quantiles calculation without weighting factor
@@ -266,7 +419,7 @@ class Forecast():
                                     'Q90':self.q90,
                                     'Qmean':self.qmean})
         
-        df_forecast = df_forecast.set_index(self.forecast_period.strftime('%m-%d'))
+        df_forecast = df_forecast.set_index(pd.Index(TI.calendar.label(self.forecast_period)))
         
         return df_forecast
     
@@ -274,25 +427,10 @@ class Forecast():
     def __extract_timeseries(self, data_path, watershed_id):
         # Loading the data stored in the files
         
-        streamflow_path = os.path.join(data_path, "hydrometry", "specific_discharge", "{}.csv".format(watershed_id)) 
-        with open(streamflow_path) as file:
-            streamflow = pd.read_csv(file, index_col="t")
-            streamflow.index = pd.to_datetime(streamflow.index)
-        
-        recharge_path = os.path.join(data_path, "climatic", "surfex", "recharge", "{}.csv".format(watershed_id)) 
-        with open(recharge_path) as file:
-            recharge = pd.read_csv(file, index_col="t")
-            recharge.index = pd.to_datetime(recharge.index)
-        
-        runoff_path = os.path.join(data_path, "climatic", "surfex", "runoff", "{}.csv".format(watershed_id)) 
-        with open(runoff_path) as file:
-            runoff = pd.read_csv(file, index_col="t")
-            runoff.index = pd.to_datetime(runoff.index)
-        
-        precipitation_path = os.path.join(data_path, "climatic", "surfex", "precipitation", "{}.csv".format(watershed_id)) 
-        with open(precipitation_path) as file:
-            precipitation = pd.read_csv(file, index_col="t")
-            precipitation.index = pd.to_datetime(precipitation.index)
+        streamflow = TS.read_timeseries(data_path, "hydrometry/specific_discharge", watershed_id)
+        recharge = TS.read_timeseries(data_path, "climatic/surfex/recharge", watershed_id)
+        runoff = TS.read_timeseries(data_path, "climatic/surfex/runoff", watershed_id)
+        precipitation = TS.read_timeseries(data_path, "climatic/surfex/precipitation", watershed_id)
             
         storage = recharge + runoff - streamflow 
         
@@ -11,6 +11,8 @@ import pandas as pd
 import numpy as np
 import scipy
 import math
+import heapq
+from scipy.ndimage import maximum_filter1d, minimum_filter1d
 from scipy.stats import rankdata
 from sklearn.preprocessing import StandardScaler
 from dtaidistance import dtw, similarity
@@ -26,6 +28,8 @@ class Indicator():
     def __init__(self, params):
     
         self.params = params
+        # Weights of the days computed for each reference period (see period_weights)
+        self._period_weights = {}
         
     
     def calculate_similarity(self, ref_df, comp_df):
@@ -38,7 +42,9 @@ class Indicator():
         #NICOLAS: supprimer self.x et self.y qui ne semblent pas être utilisés ailleurs dans ce fichier?
         self.x = ref_df.values
         self.y = comp_df.values
-        self.w = np.array((ref_df.index - ref_df.index.min()).days / (ref_df.index.max() - ref_df.index.min()).days)
+        weight = self.is_weighted()
+        if weight:
+            self.w = self.period_weights(ref_df.index)
 
         
 #NICOLAS: à conserver? 
@@ -49,15 +55,15 @@ class Indicator():
         
         # Indicator calculation
         if self.metric == "pearson":
-            coeff = self.pearson(ref_df, comp_df)
+            coeff = self.pearson(ref_df, comp_df, weight=weight)
         
         elif self.metric == 'spearman':
-            coeff = self.spearman(ref_df, comp_df)
+            coeff = self.spearman(ref_df, comp_df, weight=weight)
         
         elif self.metric == "dtw":
             # Is it possible to normalize DTW ? (close to 0 good similarity, high values dissimilarity)
             #coeff = self.dynamic_time_wrapping(ref_df, comp_df)
-            coeff = self.dtw(ref_df, comp_df)
+            coeff = self.dtw(ref_df, comp_df, window=self.get_dtw_window())
         
         elif self.metric == "nse":
             coeff = self.nse(comp_df, ref_df)
@@ -65,6 +71,161 @@ class Indicator():
         return coeff
     
     
+    def get_metric(self):
+        return self.params.getparam("metric").getvalue()
+    
+    
+    def is_weighted(self):
+        """True if the days of the period are weighted (pearson and spearman metrics)"""
+        return self.params.getparam("weighted").getvalue()
+    
+    
+    def time_weights(self, index):
+        """Weights of the days of a period: linear from 0 (first day) to 1 (last day)"""
+        return np.array((index - index.min()).days / (index.max() - index.min()).days)
+    
+    
+    def period_weights(self, index):
+        """
+        time_weights of a reference period, computed once for all the comparisons with this period
+        (the period is identified by its first day, its last day and its number of days)
+        """
+        key = (index[0], index[-1], len(index))
+        weights = self._period_weights.get(key)
+        if weights is None:
+            weights = self.time_weights(index)
+            self._period_weights[key] = weights
+        return weights
+    
+    
+    def has_windows_metric(self):
+        """True if the metric can be computed at once on a 2-D array of windows"""
+        return self.get_metric() in ("pearson", "spearman", "nse", "dtw")
+    
+    
+    def has_variable_length(self):
+        """True if the metric can compare series of different lengths"""
+        return self.get_metric() == "dtw"
+    
+    
+    def calculate_similarity_windows(self, ref_values, comp_windows, lengths=None, weights=None):
+        """
+        Similarity between a reference series and several comparison series of the same length
+        
+        Parameters
+        ----------
+        ref_values : 1-D array
+            reference series (n values)
+        comp_windows : 2-D array
+            comparison series, one per row (m x n)
+        lengths : 1-D array
+            number of values of each of the comparison series (dtw metric only, n by default)
+        weights : 1-D array
+            weights of the days (see time_weights), used if the parameter weighted is True (pearson and spearman metrics)
+
+        Returns
+        -------
+        coeff : 1-D array
+            similarity coefficient of each of the rows (m values)
+        """
+        
+        self.metric = self.get_metric()
+        if not self.is_weighted():
+            weights = None
+        
+        if self.metric == "pearson":
+            coeff = self.pearson_windows(ref_values, comp_windows, weights)
+        
+        elif self.metric == "spearman":
+            coeff = self.spearman_windows(ref_values, comp_windows, weights)
+        
+        elif self.metric == "nse":
+            coeff = self.nse_windows(ref_values, comp_windows)
+        
+        elif self.metric == "dtw":
+            coeff = self.dtw_windows(ref_values, comp_windows, lengths)
+        
+        else:
+            raise ValueError(f"The metric {self.metric} cannot be computed on windows")
+        
+        return coeff
+    
+    
+    def pearson_windows(self, x, Y, w=None):
+        """
+        Pearson correlation between x and each of the rows of Y (same calculation as scipy.stats.pearsonr),
+        weighted by w if given (same calculation as pearson(weight=True))
+        """
+
+        Y = np.atleast_2d(Y)
+
+        if w is not None:
+            cov_xy = self._weighted_cov_rows(x, Y, w)
+            cov_xx = self._weighted_cov(x, x, w)
+            cov_yy = self._weighted_cov_rows(Y, Y, w)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return cov_xy / np.sqrt(cov_xx * cov_yy)
+
+        try:
+            corr = scipy.stats.pearsonr(np.broadcast_to(x, Y.shape), Y, axis=1)[0]
+        except TypeError:
+            # scipy < 1.13: no axis argument
+            corr = self._pearson_rows(x, Y)
+
+        return np.atleast_1d(corr)
+    
+    
+    def spearman_windows(self, x, Y, w=None):
+        """
+        Spearman correlation between x and each of the rows of Y (same calculation as scipy.stats.spearmanr),
+        weighted by w if given (same calculation as spearman(weight=True)), ranks of all the rows computed at once
+        """
+
+        Y = np.atleast_2d(Y)
+        rank_x = rankdata(x)
+        rank_Y = rankdata(Y, axis=1)
+
+        if w is None:
+            # Spearman = Pearson des rangs
+            return self._pearson_rows(rank_x, rank_Y)
+
+        n = len(x)
+        sum_squared_diff = np.sum((w * (rank_x - rank_Y))**2, axis=1)
+        return 1 - (6 * sum_squared_diff) / (n * (n**2 - 1))
+
+
+    def pearson_moments(self, x, sum_y, sum_y2, sum_xy):
+        """
+        Pearson correlation between x and several series y of the same length given by their sums
+        (sum of y, of y**2 and of the products with x centered on its mean), e.g. obtained from prefix sums.
+        Equal to pearson_windows up to the floating point rounding. Constant series give NaN as in scipy.stats.pearsonr.
+        """
+
+        n = len(x)
+        xm = x - x.mean()
+        ss_x = np.sum(xm**2)
+        ss_y = sum_y2 - sum_y**2 / n
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            corr = sum_xy / np.sqrt(ss_x * ss_y)
+
+        # Rounding leaves a small positive ss_y for constant series
+        corr = np.where(ss_y > 1e-10 * sum_y2, corr, np.nan)
+
+        return np.clip(corr, -1.0, 1.0)
+
+
+    def nse_windows(self, x, Y):
+        """NSE of each of the rows of Y with x as observations"""
+        
+        Y = np.atleast_2d(Y)
+        
+        with np.errstate(invalid='ignore', divide='ignore'):
+            nse = 1 - np.sum((x - Y)**2, axis=1) / np.sum((x - np.mean(x))**2)
+        
+        return nse
+    
+    
     #NICOLAS: encore utilisée ou à supprimer? 
     def _series_normalization(self, ref_df, comp_df):
         scaler = StandardScaler()
@@ -134,8 +295,8 @@ class Indicator():
         return corr
     
     
-    def dtw(self, ref_df, comp_df):
-        """Dynamic Time Wrapping"""
+    def dtw(self, ref_df, comp_df, window=None):
+        """Dynamic Time Wrapping (window: width of the Sakoe-Chiba band, None for no band)"""
         
         if isinstance(comp_df, np.ndarray):
             x = ref_df
@@ -144,10 +305,96 @@ class Indicator():
             x = ref_df.values
             y = comp_df.values
             
-        distance = dtw.distance(x, y)
-        corr = (1 / (0.5 + (0.3 * distance))) / 2
+        distance = dtw.distance(x, y, window=window)
+        corr = self._dtw_to_similarity(distance)
         #corr = similarity.distance_to_similarity(distance)
         return corr
+    
+    
+    def get_dtw_window(self):
+        """Width of the Sakoe-Chiba band of the dtw metric (shifts strictly smaller than the width), None for no band"""
+        window = self.params.getparam("dtw_window").getvalue()
+        return window if window > 0 else None
+    
+    
+    def dtw_windows(self, x, Y, lengths=None):
+        """
+        DTW similarity between x and each of the rows of Y
+        
+        lengths gives the number of values of each row (the following ones are ignored), all the values by default:
+        as DTW does not need series of the same length, rows can be shorter than x.
+        
+        If the parameter dtw_n_best is strictly positive, only the dtw_n_best most similar rows are computed exactly,
+        the other rows get NaN. The rows are explored by increasing lower bound (LB_Kim, and LB_Keogh for the rows 
+        of the same length as x): the exploration stops as soon as the lower bound exceeds the current dtw_n_best-th 
+        best distance, and the DTW calculations are abandoned as soon as they exceed it.
+        Rows with missing values (NaN) get NaN.
+        """
+        
+        Y = np.atleast_2d(Y)
+        lengths = np.full(len(Y), Y.shape[1]) if lengths is None else np.asarray(lengths)
+        window = self.get_dtw_window()
+        n_best = self.params.getparam("dtw_n_best").getvalue()
+        
+        distances = np.full(len(Y), np.nan)
+        if np.isnan(x).any():
+            return distances
+        values = np.arange(Y.shape[1]) < lengths[:, None]
+        rows = np.flatnonzero(~(np.isnan(Y) & values).any(axis=1) & (lengths > 0))
+        
+        if n_best <= 0:
+            for i in rows:
+                distances[i] = dtw.distance(x, Y[i, :lengths[i]], window=window)
+        
+        else:
+            lower_bounds = self.lb_kim(x, Y[rows], lengths[rows])
+            full = lengths[rows] == len(x)
+            lower_bounds[full] = np.maximum(lower_bounds[full], self.lb_keogh(x, Y[rows[full]], window))
+            # n best distances and their rows (max-heap of negative distances)
+            best = []
+            for k in np.argsort(lower_bounds, kind='stable'):
+                if len(best) == n_best and lower_bounds[k] >= -best[0][0]:
+                    # Lower bounds are sorted: all the following rows are rejected
+                    break
+                i = rows[k]
+                max_dist = -best[0][0] if len(best) == n_best else None
+                distance = dtw.distance(x, Y[i, :lengths[i]], window=window, max_dist=max_dist)
+                if np.isinf(distance):
+                    # Abandoned: greater than the n-th best distance
+                    continue
+                distances[i] = distance
+                if len(best) == n_best:
+                    _, rejected = heapq.heappushpop(best, (-distance, i))
+                    distances[rejected] = np.nan
+                else:
+                    heapq.heappush(best, (-distance, i))
+        
+        return self._dtw_to_similarity(distances)
+    
+    
+    def lb_kim(self, x, Y, lengths=None):
+        """LB_Kim lower bound of the DTW distance between x and each of the rows of Y (first and last points)"""
+        Y = np.atleast_2d(Y)
+        lengths = np.full(len(Y), Y.shape[1]) if lengths is None else np.asarray(lengths)
+        last = Y[np.arange(len(Y)), lengths - 1]
+        return np.sqrt((x[0] - Y[:, 0])**2 + (x[-1] - last)**2)
+    
+    
+    def lb_keogh(self, x, Y, window=None):
+        """
+        LB_Keogh lower bound of the DTW distance between x and each of the rows of Y:
+        distance of the rows to the envelope of x over the Sakoe-Chiba band (same as dtaidistance.dtw.lb_keogh(y, x))
+        """
+        Y = np.atleast_2d(Y)
+        size = 2 * (window if window else len(x)) - 1
+        upper = maximum_filter1d(x, size=size, mode='nearest')
+        lower = minimum_filter1d(x, size=size, mode='nearest')
+        excess = np.maximum(Y - upper, 0) + np.maximum(lower - Y, 0)
+        return np.sqrt(np.sum(excess**2, axis=1))
+    
+    
+    def _dtw_to_similarity(self, distance):
+        return (1 / (0.5 + (0.3 * distance))) / 2
 
 
     def nse(self, comp_df, ref_df):
@@ -254,6 +501,22 @@ class Indicator():
         return np.sum(w * (x - self._weighted_mean(x, w)) * (y - self._weighted_mean(y, w))) / np.sum(w)
     
     
+    def _weighted_cov_rows(self, X, Y, w):
+        """Weighted Covariance of each of the rows of X and Y (X can be a single row)"""
+        mean_x = np.sum(X * w, axis=-1, keepdims=True) / np.sum(w)
+        mean_y = np.sum(Y * w, axis=-1, keepdims=True) / np.sum(w)
+        return np.sum(w * (X - mean_x) * (Y - mean_y), axis=-1) / np.sum(w)
+    
+    
+    def _pearson_rows(self, x, Y):
+        """Pearson correlation between x and each of the rows of Y (NaN for a constant series or a missing value)"""
+        xm = x - np.mean(x)
+        Ym = Y - np.mean(Y, axis=1, keepdims=True)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            corr = (Ym @ xm) / np.sqrt(np.sum(xm**2) * np.sum(Ym**2, axis=1))
+        return np.clip(corr, -1.0, 1.0)
+    
+    
     def _weighted_rank_diff(self, rank_x, rank_y, w):
         weighted_rank_diff = w * (rank_x - rank_y)
         return np.sum(weighted_rank_diff**2)
\ No newline at end of file
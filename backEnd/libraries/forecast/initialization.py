@@ -13,6 +13,7 @@ import os
 # Import the Cydre modules
 import libraries.forecast.cydre as CY
 import tools.Parameters.Parameters.ParametersGroup as pg
+from libraries import parameters_cache as PC
 
 
 class Initialization():
@@ -70,7 +71,10 @@ class Initialization():
         os.makedirs(folder_res,exist_ok=True)
         
         # Merges the two structures and affects default_values to values when necessary
-        paramgroup = pg.ParametersGroup.merge_diff(file_ref,file_usr,pg.EXPLOPT.REPLACE,folder_res)[0]
+        # paramgroup = pg.ParametersGroup.merge_diff(file_ref,file_usr,pg.EXPLOPT.REPLACE,folder_res)[0]
+        # Structure parsed and merged once per version of the file, copied for each simulation (with its compiled
+        # snapshot, read by getgroup/getparam and compiled again after a modification with find_and_replace_param)
+        paramgroup = PC.get_parameters_template(file_usr, folder_res)
         
         return paramgroup
         
@@ -101,34 +105,16 @@ class Initialization():
             full parameter paths from the root to the parameter searched
 
         """
+        # Index of the names of the structure, built once per parameter file
+        names_index = self.params.names_index_of()
         param_paths = []
 
         for param_name in param_names:
             param_path = []
-
-            # Split the param_name by dots to handle nested parameters
-            param_parts = param_name.split('.')
-            search_path = './/'
-
-            # Build the search path to handle nested parameters
-            for part in param_parts:
-                search_path += f'*[@name="{part}"]/'
-            search_path = search_path.rstrip('/')
-
-            # Search for the parameter in the XML tree
-            param_element = self.params.root.find(search_path)
-
-            if param_element is not None:
-                # Search for the path to the parameter by traversing up the tree
-                current_element = param_element
-                while current_element is not None:
-                    if current_element.tag == 'ParametersGroup':
-                        param_path.insert(0, current_element.get('name'))
-                    current_element = current_element.getparent()
-
-                # Add the full param_name to the end of the path
-                param_path.append(param_parts[-1])
-
+            if param_name in names_index:
+                path, is_param = names_index[param_name]
+                # Name of the element added to the path of its groups (twice for a group, as the xml search)
+                param_path = list(path) if is_param else list(path) + [path[-1]]
             param_paths.append(param_path)
 
         return param_paths
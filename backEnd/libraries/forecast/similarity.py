@@ -19,6 +19,7 @@ import warnings
 warnings.filterwarnings("ignore", message="KMeans is known to have a memory leak on Windows with MKL")
 
 # Cydre modules
+from libraries import timeseries_store as TS
 from libraries.forecast import indicator as IN
 from libraries.forecast import time_management as TI
 
@@ -66,7 +67,7 @@ class Similarity:
     spatial_similarity(self, hydraulic_path)
         Clustering (kmeans) of the watersheds according to their hydraulic conductivities
         and comutation of distances between watersheds, distances in terms of hydraulic conductivities given by xml files
-    timeseries_similarity(self, data_path, user_watershed_id, similar_watersheds)
+    timeseries_similarity(self, data_path, user_watershed_id, similar_watersheds, engine)
         Computes similarities between watersheds according to chronicles 
 
     Methods private
@@ -274,7 +275,7 @@ class Similarity:
         self.similar_watersheds_names = gdf_similars["name"].values        
         
     
-    def timeseries_similarity(self, data_path, user_watershed_id, similar_watersheds):
+    def timeseries_similarity(self, data_path, user_watershed_id, similar_watersheds, engine='windows'):
         """
         Calculate temporal similarity between the user-selected watershed and regional historical watersheds
         over three embedded loops over variables, watersheds and years 
@@ -291,6 +292,16 @@ class Similarity:
             watershed used as reference 
         similar_watersheds : list of strings
             watersheds within the same class (as defined from the hydraulic properties)
+        engine : string
+            'loop' : one similarity calculation per year
+            'windows' : the windows of all the years of a watershed are extracted as a 2-D array,
+                        the windows of all the watersheds are stacked and their coefficients are computed at once
+                        (same results as 'loop').
+                        Falls back to 'loop' when the variable settings cannot be vectorized.
+            'prefix' : Pearson coefficients computed from the prefix sums of the compiled store 
+                       (same results as 'loop' up to the floating point rounding).
+                       The comparison series are not read again when ndays or the date change.
+                       Falls back to 'windows' for the watersheds or settings it does not handle.
 
         Returns
         -------
@@ -303,9 +314,6 @@ class Similarity:
             
             try:
                         
-                # Storing the variable correlation matrix in a dataframe
-                var_corr_matrix = pd.DataFrame()
-                
                 # Time series serving as a reference for the selected variable.
                 user_watershed_df, years = self.__timeseries_preprocessing(data_path, variable, user_watershed_id, which="user")
                 # Limits the chronicle to the period on which similarity should be performed
@@ -313,49 +321,304 @@ class Similarity:
                 # vector of dates on which similarity should be performed
                 self.user_similarity_period = self.TimeProperties._similarity_period
                 
+                # Similarity years and coefficients of each watershed (windows to be scored for the 'windows' engine)
+                similarities = []
+                
                 for comp_watershed_id in similar_watersheds:
                     try:
-                        # Storing the correlation coefficients and years as lists
-                        similarity_coefficients = []
-                        similarity_years = []
+                        if engine == 'prefix':
+                            prefix_similarity = self.__prefix_similarity(data_path, variable, user_watershed_df,
+                                                                         comp_watershed_id, years)
+                            if prefix_similarity is not None:
+                                similarities.append([comp_watershed_id, *prefix_similarity])
+                                continue
                         
                         #  Time series serving as a comparison for the selected variable
                         comp_watershed_df, _ = self.__timeseries_preprocessing(data_path, variable, comp_watershed_id, which='comparison')
                         
-                        # For the selected years
-                        for year in years:                        
-    
-                            # Reduces the chronicle to the selected year
-                            df = self.__set_similarity_period(comp_watershed_df, year, variable)
-            
-                            try:
-                                # ----- SIMILARITY CALCULATION -----
-                                # Keeps days on which data are present both in reference and in compared chronicle
-                                common_indexes = self.__get_common_index(user_watershed_df, df)
-                                comp_serie = df.Q[df.Q.index.strftime('%m-%d').isin(common_indexes)]
-                                # Main function on which similarity is computed effectively 
-                                similarity = self.Indicator.calculate_similarity(user_watershed_df.Q, comp_serie)
-                                # Fills out correlation matrix
-                                similarity_coefficients.append(similarity)
-                                similarity_years.append(year.year)
-                                # ----- SIMILARITY CALCULATION -----
-                            except Exception as e:
-                                print(f"Error processing year {year}, watershed {comp_watershed_id}, variable {variable}: {e}")
-                        
-                        # Fills the variable correlation matrix
-                        tmp_matrix = pd.DataFrame(similarity_coefficients, index=similarity_years)
-                        tmp_matrix.columns = [comp_watershed_id]
-                        var_corr_matrix = pd.concat([var_corr_matrix, tmp_matrix], axis=1, sort=True)
+                        windows = None
+                        if engine in ('windows', 'prefix'):
+                            windows = self.__extract_windows(user_watershed_df, comp_watershed_df, years)
+                        if windows is None:
+                            similarity_years, similarity_coefficients = self.__yearly_similarity(user_watershed_df, comp_watershed_df, years,
+                                                                                                 comp_watershed_id, variable)
+                            similarities.append([comp_watershed_id, similarity_years, similarity_coefficients])
+                        else:
+                            similarities.append([comp_watershed_id, *windows])
                     
                     except Exception as e:
                         print(f"Error processing watershed {comp_watershed_id}, variable {variable}: {e}")
                 
+                # Scores the windows of all the watersheds at once
+                self.__windows_similarity(user_watershed_df, similarities, variable)
+                
+                # Fills the variable correlation matrix
+                var_corr_matrix = self.__assemble_correlation_matrix(similarities, variable)
+                
                 # Store all variable correlation matrix in the general results dictionary
                 self.correlation_matrix[variable] = var_corr_matrix
             
             except:
                 print(f"No data for the variable {variable} at the date {self.TimeProperties.date}")
+    
+    
+    def __yearly_similarity(self, user_watershed_df, comp_watershed_df, years, comp_watershed_id, variable):
+        """
+        Similarity between the reference period and the same period of each of the years of a comparison watershed,
+        computed year by year
+
+        Returns
+        -------
+        similarity_years : list of int
+            years for which the similarity has been computed
+        similarity_coefficients : list of floats
+            similarity coefficient of each of these years
+
+        """
+        
+        similarity_coefficients = []
+        similarity_years = []
         
+        # For the selected years
+        for year in years:                        
+
+            # Reduces the chronicle to the selected year
+            df = self.__set_similarity_period(comp_watershed_df, year, variable)
+
+            try:
+                # ----- SIMILARITY CALCULATION -----
+                # Keeps days on which data are present both in reference and in compared chronicle
+                common_indexes = self.__get_common_index(user_watershed_df, df)
+                comp_serie = df.Q[np.isin(TI.calendar.slot(df.Q.index), common_indexes)]
+                # Main function on which similarity is computed effectively 
+                similarity = self.Indicator.calculate_similarity(user_watershed_df.Q, comp_serie)
+                # Fills out correlation matrix
+                similarity_coefficients.append(similarity)
+                similarity_years.append(year.year)
+                # ----- SIMILARITY CALCULATION -----
+            except Exception as e:
+                print(f"Error processing year {year}, watershed {comp_watershed_id}, variable {variable}: {e}")
+        
+        return similarity_years, similarity_coefficients
+    
+    
+    def __extract_windows(self, user_watershed_df, comp_watershed_df, years):
+        """
+        Extracts the same period as the reference one in all the years of a comparison watershed,
+        as a 2-D array of aligned windows (one row per year).
+        
+        The days (month-day) of the reference period found in the comparison data are paired in date order,
+        as in __yearly_similarity. The days that are not found are left at the end of the row as NaN.
+
+        Returns
+        -------
+        None if the similarity cannot be vectorized (time step, period calculation, metric, duplicated dates)
+        otherwise
+        similarity_years : list of int
+            years
+        (comp_windows, n_found) : tuple
+            comp_windows : 2-D array, comparison values of each of these years, paired with the reference ones
+            n_found : 1-D array, number of days of the reference period found in the comparison data for each year
+
+        """
+        
+        ndays = self.TimeProperties.ndays
+        if (self.TimeProperties.time_step != 'D' or self.TimeProperties.similarity_period_calculation != 'ndays'
+                or not self.Indicator.has_windows_metric() or ndays > 365):
+            return None
+        
+        index = comp_watershed_df.index
+        if len(index) == 0 or not index.is_unique or not index.is_monotonic_increasing or (index != index.normalize()).any():
+            return None
+        
+        # Reference period: day slots (month-day) in date order
+        ref_slots = TI.calendar.slot(user_watershed_df.index.values)
+        if len(ref_slots) < 3 or len(np.unique(ref_slots)) != len(ref_slots):
+            return None
+        
+        # Comparison series on a dense daily axis
+        origin = index[0]
+        positions = (index - origin).days.values
+        n = positions[-1] + 1
+        values = np.full(n, np.nan)
+        values[positions] = comp_watershed_df.Q.values
+        present = np.zeros(n, dtype=bool)
+        present[positions] = True
+        
+        # Windows of ndays ending at the date of each year (one row per year)
+        ends = (pd.DatetimeIndex(years) - origin).days.values
+        windows = ends[:, None] - (ndays - 1) + np.arange(ndays)
+        inside = (windows >= 0) & (windows < n)
+        windows_present = inside & present[np.clip(windows, 0, n - 1)]
+        windows_slots = TI.calendar.slot(np.datetime64(origin.date(), 'D') + np.clip(windows, 0, n - 1))
+        
+        # Position in the window of each day of the reference period (ndays if the day is not in the comparison data)
+        slot_table = np.full((len(years), 372), ndays)
+        rows, offsets = np.nonzero(windows_present)
+        slot_table[rows, windows_slots[rows, offsets]] = offsets
+        matched = np.sort(slot_table[:, ref_slots], axis=1)
+        n_found = (matched < ndays).sum(axis=1)
+        
+        # Comparison values paired with the reference ones in date order
+        comp_windows = values[np.take_along_axis(np.clip(windows, 0, n - 1), np.minimum(matched, ndays - 1), axis=1)]
+        comp_windows[matched == ndays] = np.nan
+        similarity_years = [year.year for year in pd.DatetimeIndex(years)]
+        
+        return similarity_years, (comp_windows, n_found)
+    
+    
+    def __prefix_similarity(self, data_path, variable, user_watershed_df, comp_watershed_id, years):
+        """
+        Pearson similarity between the reference period and the same period of all the years of a comparison watershed,
+        computed from the prefix sums of the compiled store (timeseries_store.TimeseriesStore.prefix_sums):
+        the sums of the windows are obtained in O(1), only the products with the reference period are computed.
+        
+        The years kept are the ones of __extract_windows with all the days of the reference period in the comparison window
+        (__yearly_similarity fails on the other ones with the Pearson metric).
+        Pearson coefficients are not modified by the normalization of the series, which is thus not applied.
+
+        Returns
+        -------
+        None if the similarity cannot be computed this way (settings, metric, station not in the store or modified since its compilation)
+        similarity_years, similarity_coefficients otherwise (see __yearly_similarity)
+
+        """
+        
+        ndays = self.TimeProperties.ndays
+        if (self.TimeProperties.time_step != 'D' or self.TimeProperties.similarity_period_calculation != 'ndays'
+                or self.Indicator.get_metric() != 'pearson' or self.Indicator.is_weighted() or ndays > 366):
+            return None
+        
+        # Reference period: complete ndays period without missing values
+        ref_values = user_watershed_df.Q.values
+        ref_slots = TI.calendar.slot(user_watershed_df.index.values)
+        if (len(ref_values) != ndays or len(ref_values) < 3 or len(np.unique(ref_slots)) != len(ref_slots)
+                or np.isnan(ref_values).any()):
+            return None
+        
+        # Compiled store up to date with the csv file of the station
+        variable_folder = self.variables_definition[variable] + '/' + variable
+        store = TS.get_store(data_path)
+        if store is None:
+            return None
+        try:
+            stamp = TS.file_stamp(TS.timeseries_path(data_path, variable_folder, comp_watershed_id))
+        except OSError:
+            return None
+        if not store.is_current(variable_folder, comp_watershed_id, stamp):
+            return None
+        prefix = store.prefix_sums(variable_folder, comp_watershed_id)
+        
+        # Windows [first, last[ of ndays ending at the date of each year
+        last = (pd.DatetimeIndex(years) - store.dates[0]).days.values + 1
+        first = last - ndays
+        inside = (first >= 0) & (last <= store.ndays)
+        first, last = np.clip(first, 0, store.ndays), np.clip(last, 0, store.ndays)
+        
+        # Same days (month-day) as the reference period, all of them in the comparison data
+        first_slots = TI.calendar.slot(store.dates[first].values)
+        last_slots = TI.calendar.slot(store.dates[np.maximum(last - 1, 0)].values)
+        valid = (inside & (prefix['count'][last] - prefix['count'][first] == ndays)
+                 & (first_slots == ref_slots[0]) & (last_slots == ref_slots[-1]))
+        first, last = first[valid], last[valid]
+        
+        # Sums over the windows and products with the reference period
+        sum_y = prefix['sum'][last] - prefix['sum'][first]
+        sum_y2 = prefix['sum2'][last] - prefix['sum2'][first]
+        comp_windows = prefix['values'][first[:, None] + np.arange(ndays)]
+        sum_xy = comp_windows @ (ref_values - ref_values.mean())
+        
+        coefficients = self.Indicator.pearson_moments(ref_values, sum_y, sum_y2, sum_xy)
+        # Missing values give NaN as in the year by year calculation
+        coefficients[prefix['finite'][last] - prefix['finite'][first] != ndays] = np.nan
+        
+        similarity_years = [year.year for year in pd.DatetimeIndex(years)[valid]]
+        
+        return similarity_years, list(coefficients)
+    
+    
+    def __windows_similarity(self, user_watershed_df, similarities, variable):
+        """
+        Similarity between the reference period and the windows extracted by __extract_windows.
+        The windows of all the watersheds are stacked in a single 2-D array and scored at once.
+        
+        Gives the same coefficients as __yearly_similarity. 
+        The years with missing values (NaN), or with days of the reference period missing in their window
+        when the metric needs series of the same length, are computed year by year with the Indicator.
+
+        Parameters
+        ----------
+        similarities : list
+            [watershed ID, similarity years, similarity coefficients or (comparison windows, number of days found)] for each watershed.
+            The comparison windows are replaced by the similarity coefficients (list of floats)
+
+        Returns
+        -------
+        Modification of similarities
+
+        """
+        
+        batch = [similarity for similarity in similarities if isinstance(similarity[2], tuple)]
+        if not batch:
+            return
+        
+        ref_serie = user_watershed_df.Q
+        ref_values = ref_serie.values
+        comp_windows = np.concatenate([similarity[2][0] for similarity in batch])
+        n_found = np.concatenate([similarity[2][1] for similarity in batch])
+        # Windows computed at once: without missing values, with all the days of the reference period 
+        # (at least one day if the metric can compare series of different lengths)
+        missing = (np.isnan(comp_windows) & (np.arange(comp_windows.shape[1]) < n_found[:, None])).any(axis=1)
+        if self.Indicator.has_variable_length():
+            complete = (n_found > 0) & ~missing & ~np.isnan(ref_values).any()
+        else:
+            complete = (n_found == len(ref_values)) & ~missing & ~np.isnan(ref_values).any()
+        
+        coefficients = np.full(len(comp_windows), np.nan)
+        if complete.any():
+            coefficients[complete] = self.Indicator.calculate_similarity_windows(ref_values, comp_windows[complete], n_found[complete],
+                                                                                 self.Indicator.period_weights(ref_serie.index))
+        
+        start = 0
+        for similarity in batch:
+            comp_watershed_id, years, (windows, _) = similarity
+            end = start + len(windows)
+            similarity_years = []
+            similarity_coefficients = []
+            for year, coefficient, comp_window, found, complete_row in zip(years, coefficients[start:end], windows, 
+                                                                           n_found[start:end], complete[start:end]):
+                # Missing values or days: same behaviour as the year by year calculation
+                if not complete_row:
+                    try:
+                        coefficient = self.Indicator.calculate_similarity(ref_serie, pd.Series(comp_window[:found]))
+                    except Exception as e:
+                        print(f"Error processing year {year}, watershed {comp_watershed_id}, variable {variable}: {e}")
+                        continue
+                similarity_years.append(year)
+                similarity_coefficients.append(coefficient)
+            similarity[1:] = similarity_years, similarity_coefficients
+            start = end
+    
+    
+    def __assemble_correlation_matrix(self, similarities, variable):
+        """
+        Correlation matrix of the variable (rows: years, columns: watersheds), built once from the coefficients of all the watersheds
+        """
+        
+        matrices = []
+        for comp_watershed_id, similarity_years, similarity_coefficients in similarities:
+            try:
+                tmp_matrix = pd.DataFrame(similarity_coefficients, index=similarity_years)
+                tmp_matrix.columns = [comp_watershed_id]
+                matrices.append(tmp_matrix)
+            except Exception as e:
+                print(f"Error processing watershed {comp_watershed_id}, variable {variable}: {e}")
+        
+        if not matrices:
+            return pd.DataFrame()
+        
+        return pd.concat(matrices, axis=1, sort=True)
+    
     
     def __timeseries_preprocessing(self, data_path, variable, watershed_id, which):
         """
@@ -384,12 +647,9 @@ class Similarity:
         
         variable_folder = self.variables_definition[variable]
         # Loading data (the sole location of the code where data are loaded!)
-        file_path = os.path.join(data_path, variable_folder, variable, "{}.csv".format(watershed_id)) 
-        with open(file_path) as file:
-            data = pd.read_csv(file, index_col="t") # t as index
-            data.index = pd.to_datetime(data.index) # from date in string to date in pandas time format
-            data = self.__timeseries_normalization(data)
-            data = self.__timeseries_smoothing(data)
+        data = TS.read_timeseries(data_path, variable_folder + '/' + variable, watershed_id)
+        data = self.__timeseries_normalization(data)
+        data = self.__timeseries_smoothing(data)
         
         years = None
         
@@ -467,4 +727,4 @@ class Similarity:
     
     
     def __get_common_index(self, user_watershed_df, df):
-        return df.index.strftime('%m-%d').intersection(user_watershed_df.index.strftime('%m-%d'))
\ No newline at end of file
+        return np.intersect1d(TI.calendar.slot(df.index), TI.calendar.slot(user_watershed_df.index))
\ No newline at end of file
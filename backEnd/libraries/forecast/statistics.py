@@ -44,4 +44,62 @@ class Statistics():
             Qp = row['values']
         else:
             Qp = np.interp(quantile, df_sorted['cum_weights'], df_sorted['values'])
-        return Qp
\ No newline at end of file
+        return Qp
+
+    @staticmethod
+    def quantiles_with_weights(samples, weights, quantiles):
+        """Calcule les quantiles pondérés de chacune des colonnes d'une matrice de données.
+        
+        Même calcul que quantile_with_weights appliqué à chaque colonne, mais chaque colonne 
+        n'est triée qu'une fois et les poids cumulés sont calculés une fois pour tous les quantiles.
+    
+        Args:
+            samples: Les données (lignes: échantillons; colonnes: séries, par ex. les dates).
+            weights: Les poids associés aux lignes.
+            quantiles: Les quantiles que vous souhaitez calculer.
+    
+        Returns:
+            Matrice des quantiles (lignes: quantiles; colonnes: colonnes de samples).
+        """
+        
+        samples = np.asarray(samples, dtype=float)
+        weights = np.asarray(weights, dtype=float)
+        if samples.ndim == 1:
+            samples = samples[:, None]
+        if len(weights) != len(samples):
+            raise ValueError(f"{len(weights)} weights for {len(samples)} samples")
+        
+        # Sort of each column (NaN at the end) and cumulative weights in the same order
+        order = np.argsort(samples, axis=0)
+        for column in np.flatnonzero(np.isnan(samples).any(axis=0)):
+            # NaN removed before the sort, as in pandas sort_values, so that equal values are taken in the same order
+            nan = np.isnan(samples[:, column])
+            finite = np.flatnonzero(~nan)
+            order[:, column] = np.concatenate([finite[np.argsort(samples[finite, column])], np.flatnonzero(nan)])
+        values = np.take_along_axis(samples, order, axis=0)
+        cum_weights = np.cumsum(weights[order], axis=0)
+        columns = np.arange(samples.shape[1])
+        
+        results = np.empty((len(quantiles), samples.shape[1]))
+        for i, quantile in enumerate(quantiles):
+            # First sorted value whose cumulative weight reaches the quantile
+            k = (cum_weights < quantile).sum(axis=0)
+            if (k == len(samples)).any():
+                raise IndexError(f"Weights sum below the quantile {quantile}")
+            j = np.maximum(k - 1, 0)
+            
+            # Linear interpolation between the previous and this value (same formula as np.interp)
+            x0, x1 = cum_weights[j, columns], cum_weights[k, columns]
+            y0, y1 = values[j, columns], values[k, columns]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                slope = (y1 - y0) / (x1 - x0)
+                Qp = slope * (quantile - x0) + y0
+                Qp = np.where(np.isnan(Qp), slope * (quantile - x1) + y1, Qp)
+            Qp = np.where(np.isnan(Qp) & (y0 == y1), y0, Qp)
+            
+            # Quantile exactly reached, or below the first cumulative weight
+            Qp = np.where((x1 == quantile) | (k == 0), y1, Qp)
+            results[i] = Qp
+        
+        return results
+
@@ -12,13 +12,84 @@ Note:
 """
 
 # Modules
-import os
 import numpy as np
 import pandas as pd
 from datetime import date
 from datetime import datetime
 from datetime import timedelta
 
+# Cydre modules
+from libraries import timeseries_store as TS
+
+
+class Calendar():
+    """
+    Precomputed calendar table, one entry per day between start and end.
+    Each date is mapped to its hydrological year, its day in the hydrological year 
+    and its slot in the calendar year (month-day), so that the alignment 
+    of the chronicles is done with integer arrays instead of '%m-%d' strings.
+    
+    Attributes
+    ----------
+    start : numpy datetime64
+        first date of the table
+    slots : numpy array of int
+        slot of each date: (month-1)*31 + (day-1), in [0, 372[, 29th Feb. included
+    hydro_years : numpy array of int
+        hydrological year of each date (01/10/YY-1 - 30/09/YY)
+    days_of_hydro_year : numpy array of int
+        position of each date in its hydrological year (1st of October = 1)
+    labels : numpy array of strings
+        '%m-%d' label of each slot
+        
+    Methods
+    -------
+    slot(dates), hydro_year(dates), day_of_hydro_year(dates), label(dates):
+        values of the table for a sequence of dates
+    """
+
+    def __init__(self, start='1900-01-01', end='2100-12-31'):
+
+        self.start = np.datetime64(start, 'D')
+        dates = np.arange(self.start, np.datetime64(end, 'D') + 1)
+        months = dates.astype('datetime64[M]')
+        years = months.astype('datetime64[Y]').astype(int) + 1970
+        month = months.astype(int) % 12 + 1
+        
+        self.slots = (month - 1) * 31 + (dates - months).astype(int)
+        self.hydro_years = np.where(month <= 9, years, years + 1)
+        # 1st of October of the previous calendar year
+        first_days = ((self.hydro_years - 1971) * 12 + 9).astype('datetime64[M]').astype('datetime64[D]')
+        self.days_of_hydro_year = (dates - first_days).astype(int) + 1
+        self.labels = np.array([f'{slot // 31 + 1:02d}-{slot % 31 + 1:02d}' for slot in range(12 * 31)])
+
+
+    def positions(self, dates):
+        """
+        Rows of the table corresponding to the dates
+        """
+        dates = np.asarray(dates, dtype='datetime64[D]')
+        positions = (dates - self.start).astype(np.int64)
+        if positions.size and (positions.min() < 0 or positions.max() >= len(self.slots)):
+            raise ValueError(f"Dates out of the calendar range starting at {self.start} ({len(self.slots)} days)")
+        return positions
+
+
+    def slot(self, dates):
+        return self.slots[self.positions(dates)]
+
+
+    def hydro_year(self, dates):
+        return self.hydro_years[self.positions(dates)]
+
+
+    def day_of_hydro_year(self, dates):
+        return self.days_of_hydro_year[self.positions(dates)]
+
+
+    def label(self, dates):
+        return self.labels[self.slot(dates)]
+
 
 class TimeManagement():
 
@@ -118,23 +189,14 @@ class TimeManagement():
         """
 
         # 1-CHECK DATA AVIALABILITY: load data and get last date of data avialable
-        streamflow_path = os.path.join(data_path, "hydrometry", "specific_discharge", "{}.csv".format(user_watershed_id)) 
-        with open(streamflow_path) as file:
-            streamflow = pd.read_csv(file, index_col="t")
-            streamflow.index = pd.to_datetime(streamflow.index)
-            date_streamflow = streamflow.index[-1]
+        streamflow = TS.read_timeseries(data_path, "hydrometry/specific_discharge", user_watershed_id)
+        date_streamflow = streamflow.index[-1]
         
-        recharge_path = os.path.join(data_path, "climatic", "surfex", "recharge", "{}.csv".format(user_watershed_id)) 
-        with open(recharge_path) as file:
-            recharge = pd.read_csv(file, index_col="t")
-            recharge.index = pd.to_datetime(recharge.index)
-            date_recharge = recharge.index[-1]
+        recharge = TS.read_timeseries(data_path, "climatic/surfex/recharge", user_watershed_id)
+        date_recharge = recharge.index[-1]
         
-        piezo_path = os.path.join(data_path, "piezometry", "{}.csv".format(bss_id)) 
-        with open(piezo_path) as file:
-            piezo = pd.read_csv(file, index_col="t")
-            piezo.index = pd.to_datetime(piezo.index)
-            date_piezo = piezo.index[-1]
+        piezo = TS.read_timeseries(data_path, "piezometry", bss_id)
+        date_piezo = piezo.index[-1]
 
         if version == 'application':
             #NICOLAS: à supprimer? 
@@ -159,12 +221,9 @@ class TimeManagement():
             NDAYS_BELOW_CONDITIONS = 4 # days
             CONDITIONS = 3 # mm
             
-            precipitation_path = os.path.join(data_path, "climatic", "surfex", "precipitation", "{}.csv".format(user_watershed_id)) 
-            with open(precipitation_path) as file:
-                precipitation = pd.read_csv(file, index_col="t")
-                precipitation.index = pd.to_datetime(precipitation.index)
+            precipitation = TS.read_timeseries(data_path, "climatic/surfex/precipitation", user_watershed_id)
             #precipitation = user_watershed['climatic']['precipitation']
-                rolling_precipitation = precipitation['Q'].rolling(window=NDAYS_BELOW_CONDITIONS).max()
+            rolling_precipitation = precipitation['Q'].rolling(window=NDAYS_BELOW_CONDITIONS).max()
             
             check_conditions = rolling_precipitation <= CONDITIONS
             precipitation['conditions'] = check_conditions
@@ -193,10 +252,7 @@ class TimeManagement():
             NDAYS_BELOW_CONDITIONS = 4 # days
             CONDITIONS = 3 # mm
             
-            precipitation_path = os.path.join(data_path, "climatic", "surfex", "precipitation", "{}.csv".format(user_watershed_id)) 
-            with open(precipitation_path) as file:
-                precipitation = pd.read_csv(file, index_col="t")
-                precipitation.index = pd.to_datetime(precipitation.index)
+            precipitation = TS.read_timeseries(data_path, "climatic/surfex/precipitation", user_watershed_id)
             rolling_precipitation = precipitation['Q'].rolling(window=NDAYS_BELOW_CONDITIONS).max()
             check_conditions = rolling_precipitation <= CONDITIONS
             
@@ -224,7 +280,7 @@ class TimeManagement():
 
     def DayOfYear(self, df):
 
-        df['DayOfYear'] = df.index.to_series().apply(self.position_in_year)
+        df['DayOfYear'] = calendar.day_of_hydro_year(df.index)
 
         return df
 
@@ -260,10 +316,8 @@ class TimeManagement():
             df timeseries.
 
         """
-        years = df.index.year
         df = df.copy()
-        df.loc[:, 'HydroYear'] = np.where(
-            df.index.month <= 9, years, years + 1)
+        df.loc[:, 'HydroYear'] = calendar.hydro_year(df.index)
 
         return df
 
@@ -305,10 +359,10 @@ class TimeManagement():
                 start=first_recharge_day, end=self.date, freq='D')
             self._similarity_period = self._similarity_period[(
                 self._similarity_period.month != 2) | (self._similarity_period.day != 29)] # Remove 29th Feb.
-            idx = self._similarity_period.strftime('%m-%d')
+            slots = calendar.slot(self._similarity_period)
 
             # subset dataframe with day index
-            df_subset = df[df.index.strftime('%m-%d').isin(idx)]
+            df_subset = df[np.isin(calendar.slot(df.index), slots)]
 
         if self.similarity_period_calculation == 'ndays':
             
@@ -385,3 +439,7 @@ class TimeManagement():
         df = df.resample('M').sum()
         df = df.dropna(subset=['Q'])
         return df
+
+
+# Calendar table shared by all the simulations of the process
+calendar = Calendar()
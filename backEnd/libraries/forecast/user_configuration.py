@@ -11,7 +11,9 @@ Configutation of the watershed used for the projection
 
 from flask import jsonify
 import pandas as pd
-import os
+
+# Cydre modules
+from libraries import timeseries_store as TS
 
 
 class UserConfiguration():
@@ -106,33 +108,15 @@ class UserConfiguration():
     
     
     def get_user_streamflow(self, data_path):
-        streamflow_path = os.path.join(data_path, "hydrometry", "specific_discharge", "{}.csv".format(self.user_watershed_id)) 
-        with open(streamflow_path) as file:
-            streamflow = pd.read_csv(file, index_col="t")
-            streamflow.index = pd.to_datetime(streamflow.index)
+        streamflow = TS.read_timeseries(data_path, "hydrometry/specific_discharge", self.user_watershed_id)
 
         return streamflow
 
 
     def get_user_inputs(self, data_path):
-        recharge_path = os.path.join(data_path, "climatic", "surfex", "recharge", "{}.csv".format(self.user_watershed_id)) 
-        with open(recharge_path) as file:
-            recharge = pd.read_csv(file, index_col="t")
-            recharge.index = pd.to_datetime(recharge.index)
-        
-        runoff_path = os.path.join(data_path, "climatic", "surfex", "runoff", "{}.csv".format(self.user_watershed_id)) 
-        with open(runoff_path) as file:
-            runoff = pd.read_csv(file, index_col="t")
-            runoff.index = pd.to_datetime(runoff.index)
-            
-        precip_path = os.path.join(data_path, "climatic", "surfex", "precipitation", "{}.csv".format(self.user_watershed_id)) 
-        with open(precip_path) as file:
-            precip = pd.read_csv(file, index_col="t")
-            precip.index = pd.to_datetime(precip.index)
-        
-        etp_path = os.path.join(data_path, "climatic", "surfex", "etp", "{}.csv".format(self.user_watershed_id)) 
-        with open(etp_path) as file:
-            etp = pd.read_csv(file, index_col="t")
-            etp.index = pd.to_datetime(etp.index)
+        recharge = TS.read_timeseries(data_path, "climatic/surfex/recharge", self.user_watershed_id)
+        runoff = TS.read_timeseries(data_path, "climatic/surfex/runoff", self.user_watershed_id)
+        precip = TS.read_timeseries(data_path, "climatic/surfex/precipitation", self.user_watershed_id)
+        etp = TS.read_timeseries(data_path, "climatic/surfex/etp", self.user_watershed_id)
         
-        return recharge, runoff, precip, etp 
\ No newline at end of file
+        return recharge, runoff, precip, etp
\ No newline at end of file
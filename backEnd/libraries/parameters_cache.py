@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 25 11:02:18 2026
+
+Cache of the parameter file of the application (launchers/run_cydre_params.xml), shared by the API and
+the Cydre initializations of the process.
+
+The file is parsed once and read again only when its stamp (modification time, size) changes, for instance
+after an update of the values by the /api/parameters route (which also invalidates the cache).
+
+2 main functions:
+    - get_parameters_json: json of the parameters sent to the website (current or default values).
+    - get_parameters_template: ParametersGroup of the file, merged and completed with the default values
+      (as Initialization.load_xml_parameters did at each simulation), returned as a copy to modify.
+"""
+
+import os
+import json
+import threading
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+
+import tools.Parameters.Parameters.ParametersGroup as pg
+from libraries import timeseries_store as TS
+from libraries.utils.toolbox import OrderedDictEncoder
+
+
+# Parameter files already read by the process (one entry per absolute path)
+_parsed_files = {}
+_lock = threading.Lock()
+
+
+def _file_entry(file_path):
+    """
+    Entry of the cache of the file, emptied if the file has changed since it was read
+    """
+    file_path = os.path.abspath(file_path)
+    stamp = TS.file_stamp(file_path)
+    with _lock:
+        entry = _parsed_files.get(file_path)
+        if entry is None or entry['stamp'] != stamp:
+            entry = {'stamp': stamp, 'json': {}, 'template': None}
+            _parsed_files[file_path] = entry
+    return entry
+
+
+def invalidate(file_path):
+    """
+    Forgets the file (to call after writing it)
+    """
+    with _lock:
+        _parsed_files.pop(os.path.abspath(file_path), None)
+
+
+def parse_xml_to_ordered_dict(element, default):
+    """Convertit un élément XML en un OrderedDict imbriqué en incluant les possible_values."""
+    result = OrderedDict()
+    if len(element) > 0:
+        for child in element:
+            if child.tag == 'ParametersGroup':
+                result[child.attrib['name']] = parse_xml_to_ordered_dict(child, default)
+            elif child.tag == 'Parameter':
+                param_name = child.attrib['name']
+                description = child.find('description').text.strip().replace('\n', ' ').replace('\t', ' ')
+                param_type = child.find('type').text.strip().replace('\n', ' ').replace('\t', ' ')
+
+                if default:
+                    param_value = child.find('default_value').text
+                else:
+                    param_value = child.find('value').text
+
+                possible_values = child.find('possible_values').text
+                possible_values_list = possible_values.split('; ') if possible_values else []
+
+                result[param_name] = OrderedDict({
+                    'value': param_value,
+                    'possible_values': possible_values_list,
+                    'description': description,
+                    'type': param_type
+                })
+    return result
+
+
+def get_parameters_json(file_path, default):
+    """
+    Json of the parameters of the file (nested groups in the order of the file)
+
+    Parameters
+    ----------
+    file_path : string
+        xml parameter file
+    default : bool
+        default values of the parameters if True, current values otherwise
+
+    Returns
+    -------
+    parameters_json : string
+    """
+    entry = _file_entry(file_path)
+    parameters_json = entry['json'].get(default)
+    if parameters_json is None:
+        root = ET.parse(file_path).getroot()
+        parameters_json = json.dumps(parse_xml_to_ordered_dict(root, default), cls=OrderedDictEncoder)
+        entry['json'][default] = parameters_json
+    return parameters_json
+
+
+def get_parameters_template(file_path, folder_res):
+    """
+    ParametersGroup of the file, merged with itself and completed with the default values
+
+    Parameters
+    ----------
+    file_path : string
+        xml parameter file
+    folder_res : string
+        folder where the merged file is written (when the file is read)
+
+    Returns
+    -------
+    paramgroup : ParametersGroup
+        copy of the parsed structure (with its compiled snapshot and its index of names), that can be
+        modified by the caller
+    """
+    entry = _file_entry(file_path)
+    with _lock:
+        if entry['template'] is None:
+            # Merges the two structures and affects default_values to values when necessary
+            template = pg.ParametersGroup.merge_diff(file_path, file_path, pg.EXPLOPT.REPLACE, folder_res)[0]
+            template.compile()
+            template.names_index_of()
+            entry['template'] = template
+        return entry['template'].clone()
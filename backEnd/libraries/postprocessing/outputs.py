@@ -22,6 +22,9 @@ from shapely.geometry import MultiPolygon
 from scipy.signal import find_peaks
 from scipy.interpolate import interp1d
 
+# Cydre modules
+from libraries.forecast import time_management as TI
+
 
 def hex_to_rgba(hex_color, alpha=1.0):
     """
@@ -279,7 +282,7 @@ class Outputs():
    
         # Observation
         reference_df = self.user_streamflow.copy()
-        reference_df['daily'] = reference_df.index.strftime('%m-%d')
+        reference_df['daily'] = TI.calendar.label(reference_df.index)
         # Conversion of surface from km^2 to m^2
         reference_df['Q'] *= (self.watershed_area * 1e6) # m/s > m3/s
         
@@ -1083,7 +1086,7 @@ class Outputs():
                 df['t'] = pd.to_datetime(df['t'])
                 df = df.set_index('t')
                 df['year'] = df.index.year
-                df['daily'] = df.index.strftime('%m-%d')
+                df['daily'] = TI.calendar.label(df.index)
                 
                 # Calcul des statistiques saisonnières
                 q10 = (df.groupby('daily')['Q'].quantile(0.1)) * 86400 / (watershed_area*1e6)
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 20 09:41:52 2026
+
+Cache of the results of whole simulations, addressed by their content.
+
+A simulation is identified by a key combining:
+    - the effective parameter values, i.e. the xml structure after the replacements made from the user inputs
+      (find_and_replace_param), whatever the way they have been set,
+    - the version of the input data: stamps of all the csv time series files, the ones read_timeseries checks
+      to serve a series from the compiled store or from its csv file.
+The results of each step of the simulation (correlation matrices, scenarios, forecast ensemble) are stored under
+this key and the inputs of the step, so that an identical simulation does not compute them again.
+
+Each stage of the pipeline only depends on a part of the parameters (STAGE_PARAMETERS): its key is built from these
+parameters only, the outputs of the upstream stages being part of its inputs. A change of a selection parameter
+or of the forecast horizon thus reuses the correlation matrices computed with the same similarity parameters.
+
+When the time series are updated (update_timeseries.py), the data version and thus all the keys change:
+the results computed on the previous data are no longer used and are evicted by the LRU policy.
+
+The content of the series of a station is also fingerprinted (station_fingerprint: last date, number of rows and
+checksum of each file of the watershed and of its piezometer), so that the batch update of the SimulationsBeta
+table only computes again the stations whose series, or the series of their similar watersheds, have new values.
+"""
+
+import os
+import copy
+import zlib
+import fnmatch
+import hashlib
+import threading
+from collections import OrderedDict
+import pandas as pd
+
+from libraries import timeseries_store as TS
+
+
+# Maximum number of step results kept in memory by the process-wide cache
+SIMULATION_CACHE_SIZE = 64
+
+# Parameters on which each stage of the pipeline depends (paths from the root of the parameters, '*' matching any group)
+# The date of simulation, the similar watersheds and the outputs of the upstream stages are given as inputs of the stages
+STAGE_PARAMETERS = {
+    'timeseries_similarity': ['UserConfig::user_watershed_id',
+                              'Similarity::*::Time::*',
+                              'Similarity::*::Calculation::metric',
+                              'Similarity::*::Calculation::dtw_window',
+                              'Similarity::*::Calculation::dtw_n_best',
+                              'Similarity::*::Calculation::weighted',
+                              'Similarity::*::Calculation::scale'],
+    'select_scenarios': ['UserConfig::user_watershed_id',
+                         'Similarity::*::Calculation::selection_method',
+                         'Similarity::*::Calculation::minimal_threshold',
+                         'Similarity::*::Calculation::maximal_percentage',
+                         'Similarity::*::Calculation::n_scenarios'],
+    'streamflow_forecast': ['UserConfig::*'],
+    }
+
+
+def parameters_fingerprint(params, patterns=None):
+    """
+    Hash of the effective values of the parameters of an xml parameter structure
+
+    Parameters
+    ----------
+    params : ParametersGroup
+        parameter structure (ALL), after the replacement of the user values
+    patterns : list of strings, optional
+        paths of the parameters to take into account, from the root of the structure (ex: 'Similarity::*::Time::*').
+        All the parameters if None.
+
+    Returns
+    -------
+    fingerprint : string
+        sha256 of the sorted (path, value) of the parameters
+    """
+    values = []
+    for param in params.root.iterfind('.//Parameter'):
+        path = [param.get('name')]
+        parent = param.getparent()
+        while parent is not None and parent is not params.root:
+            path.insert(0, parent.get('name'))
+            parent = parent.getparent()
+        path = '::'.join(path)
+        if patterns is None or any(fnmatch.fnmatchcase(path, pattern) for pattern in patterns):
+            values.append((path, param.findtext('value')))
+
+    digest = hashlib.sha256()
+    for path, value in sorted(values):
+        digest.update(f"{path}={value}\n".encode())
+    return digest.hexdigest()
+
+
+def data_version(data_path, variable_folders=TS.STORE_VARIABLES):
+    """
+    Version of the input data, which changes as soon as a time series or the stations are updated
+
+    Hash of the stamps (modification time, size) of all the csv time series files, those read_timeseries compares
+    to the compiled store: a file rewritten in place, which is then read from its csv file, changes the version
+    even if the store and the folders are unchanged. A stat per file (a few ms for the regional data).
+    """
+    stamps = sorted(TS.data_stamps(data_path, variable_folders).items())
+
+    stations_path = os.path.join(data_path, 'stations.csv')
+    if os.path.exists(stations_path):
+        stamps.append((('stations.csv', ''), TS.file_stamp(stations_path)))
+
+    digest = hashlib.sha256()
+    for (variable_folder, station_id), stamp in stamps:
+        digest.update(f"{variable_folder}/{station_id}:{stamp[0]}:{stamp[1]}\n".encode())
+    return digest.hexdigest()
+
+
+def series_fingerprint(file_path):
+    """
+    Fingerprint of the content of a csv time series file: last date, number of rows and checksum (crc32)
+    Unchanged when the file is written again with the same values (update without new data). None if the file is missing.
+    """
+    try:
+        with open(file_path, 'rb') as file:
+            content = file.read()
+    except OSError:
+        return None
+    lines = content.rstrip(b'\r\n').split(b'\n')
+    last_date = lines[-1].split(b',', 1)[0].decode() if len(lines) > 1 else None
+    return [last_date, len(lines) - 1, zlib.crc32(content)]
+
+
+def station_fingerprint(data_path, station_id, bss_id=None, variable_folders=TS.STORE_VARIABLES):
+    """
+    Fingerprint of the time series of a station: series of the watershed (station_id) in the variable folders,
+    and series of its piezometer (bss_id, None if the watershed has none) in the piezometry folder, whose files are
+    named after the BSS identifiers. Changes only when one of these series has new or modified values
+    """
+    digest = hashlib.sha256()
+    for variable_folder in variable_folders:
+        series_id = bss_id if variable_folder == 'piezometry' else station_id
+        fingerprint = series_fingerprint(TS.timeseries_path(data_path, variable_folder, series_id)) if series_id else None
+        digest.update(f"{variable_folder}:{fingerprint}\n".encode())
+    return digest.hexdigest()[:16]
+
+
+def stage_key(params, data_path, stage):
+    """
+    Content key of a stage of the simulation: values of the parameters the stage depends on and version of the data
+    """
+    key = stage + os.path.abspath(data_path) + parameters_fingerprint(params, STAGE_PARAMETERS[stage]) + data_version(data_path)
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def inputs_fingerprint(*inputs):
+    """
+    Hash of the inputs of a step (dataframes, series, dictionaries of dataframes, lists, scalars)
+    """
+    digest = hashlib.sha256()
+    for value in inputs:
+        _update_digest(digest, value)
+    return digest.hexdigest()
+
+
+def _update_digest(digest, value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        digest.update(type(value).__name__.encode())
+        digest.update(repr(value.shape).encode())
+        digest.update(repr(list(value.columns) if isinstance(value, pd.DataFrame) else value.name).encode())
+        digest.update(pd.util.hash_pandas_object(value, index=True).values.tobytes())
+    elif isinstance(value, dict):
+        digest.update(b'{')
+        for k in sorted(value, key=str):
+            digest.update(repr(k).encode())
+            _update_digest(digest, value[k])
+        digest.update(b'}')
+    elif isinstance(value, (list, tuple)):
+        digest.update(b'[')
+        for item in value:
+            _update_digest(digest, item)
+        digest.update(b']')
+    else:
+        digest.update(repr(value).encode())
+    digest.update(b';')
+
+
+class SimulationCache():
+    """
+    Bounded LRU cache of the results of the simulation steps, shared by the whole process
+
+    Entries are keyed by (simulation key, step name, fingerprint of the step inputs). The results are copied
+    when stored and when returned, so that the callers can modify them without altering the cache.
+
+    Attributes
+    ----------
+    maxsize : int
+        maximum number of step results kept in memory
+    hits, misses : int
+        number of steps served by the cache, number of steps that had to be computed
+    """
+
+    def __init__(self, maxsize=SIMULATION_CACHE_SIZE):
+
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def get(self, key, step, inputs=''):
+        with self._lock:
+            entry = self._entries.get((key, step, inputs))
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((key, step, inputs))
+            self.hits += 1
+        return copy.deepcopy(entry)
+
+
+    def put(self, key, step, inputs, results):
+        results = copy.deepcopy(results)
+        with self._lock:
+            self._entries[(key, step, inputs)] = results
+            self._entries.move_to_end((key, step, inputs))
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+# Process-wide cache used by the Cydre application
+simulation_cache = SimulationCache()
@@ -0,0 +1,783 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Oct 21 14:12:37 2026
+
+Background execution of the steps of the API simulations.
+
+The steps of a simulation are run as jobs in a local pool of worker processes (no external broker). The long ones
+(timeseries similarity, streamflow forecast) are only enqueued by the Flask request, which returns the identifier
+of the job; the short ones are awaited by the request (JobQueue.run). Each job reports the progress and the
+duration of its stages in a status shared with the server process (multiprocessing manager). The results computed
+by the worker are returned to the server process, which stores them in the database (on_done callback or route).
+
+The Cydre applications built for the simulations are kept alive by a bounded registry (CydreRegistry, one per
+worker), so that the successive steps of a simulation workflow (similarities, selection, forecast, indicators)
+reuse the same application and its computed state instead of rebuilding it. The jobs of a simulation are
+therefore always run by the same worker (the one of its SimulationID), and the server process holds no application.
+An application is used by one job at a time.
+
+Jobs
+----
+spatial_similarity_job
+    clusters and similar watersheds of the simulation (run_spatial_similarity route)
+timeseries_similarity_job
+    correlation matrices of the simulation, stored in the artifact store (run_timeseries_similarity route)
+select_scenarios_job
+    scenarios selected from the correlation matrices, stored in the artifact store (select_scenarios route)
+forecast_job
+    graph of the projections, 1/10 of the module indicator and scenarios table (getForecastResults route)
+indicator_job
+    projections of an alert threshold, from the forecast of the live application (update_indicator route)
+beta_simulation_job
+    whole simulation of a station, as a row of the SimulationsBeta table (update_beta_simulations.py)
+"""
+
+import os
+import json
+import time
+import uuid
+import zlib
+import threading
+import traceback
+import multiprocessing
+from collections import OrderedDict
+from contextlib import contextmanager, ExitStack
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+import pandas as pd
+
+import libraries.forecast.initialization as INI
+from libraries.forecast import time_management as TI
+import libraries.postprocessing.outputs as OUT
+from libraries import simulation_cache as SC
+from libraries import artifact_store as AS
+from libraries import timeseries_store as TS
+from libraries.load_data import define_paths
+
+
+# Number of worker processes running the simulations
+JOB_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+# Duration (s) during which the status of a finished job is kept
+JOB_RETENTION = 3600
+# Maximum number of live Cydre applications (all the workers of a job queue) and duration (s) after which an
+# unused application is dropped
+CYDRE_REGISTRY_SIZE = 32
+CYDRE_REGISTRY_TTL = 1800
+# Entries of the simulation parameters written by the API, not used to build the application
+DISPLAY_PARAMETERS = ('watershed_name', 'station_name')
+
+# Data of the worker process (set by the pool initializer)
+_worker = {}
+
+
+#%% BUILDING OF THE CYDRE APPLICATION
+
+def cydre_app_from_parameters(app_root, stations, parameters):
+    """
+    Create the Cydre application of a simulation from the parameters stored in the database
+
+    Parameters
+    ----------
+    app_root : string
+        root folder of the application
+    stations : GeoDataFrame
+        hydrological stations
+    parameters : dict
+        parameters of the simulation (Parameters column), as nested dictionaries of values
+
+    Returns
+    -------
+    cydre_app : Cydre
+        application with the xml parameters replaced by the values of the simulation
+    """
+    init = INI.Initialization(app_root, stations)
+    init.params = init.load_xml_parameters()
+
+    # Mettre à jour les paramètres de l'application en fonction des entrées (une passe sur la structure et son instantané)
+    init.params.apply_overrides({key: value for key, value in parameters.items() if key not in DISPLAY_PARAMETERS})
+
+    return init.create_cydre_app()
+
+
+def simulation_date_from_parameters(app_root, stations, parameters):
+    """
+    Effective date of the simulation (TimeManagement.define_simulation_date: date of the parameters, limited by the
+    last dates of the data of the station and moved back before significant precipitation), without building
+    the application
+    """
+    init = INI.Initialization(app_root, stations)
+    params = init.load_xml_parameters()
+    params.apply_overrides({key: value for key, value in parameters.items() if key not in DISPLAY_PARAMETERS})
+
+    user_watershed_id = params.getgroup('UserConfig').getparam('user_watershed_id').getvalue()
+    version = params.getgroup('General').getparam('version').getvalue()
+    return TI.TimeManagement.define_simulation_date(params, init.data_path, version, user_watershed_id,
+                                                    bss_ids(stations).get(user_watershed_id))
+
+
+def bss_ids(stations):
+    """
+    Piezometer (BSS identifier) of each watershed, None for the watersheds without piezometer
+    """
+    return {station_id: bss_id if isinstance(bss_id, str) and bss_id else None
+            for station_id, bss_id in zip(stations['ID'], stations['BSS_ID'])}
+
+
+class CydreRegistry():
+    """
+    Bounded registry of the live Cydre applications, keyed by SimulationID
+
+    An application is rebuilt when the parameters of the simulation or the version of the data have changed.
+    The applications unused for ttl seconds are dropped, as the least recently used ones beyond maxsize.
+    Each application is used by one caller at a time (use_app): the concurrent callers of a simulation
+    wait for each other instead of modifying the same application.
+
+    Attributes
+    ----------
+    maxsize : int
+        maximum number of live applications
+    ttl : float
+        duration (s) after which an unused application is dropped
+    """
+
+    def __init__(self, maxsize=CYDRE_REGISTRY_SIZE, ttl=CYDRE_REGISTRY_TTL):
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    @contextmanager
+    def use_app(self, simulation_id, app_root, stations, parameters):
+        """
+        Live application of the simulation, built if needed, reserved to the caller until the end of the with block
+
+        Yields
+        ------
+        cydre_app : Cydre
+            application of the simulation
+        created : bool
+            True if the application has just been built
+        """
+        signature = (json.dumps({key: value for key, value in parameters.items() if key not in DISPLAY_PARAMETERS},
+                                sort_keys=True, default=str),
+                     SC.data_version(os.path.join(app_root, 'data')))
+
+        with self._lock:
+            self.__evict()
+            entry = self._entries.get(simulation_id)
+            if entry is None or entry['signature'] != signature:
+                # The application of the former entry stays with the callers still using it
+                entry = {'app': None, 'signature': signature, 'lock': threading.Lock()}
+                self._entries[simulation_id] = entry
+            entry['last_access'] = time.time()
+            self._entries.move_to_end(simulation_id)
+            self.__evict()
+
+        # Verrou de l'entrée conservé pendant toute l'utilisation de l'application (construction comprise)
+        with entry['lock']:
+            created = entry['app'] is None
+            if created:
+                entry['app'] = cydre_app_from_parameters(app_root, stations, parameters)
+            try:
+                yield entry['app'], created
+            finally:
+                entry['last_access'] = time.time()
+
+
+    def discard(self, simulation_id):
+        with self._lock:
+            self._entries.pop(simulation_id, None)
+
+
+    def __evict(self):
+        now = time.time()
+        for simulation_id in [simulation_id for simulation_id, entry in self._entries.items() if now - entry['last_access'] > self.ttl]:
+            del self._entries[simulation_id]
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+# Live Cydre applications of the process (worker)
+cydre_registry = CydreRegistry()
+
+
+def scenarios_grouped_from_json(scenarios_grouped_json):
+    """
+    Series of the grouped scenarios (index: Year, Station) from its json stored in the database
+    """
+    scenarios_grouped_dict = json.loads(scenarios_grouped_json)
+
+    # Transformer le dictionnaire en une liste de tuples pour la conversion en Series
+    index_values = [(int(key.split(',')[0][1:]), key.split(',')[1].split('\'')[1].strip()) for key in scenarios_grouped_dict.keys()]
+    data_values = list(scenarios_grouped_dict.values())
+
+    # Créer une MultiIndex pour le Series
+    index = pd.MultiIndex.from_tuples(index_values, names=["Year", "Station"])
+    return pd.Series(data_values, index=index)
+
+
+#%% JOBS (run in the worker processes)
+
+def _init_worker(app_root, stations, registry_size=CYDRE_REGISTRY_SIZE):
+    _worker['app_root'] = app_root
+    _worker['stations'] = stations
+    _worker['paths'] = define_paths(app_root)
+    # Part of the live applications of the pool kept by this worker
+    cydre_registry.maxsize = registry_size
+    # Time series store opened once: its arrays are memory-mapped, their pages are shared by the workers
+    TS.get_store(_worker['paths'][0])
+
+
+def _reserve_app(reservation, progress, simulation_id, parameters):
+    """
+    Live application of the simulation, reserved to the job until the end of the reservation (ExitStack).
+    The status of the job tells the worker and whether the application has been built or reused.
+    """
+    with progress.stage('initialization'):
+        cydre_app, created = reservation.enter_context(cydre_registry.use_app(simulation_id, _worker['app_root'], _worker['stations'], parameters))
+    progress.set(worker=os.getpid(), app='built' if created else 'reused')
+    return cydre_app
+
+
+def discard_app(simulation_id):
+    """
+    Drops the live application of a deleted simulation
+    """
+    cydre_registry.discard(simulation_id)
+
+
+def spatial_similarity_job(progress, simulation_id, parameters):
+    """
+    Spatial similarity of a simulation
+
+    Returns
+    -------
+    results : dict
+        names of the watershed and of the station, clusters and similar watersheds (json strings)
+    """
+    hydraulic_path = _worker['paths'][4]
+
+    with ExitStack() as reservation:
+        cydre_app = _reserve_app(reservation, progress, simulation_id, parameters)
+
+        with progress.stage('spatial_similarity'):
+            cydre_app.run_spatial_similarity(hydraulic_path, _worker['stations'])
+
+        results = _watershed_names(cydre_app)
+        results['clusters'] = cydre_app.Similarity.clusters.to_json()
+        results['similar_watersheds'] = json.dumps(cydre_app.Similarity.similar_watersheds)
+    return results
+
+
+def timeseries_similarity_job(progress, simulation_id, parameters, similar_watersheds):
+    """
+    Timeseries similarity of a simulation
+
+    Returns
+    -------
+    results : dict
+        names of the watershed and of the station, references of the correlation matrices (artifact store)
+        and similarity period (json string)
+    """
+    data_path = _worker['paths'][0]
+
+    # Application réservée à la tâche jusqu'à la fin du calcul
+    with ExitStack() as reservation:
+        cydre_app = _reserve_app(reservation, progress, simulation_id, parameters)
+
+        with progress.stage('timeseries_similarity'):
+            cydre_app.run_timeseries_similarity(data_path, similar_watersheds)
+
+        results = _watershed_names(cydre_app)
+        # Matrices de corrélation stockées en fichiers binaires, références dans les résultats
+        artifacts = AS.get_store(_worker['app_root'])
+        for key, value in cydre_app.Similarity.correlation_matrix.items():
+            results[key] = artifacts.put_frame(value)
+        results['user_similarity_period'] = json.dumps(cydre_app.Similarity.user_similarity_period.strftime('%Y-%m-%d').tolist())
+    return results
+
+
+def select_scenarios_job(progress, simulation_id, parameters, corr_matrix):
+    """
+    Selection of the scenarios of a simulation from its correlation matrices
+
+    Parameters
+    ----------
+    corr_matrix : dict
+        variable (specific_discharge, recharge) -> reference of the correlation matrix (artifact store), or its json
+        for the former simulations
+
+    Returns
+    -------
+    results : dict
+        names of the watershed and of the station, grouped scenarios, selected scenarios and scenarios (json strings),
+        and the references of the matrices of the scenarios (artifact store)
+    """
+    artifacts = AS.get_store(_worker['app_root'])
+
+    with ExitStack() as reservation:
+        cydre_app = _reserve_app(reservation, progress, simulation_id, parameters)
+
+        with progress.stage('select_scenarios'):
+            # Lecture des matrices de corrélation (fichiers binaires référencés, ou JSON des anciennes simulations)
+            if corr_matrix.get('specific_discharge'):
+                specific_discharge_df = artifacts.read_frame(corr_matrix['specific_discharge'])
+            if corr_matrix.get('recharge'):
+                recharge_df = artifacts.read_frame(corr_matrix['recharge'])
+
+            # Vérifier et réinitialiser les index pour garantir l'unicité
+            if not specific_discharge_df.index.is_unique:
+                specific_discharge_df.reset_index(drop=True, inplace=True)
+            if not recharge_df.index.is_unique:
+                recharge_df.reset_index(drop=True, inplace=True)
+
+            # Appel de la méthode select_scenarios avec la DataFrame de corrélation
+            scenarios_grouped, selected_scenarios, scenarios = cydre_app.select_scenarios(corr_matrix={"specific_discharge": specific_discharge_df, "recharge": recharge_df})
+            print("scenarios",scenarios)
+
+        results = _watershed_names(cydre_app)
+        results.update({'scenarios_grouped': scenarios_grouped.to_json(),
+                        'selected_scenarios': {key: value.to_json(orient='split') for key, value in selected_scenarios.items()},
+                        'scenarios': scenarios.to_json(orient='split'),
+                        'artifacts': {'scenarios': artifacts.put_frame(scenarios),
+                                      'selected_scenarios': {key: artifacts.put_frame(value) for key, value in selected_scenarios.items()}}})
+    return results
+
+
+def forecast_job(progress, simulation_id, parameters, scenarios_grouped_json, watershed_name, user_similarity_period):
+    """
+    Streamflow forecast of a simulation from its selected scenarios
+
+    Returns
+    -------
+    results : dict
+        graph of the projections (json string), indicator of the 1/10 of the module and table of the scenarios
+    """
+    # Application réservée à la tâche jusqu'à la fin du calcul
+    with ExitStack() as reservation:
+        cydre_app = _reserve_app(reservation, progress, simulation_id, parameters)
+
+        with progress.stage('streamflow_forecast'):
+            _app_forecast(cydre_app, scenarios_grouped_json)
+
+        results = _watershed_names(cydre_app)
+        results.update(_forecast_outputs(progress, cydre_app, watershed_name, user_similarity_period))
+    return results
+
+
+def indicator_job(progress, simulation_id, parameters, scenarios_grouped_json, watershed_name, user_similarity_period, value):
+    """
+    Projections of an alert threshold (indicator of a simulation), from the forecast of the live application
+
+    Returns
+    -------
+    new_projections : dict
+        volumes, proportion of the series and days before and below the threshold (see Outputs.new_projections)
+    """
+    with ExitStack() as reservation:
+        cydre_app = _reserve_app(reservation, progress, simulation_id, parameters)
+
+        with progress.stage('streamflow_forecast'):
+            _app_forecast(cydre_app, scenarios_grouped_json)
+
+        with progress.stage('outputs'):
+            results = OUT.Outputs(cydre_app, watershed_name, _worker['stations'], cydre_app.date, user_similarity_period,
+                                  log=True, module=True, options='viz_plotly')
+            return results.new_projections(value)
+
+
+def _app_forecast(cydre_app, scenarios_grouped_json):
+    """
+    Streamflow forecast of the application for the grouped scenarios, computed only if the live application
+    has not already computed it for these scenarios (forecast_job, then the indicators)
+    """
+    # Scénarios de la dernière prévision de l'application (une nouvelle sélection ne recalcule pas la prévision)
+    if getattr(cydre_app, 'forecast_scenarios_grouped', None) == scenarios_grouped_json:
+        return
+
+    # Statistiques sur les débits passés pour générer des prévisions saisonnières
+    cydre_app.scenarios_grouped = scenarios_grouped_from_json(scenarios_grouped_json)
+    cydre_app.df_streamflow_forecast, cydre_app.df_storage_forecast = cydre_app.streamflow_forecast(_worker['paths'][0])
+    cydre_app.forecast_scenarios_grouped = scenarios_grouped_json
+
+
+def beta_simulation_job(parameters):
+    """
+    Whole simulation of a station (spatial and timeseries similarities, selection of the scenarios, forecast),
+    run in a worker process by the batch update of the SimulationsBeta table
+
+    Parameters
+    ----------
+    parameters : dict
+        parameters of the simulation (user_watershed_id, date...)
+
+    Returns
+    -------
+    simulation : dict
+        station identifier, durations of the stages (s), and the Parameters, Indicators and Results columns
+        of the row (same content as a simulation run through the API, with the effective simulation date and the
+        fingerprints of the series used),
+        or the error if the simulation failed
+    """
+    stations = _worker['stations']
+    (data_path, _, _, _, hydraulic_path, _) = _worker['paths']
+    timings = StageTimings()
+    simulation = {'station': parameters['user_watershed_id'], 'timings': timings.stages}
+
+    try:
+        with timings.stage('initialization'):
+            cydre_app = cydre_app_from_parameters(_worker['app_root'], stations, parameters)
+
+        with timings.stage('spatial_similarity'):
+            cydre_app.run_spatial_similarity(hydraulic_path, stations)
+            # Empreintes des séries utilisées (station et bassins similaires), lues avant le calcul
+            input_stations = [parameters['user_watershed_id']] + [station_id for station_id in cydre_app.Similarity.similar_watersheds
+                                                                  if station_id != parameters['user_watershed_id']]
+            piezometers = bss_ids(stations)
+            data_fingerprints = {station_id: SC.station_fingerprint(data_path, station_id, piezometers.get(station_id))
+                                 for station_id in input_stations}
+
+        with timings.stage('timeseries_similarity'):
+            cydre_app.run_timeseries_similarity(data_path, cydre_app.Similarity.similar_watersheds)
+
+        with timings.stage('select_scenarios'):
+            corr_matrix = {key: value.copy() for key, value in cydre_app.Similarity.correlation_matrix.items()}
+            scenarios_grouped, selected_scenarios, scenarios = cydre_app.select_scenarios(corr_matrix=corr_matrix)
+
+        with timings.stage('streamflow_forecast'):
+            cydre_app.df_streamflow_forecast, cydre_app.df_storage_forecast = cydre_app.streamflow_forecast(data_path)
+
+        names = _watershed_names(cydre_app)
+        forecast = _forecast_outputs(timings, cydre_app, names['watershed_name'], cydre_app.Similarity.user_similarity_period)
+    except Exception as e:
+        simulation.update(error=str(e), traceback=traceback.format_exc())
+        return simulation
+
+    # Résultats au format des simulations de l'API (matrices dans le magasin d'artefacts, références dans Results)
+    artifacts = AS.get_store(_worker['app_root'])
+    simulation['Parameters'] = dict(parameters, **names)
+    simulation['Indicators'] = [forecast['indicators_m10']]
+    simulation['Results'] = {
+        "similarity": {
+            "clusters": cydre_app.Similarity.clusters.to_json(),
+            "similar_watersheds": json.dumps(cydre_app.Similarity.similar_watersheds),
+            "corr_matrix": {key: artifacts.put_frame(value) for key, value in cydre_app.Similarity.correlation_matrix.items()},
+            "user_similarity_period": json.dumps(cydre_app.Similarity.user_similarity_period.strftime('%Y-%m-%d').tolist())
+            },
+        "scenarios_grouped": scenarios_grouped.to_json(),
+        "scenarios": artifacts.put_frame(scenarios),
+        "selected_scenarios": {key: artifacts.put_frame(value) for key, value in selected_scenarios.items()},
+        "data": forecast['graph'],
+        "corr_matrix": forecast['corr_matrix'],
+        "data_fingerprints": data_fingerprints,
+        "simulation_date": cydre_app.date.strftime('%Y-%m-%d')
+        }
+    return simulation
+
+
+def _forecast_outputs(progress, cydre_app, watershed_name, user_similarity_period):
+    """
+    Graph of the projections (json string), indicator of the 1/10 of the module and table of the scenarios (json string)
+    """
+    stations = _worker['stations']
+
+    with progress.stage('outputs'):
+        # Préparation des sorties
+        results = OUT.Outputs(cydre_app, watershed_name, stations, cydre_app.date, user_similarity_period,
+                              log=True, module=True, options='viz_plotly')
+        reference_df, projection_df, projection_series, merged_df = results.get_projections_data(module=True)
+        graph_results = results.projections_angular_format(reference_df, projection_series, merged_df)
+
+    # Transformer les données du Graph en JSON pour les stocker
+    graph_json = json.dumps({"graph":graph_results['graph'],"first_date":graph_results['first_date'],
+                             "last_date":graph_results['last_date'],
+                             'first_observation_date':graph_results['first_observation_date'],
+                             'last_observation_date':graph_results['last_observation_date'],
+                             'first_prediction_date':graph_results['first_prediction_date'],
+                             'last_prediction_date':graph_results['last_prediction_date']})
+
+    # Indicateur opérationnel du 1/10 du module
+    indicators_m10 = {"id" : "0",
+                      "type":"1/10 du module",
+                      "value":graph_results['m10'],
+                      "color" : "#Ff0000",
+                      "results":{
+                        'proj_ev': graph_results['proj_values_ev'],
+                        'proj_values': graph_results['proj_values'],
+                        'ndays_before_alert':graph_results['ndays_before_alert'],
+                        'ndays_below_alert': graph_results['ndays_below_alert'],
+                        'prop_alert_all_series': graph_results["prop_alert_all_series"],
+                        'volume50': graph_results['volume50'],
+                        'volume10': graph_results['volume10'],
+                        'volume90': graph_results['volume90'],
+                        }
+                    }
+
+    # Tableau des scénarios (année, nom de la station, coefficient)
+    df = pd.DataFrame(cydre_app.scenarios_grouped).reset_index()
+    df.columns = ['Year', 'ID', 'Coeff']
+    df['Coeff'] = df['Coeff'].round(2)
+    df['ID'] = df['ID'].map(stations.set_index('ID')['name'].to_dict())
+    df['ID'] = df['ID'].replace({np.nan: 'Unknown Station'})
+    df = df.astype({'Year': 'int', 'Coeff': 'float'})
+    corr_matrix_json = json.dumps(df.to_dict(orient='records'))
+
+    return {'graph': graph_json, 'indicators_m10': indicators_m10, 'corr_matrix': corr_matrix_json}
+
+
+def _watershed_names(cydre_app):
+    stations = _worker['stations']
+    return {'watershed_name': stations[stations['ID'] == cydre_app.UserConfiguration.user_watershed_id].name.values[0],
+            'station_name': cydre_app.UserConfiguration.user_watershed_name}
+
+
+def _run_job(jobs, job_id, job, args):
+    progress = JobProgress(jobs, job_id)
+    progress.set(state='running', started=time.time())
+    return job(progress, *args)
+
+
+#%% JOB QUEUE
+
+class JobProgress():
+    """
+    Progress of a job, shared between the worker process and the server process
+
+    The status of the job is a dictionary of the manager: it is replaced (not modified) at each update
+    so that the modification is seen by the other processes.
+    """
+
+    def __init__(self, jobs, job_id):
+        self.jobs = jobs
+        self.job_id = job_id
+
+
+    def set(self, **values):
+        status = self.jobs[self.job_id]
+        status.update(values)
+        self.jobs[self.job_id] = status
+
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Stage of the job: state (running, done, failed) and duration (s)
+        """
+        self.__update_stage(name, state='running')
+        start = time.time()
+        try:
+            yield
+        except Exception:
+            self.__update_stage(name, state='failed', duration=round(time.time() - start, 3))
+            raise
+        self.__update_stage(name, state='done', duration=round(time.time() - start, 3))
+
+
+    def __update_stage(self, name, **values):
+        status = self.jobs[self.job_id]
+        for stage in status['stages']:
+            if stage['name'] == name:
+                stage.update(values)
+                break
+        else:
+            status['stages'].append(dict(name=name, **values))
+        self.jobs[self.job_id] = status
+
+
+class StageTimings():
+    """
+    Durations (s) of the stages of a job run outside the job queue (same stage interface as JobProgress)
+    """
+
+    def __init__(self):
+        self.stages = OrderedDict()
+
+
+    @contextmanager
+    def stage(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.stages[name] = round(time.time() - start, 3)
+
+
+class JobQueue():
+    """
+    Pool of worker processes running the simulation jobs
+
+    Each worker is a process of its own (single-process executor), and the jobs of a simulation (same key) are
+    always run by the same worker: the live application built by a step of the simulation is found by the next
+    ones. The live applications are shared out between the workers (registry_size // max_workers each).
+
+    Attributes
+    ----------
+    app_root : string
+        root folder of the application, given to the workers
+    stations : GeoDataFrame
+        hydrological stations, given to the workers
+    max_workers : int
+        number of worker processes
+    registry_size : int
+        maximum number of live applications of all the workers
+
+    Methods
+    -------
+    submit(job, args, stages, on_done=None, key=None, **info)
+        enqueue a job and return its identifier
+    run(job, args, stages, key=None, **info)
+        run a job and wait for its results
+    status(job_id)
+        status of the job (state, progress and duration of the stages, error), None if unknown
+    discard(key)
+        drop the live application of the simulation
+    """
+
+    def __init__(self, app_root, stations, max_workers=JOB_WORKERS, registry_size=CYDRE_REGISTRY_SIZE):
+
+        self.app_root = app_root
+        self.stations = stations
+        self.max_workers = max_workers
+        self.registry_size = registry_size
+        self._executors = None
+        self._manager = None
+        self._jobs = None
+        self._lock = threading.Lock()
+
+
+    def __start(self):
+        # The manager is created at the first job, the workers at their first job (spawn: no copy of the server threads and connections)
+        if self._executors is None:
+            self._context = multiprocessing.get_context('spawn')
+            self._manager = self._context.Manager()
+            self._jobs = self._manager.dict()
+            self._executors = [None] * self.max_workers
+
+
+    def worker_of(self, key):
+        """
+        Index of the worker running the jobs of the key (stable between the calls and the restarts of the server)
+        """
+        return zlib.crc32(str(key).encode('utf-8')) % self.max_workers
+
+
+    def __executor(self, index, broken=False):
+        # Worker replaced if its process has died (its live applications are lost)
+        if self._executors[index] is None or broken:
+            self._executors[index] = ProcessPoolExecutor(max_workers=1, mp_context=self._context, initializer=_init_worker,
+                                                         initargs=(self.app_root, self.stations,
+                                                                   max(1, self.registry_size // self.max_workers)))
+        return self._executors[index]
+
+
+    def __submit_to(self, key, function, *args):
+        index = self.worker_of(key)
+        try:
+            return self.__executor(index).submit(function, *args)
+        except BrokenProcessPool:
+            return self.__executor(index, broken=True).submit(function, *args)
+
+
+    def submit(self, job, args, stages, on_done=None, key=None, **info):
+        """
+        Enqueue a job
+
+        Parameters
+        ----------
+        job : function
+            job run by a worker, called with the progress of the job and args
+        args : tuple
+            arguments of the job (picklable)
+        stages : list of strings
+            stages of the job, in order. The last stage 'storage' is run by on_done in the server process.
+        on_done : function, optional
+            called in the server process with the results of the job, to store them
+        key : string, optional
+            the jobs of a same key (SimulationID) are run by the same worker, any worker if None
+        info :
+            additional information kept in the status of the job (ex: SimulationID)
+
+        Returns
+        -------
+        job_id : string
+            identifier of the job
+        """
+        return self.__submit(job, args, stages, on_done, key, info)[0]
+
+
+    def run(self, job, args, stages, key=None, **info):
+        """
+        Run a job in its worker and wait for its results (steps answered by the request), see submit
+
+        Returns
+        -------
+        results :
+            results of the job, whose exception is raised again if it has failed
+        """
+        return self.__submit(job, args, stages, None, key, info)[1].result()
+
+
+    def __submit(self, job, args, stages, on_done, key, info):
+        job_id = str(uuid.uuid4())
+        with self._lock:
+            self.__start()
+            self.__forget_finished_jobs()
+            self._jobs[job_id] = dict(info, job_id=job_id, job=job.__name__, state='queued', submitted=time.time(),
+                                      stages=[{'name': name, 'state': 'pending'} for name in stages], error=None)
+            future = self.__submit_to(job_id if key is None else key, _run_job, self._jobs, job_id, job, args)
+        future.add_done_callback(lambda future: self.__finish(job_id, future, on_done))
+        return job_id, future
+
+
+    def __finish(self, job_id, future, on_done):
+        progress = JobProgress(self._jobs, job_id)
+        try:
+            results = future.result()
+            if on_done is not None:
+                with progress.stage('storage'):
+                    on_done(results)
+            progress.set(state='done', finished=time.time())
+        except Exception as e:
+            progress.set(state='failed', finished=time.time(), error=str(e), traceback=traceback.format_exc())
+
+
+    def status(self, job_id):
+        if self._jobs is None:
+            return None
+        status = self._jobs.get(job_id)
+        if status is None:
+            return None
+
+        # Progress: proportion of the stages done
+        status['progress'] = round(sum(stage['state'] == 'done' for stage in status['stages']) / max(len(status['stages']), 1), 2)
+        if status.get('started'):
+            status['duration'] = round(status.get('finished', time.time()) - status['started'], 3)
+        return status
+
+
+    def discard(self, key):
+        """
+        Drops the live application of the key (deleted simulation) in its worker, if the worker is running
+        """
+        with self._lock:
+            if self._executors is not None and self._executors[self.worker_of(key)] is not None:
+                self.__submit_to(key, discard_app, key)
+
+
+    def __forget_finished_jobs(self):
+        now = time.time()
+        for job_id, status in list(self._jobs.items()):
+            if status.get('finished') and now - status['finished'] > JOB_RETENTION:
+                del self._jobs[job_id]
+
+
+    def shutdown(self):
+        if self._executors is not None:
+            for executor in self._executors:
+                if executor is not None:
+                    executor.shutdown(wait=True)
+            self._manager.shutdown()
+            self._executors = None
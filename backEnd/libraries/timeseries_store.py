@@ -0,0 +1,543 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 12 09:12:41 2026
+
+Compiled store of the regional time series.
+
+The csv files of the data folder (one file per station and per variable) are compiled
+once into dense arrays (one array per variable and per column, stations x days) sharing
+a common daily date axis. The arrays are written as raw binary files and opened with
+np.memmap, so that a simulation only reads the pages of the stations it uses instead of
+parsing the csv files again.
+
+2 main functions:
+    - build_timeseries_store: compiles the csv tree of data_path into data_path/store.
+    - read_timeseries: reads the time series of a station, from the store when it is up to date
+      with the csv file, from the csv file otherwise (the csv files remain the reference).
+      Parsed series are kept in a bounded process-wide cache invalidated when the csv file changes.
+"""
+
+import os
+import json
+import uuid
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+
+# Folder (relative to data_path) where the store is written
+STORE_FOLDER = 'store'
+MANIFEST_FILE = 'manifest.json'
+
+# Metadata files of the data folders, which are not time series
+METADATA_FILES = ('stations.csv',)
+
+# Variable folders (relative to data_path) compiled in the store
+STORE_VARIABLES = ['hydrometry/discharge',
+                   'hydrometry/specific_discharge',
+                   'climatic/surfex/recharge',
+                   'climatic/surfex/runoff',
+                   'climatic/surfex/precipitation',
+                   'climatic/surfex/etp',
+                   'climatic/surfex/temperature',
+                   'piezometry']
+
+# Maximum number of parsed time series kept in memory by the process-wide cache
+# (about 0.4 MB per daily series of 60 years)
+CACHE_SIZE = 128
+
+# Stores already opened in the process (one per data_path)
+_opened_stores = {}
+
+
+def timeseries_path(data_path, variable_folder, station_id):
+    """
+    Path of the csv file of a station for a variable folder ('climatic/surfex/recharge', 'piezometry'...)
+    """
+    return os.path.join(data_path, *variable_folder.split('/'), "{}.csv".format(station_id))
+
+
+def file_stamp(file_path):
+    """
+    Modification time (ns) and size of a file, used to detect the files modified since the store compilation
+    """
+    stat = os.stat(file_path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def data_stamps(data_path, variable_folders=STORE_VARIABLES):
+    """
+    Stamps of all the csv time series files of the variable folders, as checked by read_timeseries against the store
+    (one directory listing per folder, a stat per file)
+
+    Returns
+    -------
+    stamps : dictionary
+        (variable folder, station ID) -> stamp of the csv file (modification time, size)
+    """
+    stamps = {}
+    for variable_folder in variable_folders:
+        folder = os.path.join(data_path, *variable_folder.split('/'))
+        if not os.path.isdir(folder):
+            continue
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.name.endswith('.csv') and entry.name not in METADATA_FILES:
+                    stat = entry.stat()
+                    stamps[(variable_folder, entry.name[:-4])] = [stat.st_mtime_ns, stat.st_size]
+    return stamps
+
+
+def read_csv_timeseries(file_path):
+    """
+    Reads a time series csv file (t as index, dates in pandas time format)
+    """
+    with open(file_path) as file:
+        data = pd.read_csv(file, index_col="t") # t as index
+        data.index = pd.to_datetime(data.index) # from date in string to date in pandas time format
+    return data
+
+
+def read_timeseries(data_path, variable_folder, station_id):
+    """
+    Reads the time series of a station.
+    The parsed series are kept in a process-wide cache and reused as long as the csv file is not modified
+    (same modification time and size). Otherwise uses the compiled store if it exists and if the csv file
+    has not been modified since its compilation, the csv file otherwise.
+
+    Parameters
+    ----------
+    data_path : string
+        where data are stored
+    variable_folder : string
+        folder of the variable relative to data_path ('hydrometry/specific_discharge', 'climatic/surfex/recharge'...)
+    station_id : string
+        identifier of the station (watershed ID or BSS ID)
+
+    Returns
+    -------
+    data : pandas dataframe
+        time series indexed by date ('t'), same as the one read from the csv file.
+        It is a copy: it can be modified by the caller without altering the cache.
+
+    """
+    file_path = timeseries_path(data_path, variable_folder, station_id)
+    try:
+        stamp = file_stamp(file_path)
+    except OSError:
+        # Missing file: the csv reader raises the usual error
+        return read_csv_timeseries(file_path)
+
+    key = (data_path, variable_folder, station_id)
+    data = timeseries_cache.get(key, stamp)
+    if data is None:
+        store = get_store(data_path)
+        if store is not None and store.is_current(variable_folder, station_id, stamp):
+            data = store.get_frame(variable_folder, station_id)
+        else:
+            data = read_csv_timeseries(file_path)
+        timeseries_cache.put(key, stamp, data)
+
+    return data.copy()
+
+
+def get_store(data_path):
+    """
+    Gets the store compiled in data_path (None if it has not been built).
+    The store is opened once per process and reopened when it has been rebuilt.
+    """
+    manifest_path = os.path.join(data_path, STORE_FOLDER, MANIFEST_FILE)
+    try:
+        stamp = file_stamp(manifest_path)
+    except OSError:
+        _opened_stores.pop(data_path, None)
+        return None
+
+    store = _opened_stores.get(data_path)
+    if store is None or store.stamp != stamp:
+        store = TimeseriesStore(os.path.join(data_path, STORE_FOLDER))
+        _opened_stores[data_path] = store
+    return store
+
+
+def build_timeseries_store(data_path, variable_folders=STORE_VARIABLES):
+    """
+    Compiles the csv files of data_path into the store (data_path/store).
+
+    Files that cannot be compiled (no 't' column, not daily dates, not numeric columns or columns different
+    from the other stations) are skipped and will still be read from their csv file.
+
+    Parameters
+    ----------
+    data_path : string
+        where data are stored
+    variable_folders : list of strings
+        variable folders (relative to data_path) to compile
+
+    Returns
+    -------
+    manifest : dictionary
+        description of the compiled store (date axis, stations, columns, file stamps)
+
+    """
+    store_path = os.path.join(data_path, STORE_FOLDER)
+    os.makedirs(store_path, exist_ok=True)
+
+    # 1- LOAD ALL CSV FILES
+    series = {}
+    for variable_folder in variable_folders:
+        folder = os.path.join(data_path, *variable_folder.split('/'))
+        if not os.path.isdir(folder):
+            print(f"No folder {folder}, variable skipped")
+            continue
+
+        series[variable_folder] = {}
+        columns = None
+        for file_name in sorted(os.listdir(folder)):
+            if not file_name.endswith('.csv') or file_name in METADATA_FILES:
+                continue
+            station_id = file_name[:-4]
+            file_path = os.path.join(folder, file_name)
+            try:
+                stamp = file_stamp(file_path)
+                data = read_csv_timeseries(file_path)
+                # Only daily series with unique dates can be stored on the date axis
+                if not data.index.is_unique or (data.index != data.index.normalize()).any():
+                    raise ValueError("duplicated or not daily dates")
+                if len(data.select_dtypes(include='number').columns) != len(data.columns):
+                    raise ValueError("not numeric columns")
+                if columns is None:
+                    columns = list(data.columns)
+                if list(data.columns) != columns:
+                    raise ValueError(f"columns {list(data.columns)} instead of {columns}")
+                series[variable_folder][station_id] = (data, stamp)
+            except Exception as e:
+                print(f"Error compiling {file_path}: {e}")
+
+        if not series[variable_folder]:
+            del series[variable_folder]
+
+    # 2- SHARED DATE AXIS
+    first_dates = [data.index.min() for folder in series.values() for data, _ in folder.values() if len(data)]
+    last_dates = [data.index.max() for folder in series.values() for data, _ in folder.values() if len(data)]
+    if not first_dates:
+        raise ValueError(f"No time series to compile in {data_path}")
+    start = min(first_dates).normalize()
+    ndays = (max(last_dates).normalize() - start).days + 1
+
+    # Array files named after the version of the build: the files of the previous manifest are not modified,
+    # a reader that opened it keeps reading consistent arrays until it opens the new manifest
+    version = uuid.uuid4().hex[:12]
+    manifest = {'version': version,
+                'start': start.strftime('%Y-%m-%d'),
+                'ndays': ndays,
+                'variables': {}}
+
+    # 3- DENSE ARRAYS (one per variable and column) AND PRESENCE MASK
+    for variable_folder, stations in series.items():
+        station_ids = list(stations.keys())
+        columns = list(next(iter(stations.values()))[0].columns)
+        shape = (len(station_ids), ndays)
+        prefix = _file_prefix(variable_folder)
+
+        arrays = {column: np.full(shape, np.nan, dtype='float64') for column in columns}
+        mask = np.zeros(shape, dtype='uint8')
+        extents = {}
+        files = {}
+
+        for i, station_id in enumerate(station_ids):
+            data, stamp = stations[station_id]
+            positions = (data.index.normalize() - start).days.values
+            for column in columns:
+                arrays[column][i, positions] = data[column].values
+            mask[i, positions] = 1
+            extents[station_id] = [int(positions.min()), int(positions.max()) + 1] if len(positions) else [0, 0]
+            files[station_id] = stamp
+
+        for column, array in arrays.items():
+            _write_array(os.path.join(store_path, _array_file_name(prefix, column, version)), array)
+        _write_array(os.path.join(store_path, _array_file_name(prefix, 'mask', version)), mask)
+
+        manifest['variables'][variable_folder] = {'prefix': prefix,
+                                                  'stations': station_ids,
+                                                  'columns': columns,
+                                                  'extents': extents,
+                                                  'files': files}
+
+    # The manifest is written last, the store switches to the new version by its replacement alone
+    manifest_path = os.path.join(store_path, MANIFEST_FILE)
+    previous_version = None
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as file:
+            previous_version = json.load(file).get('version')
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as file:
+        json.dump(manifest, file)
+    os.replace(tmp_path, manifest_path)
+
+    # Arrays of the older builds: the previous version is kept for the readers still using its manifest
+    for file_name in os.listdir(store_path):
+        if file_name.endswith('.dat') and _array_file_version(file_name) not in (version, previous_version):
+            os.remove(os.path.join(store_path, file_name))
+
+    return manifest
+
+
+class TimeseriesCache():
+    """
+    Bounded LRU cache of parsed time series, shared by the whole process
+
+    Entries are keyed by (data_path, variable folder, station ID) and store the stamp (modification time, size)
+    of the csv file when it was parsed: an entry is dropped as soon as the file has been modified.
+
+    Attributes
+    ----------
+    maxsize : int
+        maximum number of time series kept in memory
+    hits, misses : int
+        number of reads served by the cache, number of reads that had to parse the data
+    """
+
+    def __init__(self, maxsize=CACHE_SIZE):
+
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def get(self, key, stamp):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != stamp:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+
+    def put(self, key, stamp, data):
+        with self._lock:
+            self._entries[key] = (stamp, data)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+# Process-wide cache used by read_timeseries
+timeseries_cache = TimeseriesCache()
+
+
+def _file_prefix(variable_folder):
+    return variable_folder.replace('/', '_')
+
+
+def _array_file_name(prefix, name, version):
+    # Stores built before the versioning have no version in their file names
+    return f"{prefix}_{name}.{version}.dat" if version else f"{prefix}_{name}.dat"
+
+
+def _array_file_version(file_name):
+    # The prefixes and the column names have no dot
+    parts = file_name[:-len('.dat')].split('.')
+    return parts[1] if len(parts) == 2 else None
+
+
+def _write_array(file_path, array):
+    # Written next to the destination and then moved: a file with the final name is always complete
+    tmp_path = file_path + '.tmp'
+    array.tofile(tmp_path)
+    os.replace(tmp_path, file_path)
+
+
+def _cumsum(values):
+    # Cumulative sum starting with 0, so that sums[last] - sums[first] is the sum over [first, last[
+    sums = np.zeros(len(values) + 1, dtype=values.dtype)
+    np.cumsum(values, out=sums[1:])
+    return sums
+
+
+class TimeseriesStore():
+    """
+    Read access to the compiled store
+
+    Attributes
+    ----------
+    store_path : string
+        folder of the compiled store
+    manifest : dictionary
+        description of the store (date axis, stations, columns, file stamps)
+    stamp : list
+        stamp of the manifest file when the store has been opened
+    dates : DatetimeIndex
+        daily date axis shared by all the variables and stations
+
+    Methods
+    -------
+    is_current(self, variable_folder, station_id, stamp):
+        True if the station is in the store and its csv file stamp is the one recorded at the compilation
+    station_index(self, variable_folder, station_id):
+        Row of the station in the arrays of the variable
+    values(self, variable_folder, column='Q'):
+        Dense array (stations x days) of a variable column, memory-mapped
+    get_frame(self, variable_folder, station_id):
+        Time series of the station as read from its csv file
+    prefix_sums(self, variable_folder, station_id, column='Q'):
+        Cumulative sums of the values of the station along the date axis (sums over any range of days in O(1))
+    gather(self, variable_folder, rows, offsets, length, column='Q'):
+        Windows of length days starting at offsets of the stations at rows, in one fancy indexing
+    """
+
+    def __init__(self, store_path):
+
+        self.store_path = store_path
+        manifest_path = os.path.join(store_path, MANIFEST_FILE)
+        self.stamp = file_stamp(manifest_path)
+        with open(manifest_path) as file:
+            self.manifest = json.load(file)
+
+        self.ndays = self.manifest['ndays']
+        self.dates = pd.date_range(start=self.manifest['start'], periods=self.ndays, freq='D')
+        self.variables = self.manifest['variables']
+        self._rows = {variable_folder: {station_id: i for i, station_id in enumerate(description['stations'])}
+                      for variable_folder, description in self.variables.items()}
+        self._arrays = {}
+        self._prefix_sums = {}
+
+
+    def has(self, variable_folder, station_id):
+        return station_id in self._rows.get(variable_folder, {})
+
+
+    def is_current(self, variable_folder, station_id, stamp):
+        if not self.has(variable_folder, station_id):
+            return False
+        return list(stamp) == self.variables[variable_folder]['files'][station_id]
+
+
+    def station_index(self, variable_folder, station_id):
+        return self._rows[variable_folder][station_id]
+
+
+    def stations(self, variable_folder):
+        return self.variables[variable_folder]['stations']
+
+
+    def values(self, variable_folder, column='Q'):
+        """
+        Dense array (stations x days) of a variable column, NaN where there is no data
+        """
+        return self.__memmap(variable_folder, column, 'float64')
+
+
+    def mask(self, variable_folder):
+        """
+        Dense array (stations x days), 1 where the date is in the csv file of the station
+        """
+        return self.__memmap(variable_folder, 'mask', 'uint8')
+
+
+    def get_frame(self, variable_folder, station_id):
+        """
+        Time series of the station, identical to the one read from its csv file
+        """
+        row = self.station_index(variable_folder, station_id)
+        first, last = self.variables[variable_folder]['extents'][station_id]
+        present = self.mask(variable_folder)[row, first:last].astype(bool)
+
+        # No frequency on the index, as for the series read from the csv files
+        index = pd.DatetimeIndex(self.dates[first:last][present], name='t', freq=None)
+        data = {column: np.asarray(self.values(variable_folder, column)[row, first:last][present])
+                for column in self.variables[variable_folder]['columns']}
+
+        return pd.DataFrame(data, index=index)
+
+
+    def prefix_sums(self, variable_folder, station_id, column='Q'):
+        """
+        Cumulative sums of the values of the station along the date axis, computed once per station while the store is opened.
+        The sum of any range of days [first, last[ is sums[last] - sums[first].
+
+        The values are centered on the station mean (NaN where there is no data are counted as 0) to limit the
+        loss of precision of the sums of squares.
+
+        Returns
+        -------
+        prefix : dictionary
+            'mean' : mean of the values of the station
+            'values' : centered values (ndays)
+            'sum', 'sum2' : cumulative sums of the centered values and of their squares (ndays + 1)
+            'count' : cumulative number of dates in the csv file of the station (ndays + 1)
+            'finite' : cumulative number of values that are not NaN (ndays + 1)
+        """
+        key = (variable_folder, station_id, column)
+        if key not in self._prefix_sums:
+            row = self.station_index(variable_folder, station_id)
+            values = np.asarray(self.values(variable_folder, column)[row], dtype='float64')
+            present = self.mask(variable_folder)[row].astype(bool)
+            finite = np.isfinite(values)
+
+            mean = values[finite].mean() if finite.any() else 0.
+            centered = np.where(finite, values - mean, 0.)
+
+            self._prefix_sums[key] = {'mean': mean,
+                                      'values': centered,
+                                      'sum': _cumsum(centered),
+                                      'sum2': _cumsum(centered**2),
+                                      'count': _cumsum(present.astype('int32')),
+                                      'finite': _cumsum(finite.astype('int32'))}
+        return self._prefix_sums[key]
+
+
+    def gather(self, variable_folder, rows, offsets, length, column='Q'):
+        """
+        Windows of the same length (days) of several stations, in one fancy indexing of the dense arrays
+
+        Parameters
+        ----------
+        variable_folder : string
+            variable folder
+        rows : array of int
+            rows of the stations (station_index), one per window
+        offsets : array of int
+            position on the date axis of the first day of each window (may be outside of the date axis)
+        length : int
+            number of days of the windows
+        column : string
+            column of the variable
+
+        Returns
+        -------
+        values : 2-D array (windows x length)
+            values of the windows, NaN where there is no data
+        present : 2-D array of bool (windows x length)
+            True where the date is in the csv file of the station
+        """
+        rows = np.asarray(rows, dtype=np.int64)[:, None]
+        positions = np.asarray(offsets, dtype=np.int64)[:, None] + np.arange(length)
+        inside = (positions >= 0) & (positions < self.ndays)
+        positions = np.clip(positions, 0, self.ndays - 1)
+
+        values = np.where(inside, self.values(variable_folder, column)[rows, positions], np.nan)
+        present = inside & self.mask(variable_folder)[rows, positions].astype(bool)
+        return values, present
+
+
+    def __memmap(self, variable_folder, name, dtype):
+        key = (variable_folder, name)
+        if key not in self._arrays:
+            description = self.variables[variable_folder]
+            file_path = os.path.join(self.store_path, _array_file_name(description['prefix'], name, self.manifest.get('version')))
+            self._arrays[key] = np.memmap(file_path, dtype=dtype, mode='r',
+                                          shape=(len(description['stations']), self.ndays))
+        return self._arrays[key]
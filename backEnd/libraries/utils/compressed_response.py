@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Thu Oct 22 10:05:41 2026
+
+Responses of the API computed once and served as compressed bytes.
+
+Used for the layers of the map (stations, piezometers, watersheds): they only change with the data files,
+which are loaded at the start of the server. The json is serialized at the first request, compressed (gzip,
+and brotli if the module is installed) and identified by an ETag, so that the next requests are answered
+with the stored bytes, or with a 304 when the client already has them.
+"""
+
+import gzip
+import hashlib
+import threading
+import flask
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class CompressedResponse():
+    """
+    Json response built once and stored as compressed bytes
+
+    Attributes
+    ----------
+    build : function
+        returns the object to serialize in json (called once, at the first request)
+    mimetype : string
+        type of the response
+
+    Methods
+    -------
+    response(request)
+        flask response: 304 if the ETag of the client is the current one, else the stored bytes in the best
+        encoding accepted by the client (br, gzip or identity)
+    """
+
+    def __init__(self, build, mimetype='application/json'):
+
+        self.build = build
+        self.mimetype = mimetype
+        self._bodies = None
+        self._etag = None
+        self._lock = threading.Lock()
+
+
+    def __load(self):
+        with self._lock:
+            if self._bodies is None:
+                # Same serialization as the jsonify responses of the application
+                body = flask.jsonify(self.build()).get_data()
+                bodies = {'identity': body, 'gzip': gzip.compress(body, compresslevel=9, mtime=0)}
+                if brotli is not None:
+                    bodies['br'] = brotli.compress(body)
+                self._etag = hashlib.sha256(body).hexdigest()[:32]
+                self._bodies = bodies
+
+
+    def response(self, request):
+        if self._bodies is None:
+            self.__load()
+
+        if request.if_none_match.contains(self._etag):
+            response = flask.Response(status=304)
+        else:
+            encoding = 'identity'
+            for accepted in ('br', 'gzip'):
+                if accepted in self._bodies and request.accept_encodings[accepted]:
+                    encoding = accepted
+                    break
+            response = flask.Response(self._bodies[encoding], mimetype=self.mimetype)
+            if encoding != 'identity':
+                response.headers['Content-Encoding'] = encoding
+
+        response.set_etag(self._etag)
+        response.headers['Vary'] = 'Accept-Encoding'
+        # The client keeps the layer and checks at each use that it has not changed
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Fri Oct 23 09:18:26 2026
+
+Responses of the API for the time series of a station (discharge, climatic variables, water table depth).
+
+Optional parameters of the request:
+    - start, end : dates (YYYY-MM-DD) limiting the period returned
+    - points : maximal number of points, the series is downsampled by min/max bucketing (the minimum and the
+               maximum of each bucket are kept, so that the low flows and the peaks are preserved)
+    - format : records (default, list of {t, value} as the full response),
+               columns (one list per column),
+               base64 (columns as little-endian typed arrays encoded in base64: t as int32 days since 1970-01-01,
+                       values as float64, to read with Int32Array / Float64Array)
+"""
+
+import base64
+import numpy as np
+import pandas as pd
+from flask import jsonify
+
+
+TIMESERIES_OPTIONS = ('start', 'end', 'points', 'format')
+TIMESERIES_FORMATS = ('records', 'columns', 'base64')
+
+
+def has_timeseries_options(args):
+    """
+    True if the request asks for a range, a downsampling or a format (else the full response is returned as before)
+    """
+    return any(option in args for option in TIMESERIES_OPTIONS)
+
+
+def downsample_minmax(values, points):
+    """
+    Positions of the points kept by min/max bucketing
+
+    Parameters
+    ----------
+    values : 2D array
+        values of the series (rows: dates, columns: variables), NaN ignored
+    points : int
+        maximal number of points per variable
+
+    Returns
+    -------
+    positions : array of int
+        sorted positions of the first and last rows and of the rows holding the minimum or the maximum 
+        of a variable in each bucket
+    """
+    n = len(values)
+    n_buckets = max((points - 2) // 2, 1)
+    if n <= points or n_buckets >= n:
+        return np.arange(n)
+
+    # Buckets of the same number of dates (the last one completed with NaN)
+    size = int(np.ceil(n / n_buckets))
+    padded = np.full((size * int(np.ceil(n / size)), values.shape[1]), np.nan)
+    padded[:n] = values
+    buckets = padded.reshape(-1, size, values.shape[1])
+    offsets = np.arange(buckets.shape[0])[:, None] * size
+
+    nan = np.isnan(buckets)
+    filled = ~nan.all(axis=1)
+    minima = np.where(nan, np.inf, buckets).argmin(axis=1) + offsets
+    maxima = np.where(nan, -np.inf, buckets).argmax(axis=1) + offsets
+    return np.unique(np.concatenate([[0, n - 1], minima[filled], maxima[filled]]))
+
+
+def timeseries_response(csv_file_path, header, columns, args, numeric_records=False):
+    """
+    Response of a time series csv file according to the options of the request
+
+    Parameters
+    ----------
+    csv_file_path : string
+        csv file with a date column 't'
+    header : list
+        first elements of the response in the records format (station name, identifier)
+    columns : list of strings
+        columns returned, the first one being the date 't'
+    args : werkzeug MultiDict
+        parameters of the request (start, end, points, format)
+    numeric_records : bool
+        values of the records format as numbers (as strings of the csv file otherwise, like the full response)
+    """
+    output_format = args.get('format', 'records')
+    if output_format not in TIMESERIES_FORMATS:
+        return jsonify({"error": f"format should be one of {', '.join(TIMESERIES_FORMATS)}"}), 400
+    try:
+        start = pd.Timestamp(args['start']) if args.get('start') else None
+        end = pd.Timestamp(args['end']) if args.get('end') else None
+        points = args.get('points', type=int)
+        if points is not None and points < 2:
+            raise ValueError('points')
+    except ValueError:
+        return jsonify({"error": "start and end should be dates (YYYY-MM-DD), points an integer above 1"}), 400
+
+    # Values as written in the csv file, and as numbers
+    df = pd.read_csv(csv_file_path, usecols=columns, dtype=str, keep_default_na=False, encoding='utf-8')[columns]
+    dates = pd.to_datetime(df['t'], errors='coerce')
+    values = df[columns[1:]].apply(pd.to_numeric, errors='coerce')
+
+    # Period
+    keep = np.ones(len(df), dtype=bool)
+    if start is not None:
+        keep &= (dates >= start).values
+    if end is not None:
+        keep &= (dates <= end).values
+    positions = np.flatnonzero(keep)
+
+    # Downsampling
+    if points is not None:
+        positions = positions[downsample_minmax(values.values[positions].astype(float), points)]
+
+    if output_format == 'records':
+        records = df.iloc[positions]
+        if numeric_records:
+            records = pd.concat([records['t'], values.iloc[positions]], axis=1)
+        return jsonify(header + records.to_dict(orient='records')), 200
+
+    dates, values = dates.iloc[positions], values.iloc[positions]
+    if output_format == 'columns':
+        response = {'header': header, 't': df['t'].iloc[positions].tolist()}
+        response.update({column: values[column].tolist() for column in columns[1:]})
+    else:
+        days = ((dates - pd.Timestamp('1970-01-01')).dt.days).fillna(np.iinfo(np.int32).min).astype('<i4').values
+        response = {'header': header, 'length': len(positions),
+                    'dtypes': dict({'t': 'int32'}, **{column: 'float64' for column in columns[1:]}),
+                    't': base64.b64encode(days.tobytes()).decode('ascii')}
+        response.update({column: base64.b64encode(values[column].values.astype('<f8').tobytes()).decode('ascii')
+                         for column in columns[1:]})
+    return jsonify(response), 200
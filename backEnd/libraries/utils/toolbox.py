@@ -7,6 +7,7 @@ Toolbox used for repetitive functions.
 import os
 import pickle
 import pyproj
+import threading
 import csv
 from flask import jsonify
 import json
@@ -36,10 +37,14 @@ def lambert93_to_wgs84(x, y):
     Returns:
     - tuple: Coordonnées transformées en WGS84 (x_wgs84, y_wgs84).
     """
-    lambert93_to_wgs84 = pyproj.Transformer.from_crs("EPSG:2154", "EPSG:4326", always_xy=True)
-    x_wgs84, y_wgs84 = lambert93_to_wgs84.transform(x, y)
+    # Transformer créé une seule fois par thread (création coûteuse, objet non partageable entre threads)
+    if not hasattr(_transformers, 'lambert93_to_wgs84'):
+        _transformers.lambert93_to_wgs84 = pyproj.Transformer.from_crs("EPSG:2154", "EPSG:4326", always_xy=True)
+    x_wgs84, y_wgs84 = _transformers.lambert93_to_wgs84.transform(x, y)
     return x_wgs84, y_wgs84
 
+_transformers = threading.local()
+
 
 def get_station_name_by_id(gdf_stations, id_upper):
     return gdf_stations[gdf_stations['ID'] == id_upper]['station_name'].values[0]
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Fixtures of the tests of the backEnd (run from the backEnd folder: python -m pytest tests)
+
+The tests use the data of the repository (data folder): a reference watershed and a few of its similar watersheds.
+"""
+
+import os
+import sys
+import shutil
+import pytest
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if APP_ROOT not in sys.path:
+    sys.path.insert(0, APP_ROOT)
+
+from libraries import parameters_cache as PC
+from libraries import timeseries_store as TS
+from libraries.load_data import define_paths, load_data
+
+# Reference watershed and number of similar watersheds used by the tests
+WATERSHED_ID = 'J0014010'
+N_SIMILAR = 5
+
+
+def storable(data_path, station_id):
+    """
+    Discharge series of the station compiled by the time series store (daily series with unique dates)
+    """
+    file_path = TS.timeseries_path(data_path, 'hydrometry/specific_discharge', station_id)
+    if not os.path.exists(file_path):
+        return False
+    data = TS.read_csv_timeseries(file_path)
+    return data.index.is_unique and (data.index == data.index.normalize()).all()
+
+
+@pytest.fixture(scope='session')
+def app_root(tmp_path_factory):
+    # Fichier fusionné des paramètres écrit dans un dossier temporaire (et non dans launchers)
+    PC.get_parameters_template(os.path.join(APP_ROOT, 'launchers', 'run_cydre_params.xml'),
+                               str(tmp_path_factory.mktemp('parameters')))
+    return APP_ROOT
+
+
+@pytest.fixture(scope='session')
+def stations(app_root):
+    gdf_stations, _, _ = load_data(app_root)
+    return gdf_stations
+
+
+@pytest.fixture(scope='session')
+def similar_watersheds(app_root, stations):
+    import libraries.forecast.initialization as INI
+
+    init = INI.Initialization(app_root, stations)
+    init.params = init.load_xml_parameters()
+    init.params.find_and_replace_param(['Cydre', 'UserConfig', 'user_watershed_id'], WATERSHED_ID)
+    cydre_app = init.create_cydre_app()
+    cydre_app.run_spatial_similarity(define_paths(app_root)[4], stations)
+    return [station_id for station_id in cydre_app.Similarity.similar_watersheds
+            if station_id != WATERSHED_ID and storable(define_paths(app_root)[0], station_id)][:N_SIMILAR]
+
+
+@pytest.fixture(scope='session')
+def data_path(app_root, similar_watersheds, tmp_path_factory):
+    """
+    Data folder of the reference and similar watersheds, with its compiled time series store
+    """
+    source = define_paths(app_root)[0]
+    data_path = str(tmp_path_factory.mktemp('data'))
+    for variable_folder in TS.STORE_VARIABLES:
+        if variable_folder == 'piezometry':
+            continue
+        os.makedirs(os.path.join(data_path, *variable_folder.split('/')))
+        for station_id in [WATERSHED_ID] + similar_watersheds:
+            file_path = TS.timeseries_path(source, variable_folder, station_id)
+            if os.path.exists(file_path):
+                shutil.copy2(file_path, TS.timeseries_path(data_path, variable_folder, station_id))
+    TS.build_timeseries_store(data_path, [variable_folder for variable_folder in TS.STORE_VARIABLES if variable_folder != 'piezometry'])
+    return data_path
+
+
+@pytest.fixture(scope='session')
+def api(app_root, tmp_path_factory):
+    """
+    Module api2 of the server, on a SQLite database of the tests (created empty)
+    """
+    os.environ['CYDRE_DATABASE_URI'] = 'sqlite:///' + str(tmp_path_factory.mktemp('database') / 'cydre.db')
+    # Chemins de l'application relatifs au dossier backEnd (app_root de api2)
+    cwd = os.getcwd()
+    os.chdir(app_root)
+    try:
+        import api2
+    finally:
+        os.chdir(cwd)
+    with api2.app.app_context():
+        api2.db.create_all()
+    yield api2
+    api2.job_queue.shutdown()
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Artifact store of the matrices of the results: grace period of the deletions, collection of the files
+referenced by no simulation, release of the references of the deleted simulations
+"""
+
+import os
+import time
+import numpy as np
+import pandas as pd
+import pytest
+
+from libraries import artifact_store as AS
+
+
+@pytest.fixture
+def store(tmp_path):
+    return AS.ArtifactStore(str(tmp_path / 'artifacts'))
+
+
+def frame(seed):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(rng.random((4, 3)), index=[1990, 1991, 1992, 1993], columns=['J0014010', 'J0626610', 'J3213020'])
+
+
+def age(store, reference, seconds):
+    # Fichier écrit ou réutilisé il y a seconds secondes
+    file_path = os.path.join(store.path, reference[len(AS.ARTIFACT_PREFIX):][:2], reference[len(AS.ARTIFACT_PREFIX):] + '.npz')
+    date = time.time() - seconds
+    os.utime(file_path, (date, date))
+
+
+def test_put_and_get(store):
+    reference = store.put_frame(frame(0))
+    assert AS.is_reference(reference) and store.put_frame(frame(0)) == reference
+    pd.testing.assert_frame_equal(store.get_frame(reference), frame(0))
+    assert AS.references({'similarity': {'corr_matrix': {'recharge': reference}}, 'data': 'graph'}) == {reference}
+
+
+def test_delete_grace_period(store):
+    reference = store.put_frame(frame(0))
+    assert not store.delete(reference)
+
+    age(store, reference, 2 * AS.ARTIFACT_GRACE_PERIOD)
+    # Matrice recalculée: sa date est rafraîchie, elle est conservée
+    store.put_frame(frame(0))
+    assert not store.delete(reference)
+
+    age(store, reference, 2 * AS.ARTIFACT_GRACE_PERIOD)
+    assert store.delete(reference)
+    assert not store.delete(reference)
+    with pytest.raises(OSError):
+        store.get_frame(reference)
+
+
+def test_collect_garbage(store):
+    kept, recent, removed = [store.put_frame(frame(seed)) for seed in range(3)]
+    age(store, kept, 2 * AS.ARTIFACT_GRACE_PERIOD)
+    age(store, removed, 2 * AS.ARTIFACT_GRACE_PERIOD)
+
+    assert store.collect_garbage({kept}) == [removed]
+    pd.testing.assert_frame_equal(store.get_frame(kept), frame(0))
+    pd.testing.assert_frame_equal(store.get_frame(recent), frame(1))
+    assert store.collect_garbage({kept}, grace_period=0) == [recent]
+
+
+def test_release_artifacts(api, store, monkeypatch):
+    monkeypatch.setattr(api, 'artifacts', store)
+    shared, own, beta = [store.put_frame(frame(seed)) for seed in range(3)]
+    for reference in (shared, own, beta):
+        age(store, reference, 2 * AS.ARTIFACT_GRACE_PERIOD)
+
+    def results(corr_matrix, scenarios):
+        return {'similarity': {'corr_matrix': corr_matrix}, 'scenarios': scenarios, 'selected_scenarios': {},
+                'data': '{"graph": []}'}
+
+    with api.app.app_context():
+        api.db.session.add_all([
+            api.Simulation(SimulationID='deleted', UserID=1, Parameters={}, Results=results({'recharge': shared}, own)),
+            api.Simulation(SimulationID='kept', UserID=1, Parameters={}, Results=results({'recharge': shared}, '{"columns": []}')),
+            api.SimulationsBeta(SimulationID='beta', Parameters={}, Results=results({'recharge': beta}, None))])
+        api.db.session.commit()
+        assert {shared, own, beta} <= api.referenced_artifacts()
+
+        simulation = api.db.session.get(api.Simulation, 'deleted')
+        references = AS.references(simulation.Results)
+        api.db.session.delete(simulation)
+        api.db.session.commit()
+
+        # Seule la matrice qui n'est plus référencée par aucune simulation est supprimée
+        assert api.release_artifacts(references | {beta}) == [own]
+        assert api.referenced_artifacts() >= {shared, beta}
+        for table in (api.Simulation, api.SimulationsBeta):
+            table.query.delete()
+        api.db.session.commit()
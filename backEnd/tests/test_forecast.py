@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Precipitation events of all the scenarios at once (precipitation_events_statistics) against the loop over the days
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from libraries.forecast.forecast import Forecast
+
+
+def wet_scenarios_loop(precipitation, precipitation_threshold=2, minimal_period=3, total_volume_threshold=40):
+    # Ancienne détection des scénarios humides (separate_wet_and_dry_events), jour par jour
+    idx_wet_years = []
+    for idx, serie in enumerate(precipitation):
+        consecutive_days = 0
+        total_precipitation = 0
+        event_detected = False
+        for day, value in serie.items():
+            if value >= precipitation_threshold:
+                consecutive_days += 1
+                total_precipitation += value
+            else:
+                if consecutive_days >= minimal_period and total_precipitation >= total_volume_threshold:
+                    event_detected = True
+                    break
+                consecutive_days = 0
+                total_precipitation = 0
+        if consecutive_days >= minimal_period and total_precipitation >= total_volume_threshold:
+            event_detected = True
+        if event_detected:
+            idx_wet_years.append(idx)
+    return idx_wet_years
+
+
+def runs_loop(serie, precipitation_threshold):
+    # Durée et cumul de chaque séquence de jours pluvieux
+    runs = []
+    length, volume = 0, 0.
+    for value in list(serie) + [-np.inf]:
+        if value >= precipitation_threshold:
+            length += 1
+            volume += value
+        elif length:
+            runs.append((length, volume))
+            length, volume = 0, 0.
+    return runs
+
+
+@pytest.mark.parametrize('precipitation_threshold, minimal_period, total_volume_threshold', [(2, 3, 40), (1, 2, 15), (5, 4, 60)])
+def test_precipitation_events_statistics(precipitation_threshold, minimal_period, total_volume_threshold):
+    rng = np.random.default_rng(0)
+    dates = pd.date_range('2020-06-01', periods=90, freq='D')
+    # Pluies exponentielles par épisodes, avec des valeurs égales aux seuils et des séquences en début et fin de période
+    precipitation = []
+    for _ in range(60):
+        values = rng.exponential(6, size=len(dates)) * (rng.random(len(dates)) < 0.45)
+        values[rng.random(len(dates)) < 0.05] = precipitation_threshold
+        precipitation.append(pd.Series(values, index=dates))
+    precipitation[0][:] = 20.
+    precipitation[1][:] = 0.
+    precipitation[2][-minimal_period:] = total_volume_threshold
+
+    events = Forecast.precipitation_events_statistics(precipitation, precipitation_threshold, minimal_period, total_volume_threshold)
+
+    assert list(np.flatnonzero(events['wet'].values)) == wet_scenarios_loop(precipitation, precipitation_threshold,
+                                                                             minimal_period, total_volume_threshold)
+    for scenario, serie in enumerate(precipitation):
+        runs = runs_loop(serie, precipitation_threshold)
+        assert events['events'][scenario] == sum(length >= minimal_period and volume >= total_volume_threshold for length, volume in runs)
+        assert events['longest_run'][scenario] == max([length for length, _ in runs], default=0)
+        assert events['max_volume'][scenario] == pytest.approx(max([volume for _, volume in runs], default=0.))
+
+
+def test_precipitation_events_statistics_empty():
+    events = Forecast.precipitation_events_statistics([])
+    assert len(events) == 0
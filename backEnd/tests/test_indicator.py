@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+DTW of all the candidate windows with lower-bound pruning (dtw_n_best) against the calculation of all the windows,
+Pearson and Spearman of all the windows at once against scipy
+"""
+
+import numpy as np
+import scipy.stats
+import pytest
+
+from libraries.forecast.indicator import Indicator
+
+
+class CalculationParams():
+    """Calculation group of a variable (getparam(name).getvalue())"""
+
+    def __init__(self, **values):
+        self.values = dict({'metric': 'dtw', 'dtw_window': 0, 'dtw_n_best': 0, 'weighted': False}, **values)
+
+    def getparam(self, name):
+        value = self.values[name]
+        return type('Param', (), {'getvalue': staticmethod(lambda: value)})
+
+
+def random_walks(rng, n, length):
+    return np.cumsum(rng.normal(size=(n, length)), axis=1)
+
+
+@pytest.mark.parametrize('dtw_window', [0, 10])
+@pytest.mark.parametrize('n_best', [1, 5, 20])
+def test_dtw_pruned_top_k(dtw_window, n_best):
+    rng = np.random.default_rng(n_best + dtw_window)
+    x = random_walks(rng, 1, 60)[0]
+    Y = random_walks(rng, 80, 60)
+    # Fenêtres plus courtes (années bissextiles) et valeurs manquantes
+    lengths = np.full(len(Y), 60)
+    lengths[::7] = 59
+    Y[3, 10] = np.nan
+
+    exact = Indicator(CalculationParams(dtw_window=dtw_window)).dtw_windows(x, Y, lengths)
+    pruned = Indicator(CalculationParams(dtw_window=dtw_window, dtw_n_best=n_best)).dtw_windows(x, Y, lengths)
+
+    assert np.isnan(exact[3]) and np.isnan(pruned[3])
+    # Les n meilleures similarités, seules calculées, et avec la même valeur
+    best = np.argsort(-np.nan_to_num(exact, nan=-np.inf), kind='stable')[:n_best]
+    assert set(np.flatnonzero(~np.isnan(pruned))) == set(best)
+    np.testing.assert_allclose(pruned[best], exact[best], rtol=1e-12)
+
+
+def test_dtw_windows_match_dtw():
+    rng = np.random.default_rng(0)
+    x = random_walks(rng, 1, 40)[0]
+    Y = random_walks(rng, 10, 40)
+    indicator = Indicator(CalculationParams(dtw_window=5))
+
+    expected = [indicator.dtw(x, y, window=5) for y in Y]
+    np.testing.assert_allclose(indicator.dtw_windows(x, Y), expected, rtol=1e-12)
+
+
+def correlation_windows(rng):
+    x = random_walks(rng, 1, 50)[0]
+    # Ex aequo (valeurs arrondies), série constante et valeur manquante
+    Y = np.round(random_walks(rng, 30, 50))
+    Y[4] = 1.0
+    Y[7, 20] = np.nan
+    return x, Y
+
+
+@pytest.mark.filterwarnings('ignore:An input array is constant')
+def test_spearman_windows_match_scipy():
+    x, Y = correlation_windows(np.random.default_rng(1))
+    indicator = Indicator(CalculationParams(metric='spearman'))
+
+    expected = [scipy.stats.spearmanr(x, y)[0] for y in Y]
+    np.testing.assert_allclose(indicator.spearman_windows(x, Y), expected, rtol=1e-12, equal_nan=True)
+
+
+@pytest.mark.filterwarnings('ignore:An input array is constant')
+@pytest.mark.parametrize('has_axis', [True, False])
+def test_pearson_windows_match_scipy(monkeypatch, has_axis):
+    x, Y = correlation_windows(np.random.default_rng(2))
+    indicator = Indicator(CalculationParams(metric='pearson'))
+    pearsonr = scipy.stats.pearsonr
+
+    expected = [pearsonr(x, y)[0] for y in Y]
+    if not has_axis:
+        # scipy < 1.13: pearsonr sans argument axis
+        monkeypatch.setattr(scipy.stats, 'pearsonr', lambda x, y: pearsonr(x, y))
+    np.testing.assert_allclose(indicator.pearson_windows(x, Y), expected, rtol=1e-12, equal_nan=True)
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Compiled snapshot of the parameters (ParametersGroup.compile) against the values read in the XML structure
+"""
+
+import os
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+import pytest
+
+import tools.Parameters.Parameters.ParametersGroup as pg
+from libraries import parameters_cache as PC
+
+
+@pytest.fixture
+def template(app_root):
+    return PC.get_parameters_template(os.path.join(app_root, 'launchers', 'run_cydre_params.xml'), '')
+
+
+def xml_parameters(paramgroup):
+    """Parameters of the XML structure: path under the root ('group::param') -> Parameter"""
+    parameters = {}
+    for param in paramgroup.root.iterdescendants('Parameter'):
+        path = [param.get('name')]
+        parent = param.getparent()
+        while parent is not None and parent is not paramgroup.root:
+            path.insert(0, parent.get('name'))
+            parent = parent.getparent()
+        parameters['::'.join(path)] = pg.Parameter(path, param)
+    return parameters
+
+
+def assert_same_values(paramgroup):
+    compiled = paramgroup.compile()
+    for name, param in xml_parameters(paramgroup).items():
+        assert compiled.getparam(name).getvalue() == param.getvalue(), name
+
+
+@pytest.mark.parametrize('file_name', ['run_cydre_params.xml', 'run_cydre_params_merge.xml'])
+def test_parameter_files(app_root, tmp_path, file_name):
+    # Fichiers lus sans le cache des paramètres: chaque paramètre définit tous ses éléments
+    file_path = os.path.join(app_root, 'launchers', file_name)
+    paramgroup = pg.ParametersGroup.merge_diff(file_path, file_path, pg.EXPLOPT.REPLACE, str(tmp_path))[0]
+    assert_same_values(paramgroup)
+    assert PC.parse_xml_to_ordered_dict(ET.parse(file_path).getroot(), False)['UserConfig']['user_watershed_id']
+
+
+def test_compiled_values(template):
+    parameters = xml_parameters(template)
+    assert 'UserConfig::user_watershed_id' in parameters
+    assert_same_values(template)
+    # Définition complète de chaque paramètre (description et type)
+    for name, param in parameters.items():
+        assert param.description and param.type, name
+
+
+def test_find_and_replace_invalidates(template):
+    compiled = template.compile()
+    template.find_and_replace_param(['Cydre', 'UserConfig', 'user_watershed_id'], 'J0626610')
+    assert template.compile() is not compiled
+    assert template.compile().getparam('UserConfig::user_watershed_id').getvalue() == 'J0626610'
+    assert_same_values(template)
+
+
+def test_clone_is_independent(template):
+    value = template.compile().getparam('UserConfig::user_watershed_id').getvalue()
+    clone = template.clone()
+    clone.compile()
+    clone.find_and_replace_param(['Cydre', 'UserConfig', 'user_watershed_id'], 'J0626610')
+
+    assert template.compile().getparam('UserConfig::user_watershed_id').getvalue() == value
+    assert clone.compile().getparam('UserConfig::user_watershed_id').getvalue() == 'J0626610'
+    assert_same_values(template)
+    assert_same_values(clone)
+
+
+def test_apply_overrides(template):
+    overridden, replaced = template.clone(), template.clone()
+    overridden.compile()
+    not_found = overridden.apply_overrides({'user_watershed_id': 'J0626610', 'UserConfig': {'user_horizon': 30},
+                                            'specific_discharge.Calculation.metric': 'nse', 'unknown_parameter': 1})
+    replaced.find_and_replace_param(['Cydre', 'UserConfig', 'user_watershed_id'], 'J0626610')
+    replaced.find_and_replace_param(['Cydre', 'UserConfig', 'user_horizon'], 30)
+    replaced.find_and_replace_param(['Cydre', 'Similarity', 'specific_discharge', 'Calculation', 'metric'], 'nse')
+
+    # Instantané mis à jour sans recompilation, identique à celui des remplacements un par un
+    assert not_found == ['unknown_parameter']
+    assert_same_values(overridden)
+    for name in xml_parameters(template):
+        assert overridden.compile().getparam(name).getvalue() == replaced.compile().getparam(name).getvalue(), name
+
+
+def merge(file_path, folder_res):
+    """Merges the file 20 times, returns the number of merged files read back incomplete or with a repeated header"""
+    merged_path = os.path.join(folder_res, 'run_cydre_params_merge.xml')
+    errors = 0
+    for _ in range(20):
+        pg.ParametersGroup.merge_diff(file_path, file_path, pg.EXPLOPT.REPLACE, folder_res)
+        with open(merged_path) as file:
+            content = file.read()
+        try:
+            errors += ET.fromstring(content.encode()).get('name') != 'Cydre'
+        except ET.ParseError:
+            errors += 1
+    return errors
+
+
+def test_concurrent_merges(app_root, tmp_path):
+    # Fichier fusionné écrit en même temps par les processus de calcul (update_beta_simulations.py)
+    file_path = os.path.join(app_root, 'launchers', 'run_cydre_params.xml')
+    with ProcessPoolExecutor(4) as executor:
+        assert sum(executor.map(merge, [file_path] * 4, [str(tmp_path)] * 4)) == 0
+    assert sorted(os.listdir(str(tmp_path))) == ['run_cydre_params_merge.txt', 'run_cydre_params_merge.xml']
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Cache of the parameter file (parameters_cache): one parsing per version of the file, independent copies
+"""
+
+import os
+import json
+import shutil
+import xml.etree.ElementTree as ET
+import pytest
+
+from libraries import parameters_cache as PC
+
+
+@pytest.fixture
+def params_file(app_root, tmp_path):
+    file_path = str(tmp_path / 'run_cydre_params.xml')
+    shutil.copy2(os.path.join(app_root, 'launchers', 'run_cydre_params.xml'), file_path)
+    yield file_path
+    PC.invalidate(file_path)
+
+
+def set_value(file_path, name, value):
+    # Écriture du fichier comme la route /api/parameters (update_xml), sans invalider le cache
+    tree = ET.parse(file_path)
+    tree.getroot().find(f".//*[@name='{name}']/value").text = value
+    tree.write(file_path)
+    # Date de modification distincte même si l'écriture suit la lecture
+    stat = os.stat(file_path)
+    os.utime(file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+def watershed_id(template):
+    return template.getgroup('UserConfig').getparam('user_watershed_id').getvalue()
+
+
+def test_template_copies(params_file, tmp_path):
+    first = PC.get_parameters_template(params_file, str(tmp_path))
+    second = PC.get_parameters_template(params_file, str(tmp_path))
+    assert first is not second and first.root is not second.root
+
+    value = watershed_id(second)
+    first.find_and_replace_param(['Cydre', 'UserConfig', 'user_watershed_id'], 'J0626610')
+    assert watershed_id(first) == 'J0626610'
+    assert watershed_id(second) == value
+    assert watershed_id(PC.get_parameters_template(params_file, str(tmp_path))) == value
+
+
+def test_file_change(params_file, tmp_path):
+    PC.get_parameters_template(params_file, str(tmp_path))
+    PC.get_parameters_json(params_file, False)
+
+    set_value(params_file, 'user_watershed_id', 'J0626610')
+    assert watershed_id(PC.get_parameters_template(params_file, str(tmp_path))) == 'J0626610'
+    assert json.loads(PC.get_parameters_json(params_file, False))['UserConfig']['user_watershed_id']['value'] == 'J0626610'
+
+
+def test_parameters_json(params_file):
+    root = ET.parse(params_file).getroot()
+    current = json.loads(PC.get_parameters_json(params_file, False))
+    default = json.loads(PC.get_parameters_json(params_file, True))
+
+    param = root.find(".//*[@name='UserConfig']/*[@name='user_watershed_id']")
+    assert current['UserConfig']['user_watershed_id']['value'] == param.findtext('value')
+    assert default['UserConfig']['user_watershed_id']['value'] == param.findtext('default_value')
+    assert PC.get_parameters_json(params_file, False) is PC.get_parameters_json(params_file, False)
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+The similarity engines ('loop', 'windows', 'prefix') give the same correlation matrices
+"""
+
+import pandas as pd
+import pytest
+
+import libraries.forecast.initialization as INI
+from libraries import simulation_cache as SC
+from libraries import timeseries_store as TS
+from conftest import WATERSHED_ID
+
+VARIABLES = ['specific_discharge', 'recharge', 'runoff', 'water_table_depth']
+
+
+def correlation_matrices(app_root, stations, data_path, similar_watersheds, calculation, engine):
+    init = INI.Initialization(app_root, stations)
+    init.params = init.load_xml_parameters()
+    init.params.find_and_replace_param(['Cydre', 'UserConfig', 'user_watershed_id'], WATERSHED_ID)
+    for variable in VARIABLES:
+        for name, value in calculation.items():
+            init.params.find_and_replace_param(['Cydre', 'Similarity', variable, 'Calculation', name], value)
+    cydre_app = init.create_cydre_app()
+
+    # Calcul effectif (pas de résultat d'un autre moteur dans le cache du processus)
+    SC.simulation_cache.clear()
+    cydre_app.run_timeseries_similarity(data_path, similar_watersheds, engine=engine)
+    return {variable: matrix.copy() for variable, matrix in cydre_app.Similarity.correlation_matrix.items()}
+
+
+@pytest.mark.parametrize('calculation, engines', [
+    ({'metric': 'pearson'}, ['windows', 'prefix']),
+    ({'metric': 'pearson', 'weighted': 'True'}, ['windows', 'prefix']),
+    ({'metric': 'spearman'}, ['windows']),
+    ({'metric': 'spearman', 'weighted': 'True'}, ['windows']),
+    ({'metric': 'nse'}, ['windows']),
+    ({'metric': 'dtw'}, ['windows']),
+    ({'metric': 'dtw', 'dtw_window': '10'}, ['windows']),
+])
+def test_engines_agree(app_root, stations, data_path, similar_watersheds, calculation, engines):
+    # Séries compilées: le moteur 'prefix' n'est pas remplacé par 'windows'
+    store = TS.get_store(data_path)
+    assert store is not None and all(store.has('hydrometry/specific_discharge', station_id) for station_id in similar_watersheds)
+
+    reference = correlation_matrices(app_root, stations, data_path, similar_watersheds, calculation, 'loop')
+    assert reference and all(not matrix.empty for matrix in reference.values())
+
+    for engine in engines:
+        matrices = correlation_matrices(app_root, stations, data_path, similar_watersheds, calculation, engine)
+        assert matrices.keys() == reference.keys()
+        for variable, matrix in matrices.items():
+            pd.testing.assert_frame_equal(matrix, reference[variable], check_exact=False, rtol=1e-9, atol=1e-12)
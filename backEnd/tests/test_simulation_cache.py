@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Keys of the simulation cache (simulation_cache): version of the data and keys of the stages, fingerprints of the
+content of the series
+"""
+
+import os
+import shutil
+import pytest
+
+from libraries import parameters_cache as PC
+from libraries import simulation_cache as SC
+from libraries import timeseries_store as TS
+from libraries.load_data import define_paths
+from conftest import WATERSHED_ID
+
+VARIABLE = 'hydrometry/specific_discharge'
+
+
+@pytest.fixture
+def small_data_path(app_root, similar_watersheds, tmp_path):
+    """
+    Data folder of the specific discharge of the reference watershed and of a similar watershed, with its store
+    """
+    source = define_paths(app_root)[0]
+    os.makedirs(os.path.join(str(tmp_path), *VARIABLE.split('/')))
+    for station_id in [WATERSHED_ID, similar_watersheds[0]]:
+        shutil.copy2(TS.timeseries_path(source, VARIABLE, station_id), TS.timeseries_path(str(tmp_path), VARIABLE, station_id))
+    TS.build_timeseries_store(str(tmp_path), [VARIABLE])
+    return str(tmp_path)
+
+
+def rewrite_in_place(file_path, factor):
+    # Nouvelles valeurs écrites dans le même fichier: ni le magasin ni la date du dossier ne changent
+    folder_stat = os.stat(os.path.dirname(file_path))
+    data = TS.read_csv_timeseries(file_path)
+    data['Q'] = data['Q'] * factor
+    with open(file_path, 'r+') as file:
+        file.write(data.to_csv(date_format='%Y-%m-%d'))
+        file.truncate()
+    os.utime(os.path.dirname(file_path), ns=(folder_stat.st_atime_ns, folder_stat.st_mtime_ns))
+
+
+def test_data_version_follows_csv(small_data_path):
+    file_path = TS.timeseries_path(small_data_path, VARIABLE, WATERSHED_ID)
+    version = SC.data_version(small_data_path, [VARIABLE])
+    assert SC.data_version(small_data_path, [VARIABLE]) == version
+    assert TS.read_timeseries(small_data_path, VARIABLE, WATERSHED_ID).equals(TS.read_csv_timeseries(file_path))
+
+    rewrite_in_place(file_path, 2)
+    # La série lue vient du fichier csv (plus récent que le magasin), la version des données a changé
+    assert TS.read_timeseries(small_data_path, VARIABLE, WATERSHED_ID).equals(TS.read_csv_timeseries(file_path))
+    assert SC.data_version(small_data_path, [VARIABLE]) != version
+
+
+def test_stage_key(app_root, small_data_path):
+    params = PC.get_parameters_template(os.path.join(app_root, 'launchers', 'run_cydre_params.xml'), '')
+    keys = {stage: SC.stage_key(params, small_data_path, stage) for stage in SC.STAGE_PARAMETERS}
+    assert keys == {stage: SC.stage_key(params, small_data_path, stage) for stage in SC.STAGE_PARAMETERS}
+
+    # Paramètre d'une seule étape: les clés des autres étapes ne changent pas
+    params.find_and_replace_param(['Cydre', 'UserConfig', 'user_horizon'], 30)
+    assert SC.stage_key(params, small_data_path, 'streamflow_forecast') != keys['streamflow_forecast']
+    assert SC.stage_key(params, small_data_path, 'timeseries_similarity') == keys['timeseries_similarity']
+    assert SC.stage_key(params, small_data_path, 'select_scenarios') == keys['select_scenarios']
+
+    # Série modifiée: toutes les clés changent
+    params.find_and_replace_param(['Cydre', 'UserConfig', 'user_horizon'], 90)
+    keys = {stage: SC.stage_key(params, small_data_path, stage) for stage in SC.STAGE_PARAMETERS}
+    rewrite_in_place(TS.timeseries_path(small_data_path, VARIABLE, WATERSHED_ID), 2)
+    for stage in SC.STAGE_PARAMETERS:
+        assert SC.stage_key(params, small_data_path, stage) != keys[stage], stage
+
+
+def test_series_fingerprint(small_data_path):
+    file_path = TS.timeseries_path(small_data_path, VARIABLE, WATERSHED_ID)
+    data = TS.read_csv_timeseries(file_path)
+    fingerprint = SC.series_fingerprint(file_path)
+    station = SC.station_fingerprint(small_data_path, WATERSHED_ID, variable_folders=[VARIABLE])
+    assert fingerprint[:2] == [data.index[-1].strftime('%Y-%m-%d'), len(data)]
+
+    # Mise à jour sans nouvelle donnée: fichier réécrit à l'identique, même empreinte
+    with open(file_path, 'rb') as file:
+        content = file.read()
+    with open(file_path, 'wb') as file:
+        file.write(content)
+    assert SC.series_fingerprint(file_path) == fingerprint
+    assert SC.station_fingerprint(small_data_path, WATERSHED_ID, variable_folders=[VARIABLE]) == station
+
+    rewrite_in_place(file_path, 2)
+    assert SC.series_fingerprint(file_path)[:2] == fingerprint[:2] and SC.series_fingerprint(file_path) != fingerprint
+    assert SC.station_fingerprint(small_data_path, WATERSHED_ID, variable_folders=[VARIABLE]) != station
+    assert SC.series_fingerprint(TS.timeseries_path(small_data_path, VARIABLE, 'unknown')) is None
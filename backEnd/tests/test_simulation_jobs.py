@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+Job queue of the API simulations (simulation_jobs): status, progress and duration of the stages of the jobs,
+results stored at the end of the job, failures; the steps of a simulation are run by the worker which keeps
+its live Cydre application
+"""
+
+import json
+import time
+import uuid
+import pytest
+
+import libraries.simulation_jobs as JOBS
+from conftest import WATERSHED_ID
+
+PARAMETERS = {'user_watershed_id': WATERSHED_ID, 'date': '2022-05-01'}
+
+
+@pytest.fixture(scope='module')
+def job_queue(app_root, stations):
+    # 2 processus, une application vivante par processus
+    job_queue = JOBS.JobQueue(app_root, stations, max_workers=2, registry_size=2)
+    yield job_queue
+    job_queue.shutdown()
+
+
+def staged_job(progress, value):
+    # Tâche en deux étapes, dont la seconde échoue sans valeur
+    with progress.stage('first'):
+        time.sleep(0.1)
+    with progress.stage('second'):
+        # Avancement vu pendant la tâche
+        status = progress.jobs[progress.job_id]
+        if value is None:
+            raise ValueError('no value')
+    return {'value': value, 'status': status}
+
+
+def wait(job_queue, job_id, timeout=300):
+    start = time.time()
+    while time.time() - start < timeout:
+        status = job_queue.status(job_id)
+        if status['state'] in ('done', 'failed'):
+            return status
+        time.sleep(0.1)
+    raise TimeoutError(job_id)
+
+
+def spatial_similarity(job_queue, simulation_id, results=None):
+    # Résultats de la tâche récupérés par on_done, comme le stockage de l'API
+    job_id = job_queue.submit(JOBS.spatial_similarity_job, (simulation_id, PARAMETERS),
+                              stages=['initialization', 'spatial_similarity', 'storage'],
+                              on_done=None if results is None else results.update, key=simulation_id, SimulationID=simulation_id)
+    status = wait(job_queue, job_id)
+    assert status['state'] == 'done', status['error']
+    return status
+
+
+def simulation_ids(job_queue, worker, n):
+    """Identifiers of n simulations run by the worker"""
+    simulation_ids = []
+    while len(simulation_ids) < n:
+        simulation_id = str(uuid.uuid4())
+        if job_queue.worker_of(simulation_id) == worker:
+            simulation_ids.append(simulation_id)
+    return simulation_ids
+
+
+def test_job_status(job_queue):
+    results = {}
+    job_id = job_queue.submit(staged_job, (1,), stages=['first', 'second', 'storage'], on_done=results.update,
+                              SimulationID='simulation')
+    assert job_queue.status(job_id)['state'] in ('queued', 'running')
+    status = wait(job_queue, job_id)
+
+    # Étapes terminées dans l'ordre, avec leur durée, résultats stockés par on_done dans le processus serveur
+    assert status['state'] == 'done' and status['error'] is None and status['progress'] == 1
+    assert status['SimulationID'] == 'simulation' and status['job'] == 'staged_job'
+    assert [stage['name'] for stage in status['stages']] == ['first', 'second', 'storage']
+    assert all(stage['state'] == 'done' for stage in status['stages'])
+    assert status['stages'][0]['duration'] >= 0.1 and status['duration'] >= 0.1
+    assert results['value'] == 1
+    # Avancement vu pendant la tâche: première étape terminée, seconde en cours
+    assert [stage['state'] for stage in results['status']['stages']] == ['done', 'running', 'pending']
+    assert job_queue.status('unknown') is None
+
+
+def test_job_failure(job_queue):
+    results = {}
+    job_id = job_queue.submit(staged_job, (None,), stages=['first', 'second', 'storage'], on_done=results.update)
+    status = wait(job_queue, job_id)
+
+    assert status['state'] == 'failed' and status['error'] == 'no value' and 'ValueError' in status['traceback']
+    assert [stage['state'] for stage in status['stages']] == ['done', 'failed', 'pending']
+    assert status['progress'] == 0.33 and not results
+    with pytest.raises(ValueError):
+        job_queue.run(staged_job, (None,), stages=['first', 'second'])
+    assert job_queue.run(staged_job, (2,), stages=['first', 'second'])['value'] == 2
+
+
+def test_steps_reuse_app(job_queue):
+    simulation_id = str(uuid.uuid4())
+    results = {}
+    spatial = spatial_similarity(job_queue, simulation_id, results)
+    similar_watersheds = json.loads(results['similar_watersheds'])
+
+    job_id = job_queue.submit(JOBS.timeseries_similarity_job, (simulation_id, PARAMETERS, similar_watersheds),
+                              stages=['initialization', 'timeseries_similarity'], key=simulation_id)
+    timeseries = wait(job_queue, job_id)
+    assert timeseries['state'] == 'done', timeseries['error']
+
+    # Application construite par la première étape, retrouvée par la suivante dans le même processus
+    assert spatial['app'] == 'built' and timeseries['app'] == 'reused'
+    assert spatial['worker'] == timeseries['worker']
+
+
+def test_registry_size_shared_by_workers(job_queue):
+    first, second = simulation_ids(job_queue, 0, 2)
+    assert spatial_similarity(job_queue, first)['app'] == 'built'
+    assert spatial_similarity(job_queue, first)['app'] == 'reused'
+    # Une seule application par processus: la seconde simulation remplace la première
+    assert spatial_similarity(job_queue, second)['app'] == 'built'
+    assert spatial_similarity(job_queue, first)['app'] == 'built'
+
+
+def test_discard(job_queue):
+    simulation_id = str(uuid.uuid4())
+    assert spatial_similarity(job_queue, simulation_id)['app'] == 'built'
+    job_queue.discard(simulation_id)
+    assert spatial_similarity(job_queue, simulation_id)['app'] == 'built'
+
+
+def test_api_job(api):
+    client = api.app.test_client()
+    simulation_id = client.post('/api/create_simulation', json={'UserID': 1, 'Parameters': PARAMETERS}).json['SimulationID']
+    assert client.post(f'/api/run_spatial_similarity/{simulation_id}').status_code == 200
+
+    # Tâche mise en file par la requête, avancement lu par /api/jobs, résultats écrits dans la simulation
+    response = client.post(f'/api/run_timeseries_similarity/{simulation_id}')
+    assert response.status_code == 202
+    job_id = response.json['JobID']
+    status = wait(api.job_queue, job_id)
+    assert status['state'] == 'done', status['error']
+    response = client.get(f'/api/jobs/{job_id}')
+    assert response.status_code == 200 and response.json['progress'] == 1 and 'traceback' not in response.json
+    assert response.json['SimulationID'] == simulation_id
+    assert client.get('/api/jobs/unknown').status_code == 404
+
+    with api.app.app_context():
+        results = api.db.session.get(api.Simulation, simulation_id).Results
+        assert set(results['similarity']['corr_matrix']) == {'specific_discharge', 'recharge'}
+        api.Simulation.query.delete()
+        api.db.session.commit()
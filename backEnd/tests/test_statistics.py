@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+Weighted quantiles of all the columns at once (quantiles_with_weights) against the column by column calculation
+"""
+
+import numpy as np
+
+from libraries.forecast.statistics import Statistics
+
+QUANTILES = [0.1, 0.25, 0.5, 0.75, 0.9]
+
+
+def column_by_column(samples, weights, quantiles):
+    return np.array([[Statistics.quantile_with_weights(samples[:, column], weights, quantile)
+                      for column in range(samples.shape[1])] for quantile in quantiles])
+
+
+def test_quantiles_with_weights_random():
+    rng = np.random.default_rng(0)
+    samples = rng.lognormal(size=(15, 40))
+    weights = rng.random(15)
+    weights /= weights.sum()
+
+    np.testing.assert_allclose(Statistics.quantiles_with_weights(samples, weights, QUANTILES),
+                               column_by_column(samples, weights, QUANTILES), rtol=1e-12)
+
+
+def test_quantiles_with_weights_ties():
+    rng = np.random.default_rng(1)
+    # Valeurs et poids cumulés égaux entre échantillons
+    samples = rng.integers(0, 4, size=(12, 30)).astype(float)
+    weights = np.full(12, 1 / 12)
+
+    np.testing.assert_allclose(Statistics.quantiles_with_weights(samples, weights, QUANTILES + [0.5, 1 / 3]),
+                               column_by_column(samples, weights, QUANTILES + [0.5, 1 / 3]), rtol=1e-12)
+
+
+def test_quantiles_with_weights_nan():
+    rng = np.random.default_rng(2)
+    samples = rng.normal(size=(10, 25))
+    samples[rng.random(samples.shape) < 0.2] = np.nan
+    samples[:, 0] = np.nan
+    samples[3:5, 1] = 2.
+    weights = rng.random(10)
+    weights /= weights.sum()
+
+    np.testing.assert_allclose(Statistics.quantiles_with_weights(samples, weights, QUANTILES),
+                               column_by_column(samples, weights, QUANTILES), rtol=1e-12, equal_nan=True)
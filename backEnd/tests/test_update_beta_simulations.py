@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Batch update of the SimulationsBeta table (update_beta_simulations.py): rows of the stations replaced in bulk,
+matrices of the former rows released, one row per station, stations whose data have not changed skipped
+"""
+
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import pytest
+
+import update_beta_simulations as UB
+import libraries.simulation_jobs as JOBS
+from libraries import artifact_store as AS
+from libraries import simulation_cache as SC
+from libraries import timeseries_store as TS
+from libraries.load_data import define_paths
+from conftest import WATERSHED_ID
+from test_artifact_store import age
+
+
+@pytest.fixture
+def beta_table(api):
+    with api.app.app_context():
+        yield api
+        api.SimulationsBeta.query.delete()
+        api.db.session.commit()
+
+
+@pytest.fixture
+def store(api, tmp_path, monkeypatch):
+    store = AS.ArtifactStore(str(tmp_path / 'artifacts'))
+    monkeypatch.setattr(api, 'artifacts', store)
+    return store
+
+
+def simulation(store, station_id, seed):
+    # Ligne calculée par beta_simulation_job (matrice dans le magasin d'artefacts)
+    matrix = pd.DataFrame(np.random.default_rng(seed).random((3, 2)), index=[2001, 2002, 2003], columns=['a', 'b'])
+    return {'station': station_id, 'Parameters': {'user_watershed_id': station_id, 'date': '2022-05-01'},
+            'Indicators': [], 'Results': {'similarity': {'corr_matrix': {'recharge': store.put_frame(matrix)}},
+                                          'scenarios': None, 'selected_scenarios': {}}}
+
+
+def rows(api, station_id):
+    return api.SimulationsBeta.query.filter(UB.station_column(api.SimulationsBeta) == station_id).all()
+
+
+def test_write_simulations(beta_table, store):
+    api = beta_table
+    former = simulation(store, 'J0014010', 0)
+    UB.write_simulations(api.db, api.SimulationsBeta, [former, simulation(store, 'J0626610', 1)])
+    assert UB.check_rows(api.db, api.SimulationsBeta, ['J0014010', 'J0626610', 'J3213020']) == {'J3213020': 0}
+
+    # Nouvelle simulation d'une station: l'ancienne ligne est remplacée, sa matrice libérée
+    former_reference = former['Results']['similarity']['corr_matrix']['recharge']
+    age(store, former_reference, 2 * AS.ARTIFACT_GRACE_PERIOD)
+    new = simulation(store, 'J0014010', 2)
+    UB.write_simulations(api.db, api.SimulationsBeta, [new])
+    assert UB.check_rows(api.db, api.SimulationsBeta, ['J0014010', 'J0626610']) == {}
+    assert [row.Results for row in rows(api, 'J0014010')] == [new['Results']]
+
+    with pytest.raises(OSError):
+        store.get_frame(former_reference)
+    store.get_frame(new['Results']['similarity']['corr_matrix']['recharge'])
+
+
+def test_check_rows(beta_table):
+    api = beta_table
+    api.db.session.add_all([api.SimulationsBeta(SimulationID=str(i), Parameters={'user_watershed_id': 'J0014010'}, Results={})
+                            for i in range(2)])
+    api.db.session.commit()
+    assert UB.check_rows(api.db, api.SimulationsBeta, ['J0014010', 'J0626610']) == {'J0014010': 2, 'J0626610': 0}
+
+
+def test_update_database(beta_table):
+    api = beta_table
+    report = UB.update_database('2022-05-01', [WATERSHED_ID, 'unknown'], workers=2, force=True)
+
+    # Durées des étapes de chaque station, erreur de la station inconnue sans interrompre les autres
+    assert list(report.index) == [WATERSHED_ID, 'unknown']
+    assert pd.isna(report.loc[WATERSHED_ID, 'error']) and report.loc['unknown', 'error']
+    assert report.loc[WATERSHED_ID, 'streamflow_forecast'] > 0
+    row, = rows(api, WATERSHED_ID)
+    assert row.Results['simulation_date'] and WATERSHED_ID in row.Results['data_fingerprints']
+    assert UB.check_rows(api.db, api.SimulationsBeta, ['unknown']) == {'unknown': 0}
+
+
+@pytest.fixture
+def fingerprinted_data_path(app_root, similar_watersheds, tmp_path):
+    """
+    Series of the reference watershed and of two similar watersheds, whose fingerprints are compared
+    """
+    source = define_paths(app_root)[0]
+    for variable_folder in TS.STORE_VARIABLES:
+        os.makedirs(os.path.join(str(tmp_path), *variable_folder.split('/')))
+        for station_id in [WATERSHED_ID] + similar_watersheds[:2]:
+            if os.path.exists(TS.timeseries_path(source, variable_folder, station_id)):
+                shutil.copy2(TS.timeseries_path(source, variable_folder, station_id),
+                             TS.timeseries_path(str(tmp_path), variable_folder, station_id))
+    return str(tmp_path)
+
+
+def test_stations_to_update(beta_table, app_root, stations, similar_watersheds, fingerprinted_data_path):
+    api = beta_table
+    data_path = fingerprinted_data_path
+    reference, other = similar_watersheds[:2]
+    piezometers = JOBS.bss_ids(stations)
+
+    def beta_row(station_id, simulation_date, inputs):
+        # Ligne écrite par beta_simulation_job: date effective et empreintes des séries utilisées
+        fingerprints = {input_id: SC.station_fingerprint(data_path, input_id, piezometers.get(input_id)) for input_id in inputs}
+        return api.SimulationsBeta(SimulationID=station_id, Parameters={'user_watershed_id': station_id},
+                                   Results={'simulation_date': simulation_date, 'data_fingerprints': fingerprints})
+
+    def simulation_date(station_id):
+        return JOBS.simulation_date_from_parameters(app_root, stations, {'user_watershed_id': station_id, 'date': '2022-05-01'}).strftime('%Y-%m-%d')
+
+    api.db.session.add_all([beta_row(WATERSHED_ID, simulation_date(WATERSHED_ID), [WATERSHED_ID, reference]),
+                            beta_row(other, '2000-01-01', [other]),
+                            beta_row(reference, None, [])])
+    api.db.session.commit()
+
+    def reasons():
+        return UB.stations_to_update(api.db, api.SimulationsBeta, app_root, data_path, stations, '2022-05-01',
+                                     [WATERSHED_ID, other, reference, 'J0626610'])
+
+    assert reasons() == {WATERSHED_ID: None, other: f"simulation of 2000-01-01, now {simulation_date(other)}",
+                         reference: 'no simulation date or fingerprints', 'J0626610': 'no simulation'}
+
+    # Série d'un bassin similaire réécrite sans nouvelle donnée, puis avec une nouvelle valeur
+    file_path = TS.timeseries_path(data_path, 'hydrometry/specific_discharge', reference)
+    with open(file_path, 'rb') as file:
+        content = file.read()
+    with open(file_path, 'wb') as file:
+        file.write(content)
+    assert reasons()[WATERSHED_ID] is None
+    with open(file_path, 'ab') as file:
+        file.write(b'2099-01-01,1.0\n')
+    assert reasons()[WATERSHED_ID] == f"new data: {reference}"
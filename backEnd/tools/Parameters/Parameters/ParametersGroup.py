@@ -11,10 +11,12 @@ Created on Sat Jan  7 16:08:40 2023
 
 """
 
-from copy import deepcopy
+from copy import copy, deepcopy
+from collections import namedtuple
 from enum import Enum 
 import sys
 import os
+import tempfile
 
 
 # lxml :  more efficient and convenient (implements XPath), 
@@ -89,15 +91,18 @@ def make_dir(folder):
         os.makedirs(folder)
 
     
-def xml_pre_adder(filename):
+def xml_header():
     line1 = '<?xml version="1.0" encoding="UTF-8" standalone="no"?>\n'
     line2 = '<?xml-stylesheet type="text/xsl" href="browser_view.xslt"?>\n'
     line3 = '<?xmlspysps authentic_view.sps?>\n'
-    
+    return line1 + line2 + line3
+
+
+def xml_pre_adder(filename):
     with open(filename, 'r+') as file:
        content = file.read()
        file.seek(0)
-       file.write(line1 + line2 + line3 + content)
+       file.write(xml_header() + content)
         
        
 def test_floatable(type_): 
@@ -240,6 +245,182 @@ class Parameter:
                 param.find('value').text = 'NOT COMPARABLE'
 
 
+# Marker of a value that could not be converted when compiled (converted again, with its error, by getvalue)
+_NOT_CONVERTED = object()
+
+
+class CompiledParameter(namedtuple('CompiledParameter', ['path', 'name', 'value', 'description', 'type', 'default_value', 'typed_value'])): 
+    """  
+    Immutable snapshot of a Parameter, value already converted to its type
+
+    Same reading interface as Parameter (path, name, value, type..., getvalue, display)
+    """
+    __slots__ = ()
+
+    @staticmethod
+    def from_xml(path, parameter_xml): 
+        """
+        Snapshot of the XML parameter structure, path being the path of its ParametersGroup
+        """
+        param = CompiledParameter(tuple(path), parameter_xml.get('name'), parameter_xml.find('value').text,
+                                  parameter_xml.find('description').text, parameter_xml.find('type').text,
+                                  parameter_xml.find('default_value').text, _NOT_CONVERTED)
+        return param.with_value(param.value)
+
+
+    def with_value(self, value): 
+        """
+        Snapshot of the parameter with a new value (string, as in the XML structure)
+        """
+        param = self._replace(value=value, typed_value=_NOT_CONVERTED)
+        # Wrong booleans stop the application: only when the value is read, as Parameter does
+        if param.type != 'bool' or param.value in ('False', '0', 'True', '1'): 
+            try: 
+                param = param._replace(typed_value=Parameter.getvalue(param))
+            except Exception: 
+                pass
+        return param
+
+
+    def getvalue(self): 
+        """ 
+        Gets parameter value with the right type (converted once, when compiled)
+        """
+        if self.typed_value is _NOT_CONVERTED: 
+            return Parameter.getvalue(self)
+        return self.typed_value
+
+
+    def display(self): 
+        Parameter.display(self)
+
+
+class CompiledGroup: 
+    """
+    Immutable snapshot of a ParametersGroup: subgroups and parameters indexed by name
+
+    getgroup and getparam are dictionary lookups (one per level of the path), without any copy or XPath query.
+    The snapshot is shared (not copied by deepcopy): modifications are made on the XML tree of the
+    ParametersGroup (find_and_replace_param), which compiles a new snapshot.
+
+    Attributes
+    ----------
+    name : string
+        name of the ParametersGroup
+    current_path : tuple of strings
+        path of the group from the root of the XML structure
+    groups : dict
+        subgroups (CompiledGroup) by name
+    params : dict
+        parameters (CompiledParameter) by name
+    """
+    __slots__ = ('name', 'current_path', 'groups', 'params')
+
+    def __init__(self, group_xml, current_path):
+        """
+        Compiles the XML ParametersGroup structure and all its subgroups
+        """
+        self.name = group_xml.get('name')
+        self.current_path = tuple(current_path)
+        self.groups = {}
+        self.params = {}
+        for child in group_xml: 
+            # The first element of a name is kept, as the XPath queries do
+            if child.tag == 'ParametersGroup' and child.get('name') not in self.groups: 
+                self.groups[child.get('name')] = CompiledGroup(child, self.current_path + (child.get('name'),))
+            elif child.tag == 'Parameter' and child.get('name') not in self.params: 
+                self.params[child.get('name')] = CompiledParameter.from_xml(self.current_path, child)
+
+
+    def __deepcopy__(self, memo): 
+        return self
+
+
+    def with_values(self, values): 
+        """
+        Snapshot with new values of parameters, the unchanged subgroups being shared
+
+        Parameters
+        ----------
+        values : dict
+            path of the parameter from the group (tuple of names) -> new value (string)
+
+        Returns
+        -------
+        group : CompiledGroup
+        """
+        if not values: 
+            return self
+        group = copy(self)
+        group.groups = dict(self.groups)
+        group.params = dict(self.params)
+        subgroups_values = {}
+        for path, value in values.items(): 
+            if len(path) == 1: 
+                group.params[path[0]] = self.params[path[0]].with_value(value)
+            else: 
+                subgroups_values.setdefault(path[0], {})[path[1:]] = value
+        for name, subgroup_values in subgroups_values.items(): 
+            group.groups[name] = self.groups[name].with_values(subgroup_values)
+        return group
+
+
+    def exists(self): 
+        return True
+
+
+    def getgroup_safe(self, group_name, option_copy=False): 
+        """
+        Gets the subgroup of name "group_name" ('level1::level2' for the descendants)
+
+        Returns
+        -------
+        exists : bool 
+            existence of the subgroup
+        subgroup : CompiledGroup
+            the subgroup (shared, option_copy is kept for compatibility with ParametersGroup)
+        """
+        subgroup = self
+        for level in string_to_list(group_name): 
+            subgroup = subgroup.groups.get(level)
+            if subgroup is None: 
+                print('ParametersGroup not found : ', group_name, 'in ', list_to_string(self.current_path))
+                return False, None
+        return True, subgroup
+
+
+    def getgroup(self, group_name): 
+        return self.getgroup_safe(group_name)[1]
+
+
+    def getparam_safe(self, param_name): 
+        """
+        Gets the parameter of name "param_name" as a direct descendant
+
+        Returns
+        -------
+        exists : bool 
+            existence of the parameter
+        param : CompiledParameter
+            the parameter 
+        """
+        param = self.params.get(param_name)
+        if param is None: 
+            print('Parameter not found : ', param_name, ' in ', list_to_string(self.current_path))
+        return param is not None, param
+
+
+    def getparam(self, param_name): 
+        """
+        Gets the parameter of name "param_name" ('group::param' for the parameters of the descendants)
+        """
+        if param_name.find('::') == -1: 
+            return self.getparam_safe(param_name)[1]
+        groups_param = string_to_list(param_name)
+        exists, subgroup = self.getgroup_safe('::'.join(groups_param[:-1]))
+        return subgroup.getparam_safe(groups_param[-1])[1] if exists else None
+
+
 class ParametersGroup: 
     """
     ParametersGroup structure loading XML files  
@@ -258,10 +439,23 @@ class ParametersGroup:
     current_path : string
         current path of current xml root 
     
+    compiled : CompiledGroup
+        snapshot of the values read by getgroup and getparam (compiled at the first reading
+        after a modification of the xml)
+    
+    names_index : dict
+        index of the names of the parameters (see names_index_of), shared by the copies
+    
     Methods (principal)
     -------
     __init__(file_name)
         Constructor:loads xml from file 
+    compile()
+        Immutable snapshot of the structure (CompiledGroup)
+    clone()
+        Copy with its own XML tree
+    apply_overrides(overrides)
+        Replaces the values of several parameters given by name, in one pass
     
     """
 
@@ -274,6 +468,8 @@ class ParametersGroup:
                 file name to be read
         """
         self.file_name = file_name
+        self.compiled = None
+        self.names_index = None
         if (file_exist(file_name)):
             # Loads file 
             parser = lxml.etree.XMLParser(attribute_defaults=True)
@@ -301,6 +497,114 @@ class ParametersGroup:
         return self.root != None 
     
     
+    def compile(self): 
+        """
+        Immutable snapshot of the ParametersGroup, compiled once and kept until the next modification
+        of the XML structure (find_and_replace_param, set_default_value)
+        
+        Returns
+        -------
+        compiled : CompiledGroup
+        """
+        if self.compiled is None: 
+            self.compiled = CompiledGroup(self.root, self.current_path)
+        return self.compiled
+    
+    
+    def clone(self): 
+        """
+        Copy of the ParametersGroup with its own XML tree, without reading the file again
+        The compiled snapshot, immutable, is shared with the copy
+        
+        Returns
+        -------
+        pgroup : ParametersGroup
+        """
+        pgroup = copy(self)
+        pgroup.root = deepcopy(self.root)
+        pgroup.current_path = list(self.current_path)
+        return pgroup
+    
+    
+    def names_index_of(self): 
+        """
+        Index of the names of the parameters and of the groups of the structure, built once (the structure
+        does not change with the values)
+        
+        Each name (dotted path under the root: 'user_watershed_id', 'UserConfig.user_watershed_id',
+        'specific_discharge.Calculation.metric'...) gives the first element of this path in the order of the
+        file, as the XPath search './/*[@name="..."]/*[@name="..."]' of the structure does.
+        
+        Returns
+        -------
+        names_index : dict
+            name -> (full path from the root as a tuple, True if the element is a Parameter)
+        """
+        if self.names_index is None: 
+            names_index = {}
+            for element in self.root.iterdescendants('ParametersGroup', 'Parameter'): 
+                path = [element.get('name')]
+                parent = element.getparent()
+                while parent is not None and parent is not self.root: 
+                    path.insert(0, parent.get('name'))
+                    parent = parent.getparent()
+                for start in range(len(path)): 
+                    names_index.setdefault('.'.join(path[start:]), (tuple(self.current_path) + tuple(path), element.tag == 'Parameter'))
+            self.names_index = names_index
+        return self.names_index
+    
+    
+    def apply_overrides(self, overrides): 
+        """
+        Replaces the values of the parameters given by their name in one pass on the XML tree,
+        and updates the compiled snapshot without compiling it again
+        
+        Args
+        ----
+        overrides : dict
+            name of the parameter (see names_index_of) -> new value, or nested dictionaries of names
+            ({'UserConfig': {'user_horizon': 30}} for 'UserConfig.user_horizon')
+        
+        Returns
+        -------
+        not_found : list of strings
+            names which are not parameters of the structure (ignored)
+        """
+        names_index = self.names_index_of()
+        values, not_found = {}, []
+        pending = list(overrides.items())
+        while pending: 
+            name, value = pending.pop(0)
+            if isinstance(value, dict): 
+                pending[0:0] = [(name + '.' + key, subvalue) for key, subvalue in value.items()]
+                continue
+            path, is_param = names_index.get(name, (None, False))
+            if is_param: 
+                values[path] = str(value)
+            else: 
+                not_found.append(name)
+        
+        if values: 
+            # XML tree: the parameters modified found in one exploration (first element of each path)
+            remaining = dict(values)
+            for param in self.root.iterdescendants('Parameter'): 
+                if not remaining: 
+                    break
+                path = [param.get('name')]
+                parent = param.getparent()
+                while parent is not None and parent is not self.root: 
+                    path.insert(0, parent.get('name'))
+                    parent = parent.getparent()
+                path = tuple(self.current_path) + tuple(path)
+                if path in remaining: 
+                    param.find('value').text = remaining.pop(path)
+            # Compiled snapshot: new values on the path of the modified parameters only
+            if self.compiled is not None: 
+                depth = len(self.current_path)
+                self.compiled = self.compiled.with_values({path[depth:]: value for path, value in values.items()})
+        return not_found
+    
+    
     def getgroup_safe(self,group_name,option_copy=False):
         """
         Gets the subgroup of name "group_name" as a direct descendant
@@ -347,6 +651,7 @@ class ParametersGroup:
                 subgroup = self
             subgroup.root = root
             subgroup.current_path = current_path  
+            subgroup.compiled = None
             # print(subgroup.root.tag, '\t', subgroup.root.get('name')) 
         else: 
             subgroup = None 
@@ -362,28 +667,15 @@ class ParametersGroup:
         Args: 
         ----------
         group_name : string
-            Name of the Group
+            Name of the Group ('level1::level2' for the descendants)
    
         Returns
         -------
-        exists : bool 
-            existence of the subgroup
-        subgroup : ParametersGroup
-            the subgroup 
-        option_copy : string
-            True : deep copy of the result
-            False : address (pointer) to the result
+        subgroup : CompiledGroup
+            the subgroup in the compiled snapshot (no copy), None if it does not exist
    
         """
-        if group_name.find('::') == -1: 
-            exists, subgroup = self.getgroup_safe(group_name,option_copy=True)
-        else: 
-            groups = string_to_list(group_name)
-            subgroup = self
-            for i in groups[:-1]: 
-                subgroup = subgroup.getgroup(i)
-                
-        return subgroup
+        return self.compile().getgroup(group_name)
 
     
     
@@ -429,21 +721,10 @@ class ParametersGroup:
    
         Returns
         -------
-        exists : bool 
-            existence of the subgroup
-        param : Parameter
-            the parameter 
+        param : CompiledParameter
+            the parameter in the compiled snapshot, None if it does not exist
         """
-        
-        if param_name.find('::') == -1: 
-            exists, param = self.getparam_safe(param_name)
-        else: 
-            groups_param = string_to_list(param_name)
-            pg = self
-            for i in groups_param[:-1]: 
-                pg = pg.getgroup(i)
-            exists, param = pg.getparam_safe(groups_param[-1])
-        return param
+        return self.compile().getparam(param_name)
     
     
     def set_default_value(self): 
@@ -452,6 +733,7 @@ class ParametersGroup:
         """
         # Stores the name of the not defined values 
         undefined = []
+        self.compiled = None
         # Explores all "Parameter" in the XML tree with .//Parameter identification 
         for param in self.root.iterfind('.//Parameter'): 
             value = param.find('value').text
@@ -473,9 +755,15 @@ class ParametersGroup:
             output to the file of name "file_name"
         
         """
+        # Content written at once in a temporary file then renamed: the processes merging the same
+        # parameter file at the same time do not interleave their writes
         et=lxml.etree.ElementTree(self.root)
-        et.write(file_name,pretty_print=True)
-        xml_pre_adder(file_name)
+        content = xml_header() + lxml.etree.tostring(et,pretty_print=True).decode()
+        fd, temp_name = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(os.path.abspath(file_name)))
+        with os.fdopen(fd, 'w') as file:
+            file.write(content)
+        os.chmod(temp_name, 0o644)
+        os.replace(temp_name, file_name)
 
             
     def find_param(self,path): 
@@ -556,6 +844,7 @@ class ParametersGroup:
                     break
         if exists: 
             root.find('value').text = str(new_value)
+            self.compiled = None
                     
 
     @staticmethod
@@ -648,6 +937,7 @@ class ParametersGroup:
         else: 
             # Compares the two ParametersGroup, pg_res may be modified with the values of the 'usr' (REPLACE) or with the difference between both (DIFF)
             ParametersGroup.exploration_recursive(pg_res.root, pg_usr, Parameter.comparison, option, not_in_ref, level=0, path=[])
+            pg_res.compiled = None
         
         # Output report 
         return pg_res, not_in_ref
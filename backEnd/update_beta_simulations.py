@@ -1,39 +1,230 @@
-import os
-import requests
+# -*- coding: utf-8 -*-
+"""
+Launcher computing the default simulations of all the stations at a date (SimulationsBeta table,
+displayed by the website when a station is selected)
+
+The stations, the watersheds and the paths are loaded once (api2), and the simulations of the stations are
+run by a pool of worker processes which receive the stations once and share the memory-mapped time series
+store. The rows are written in bulk, BATCH_SIZE stations per transaction, replacing the former rows of the stations
+(the matrices of the former rows no longer referenced are removed from the artifact store).
+The duration of each stage is printed for each station, with the failures at the end.
+
+Each row keeps its effective simulation date (date asked, limited by the last dates of the data of the station)
+and the fingerprints of the series it has been computed with (station and similar watersheds). Only the stations
+whose effective date at the date asked differs, or whose series or similar watersheds series have changed since,
+are computed again (all of them with --force): the stations whose data have not been updated (Hub'Eau failures
+in update_timeseries.py) are reported as skipped, even if the date asked (today by default) has changed.
+
+Should be launched from the backEnd folder, after the update of the time series:
+    python update_beta_simulations.py [--date 2024-05-01] [--stations J0121510 J0626610] [--workers 4] [--force] [--report report.csv]
+"""
+
+# Python modules
+import json
+import time
+import uuid
+import argparse
+import datetime
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import pandas as pd
-import pyproj
-from shapely.geometry import Point
-
-# Définir le chemin vers le fichier stations.csv
-app_root = os.path.dirname(os.path.abspath(__file__))
-stations_file_path = os.path.join(app_root, 'data', 'stations.csv')
-
-# Charger les données des stations
-stations = pd.read_csv(stations_file_path, delimiter=';', encoding='ISO-8859-1')
-
-def send_reset_request():
-    url = "http://localhost:5000/api/resetDatabase"  # A changer lors de l'utilisation sur le serveur
-    headers = {'Content-Type': 'application/json'}
-    response = requests.post(url, headers=headers)
-    if response.status_code == 200:
-        print("Successfully reset the database")
-    else:
-        print(f"Failed to reset the database: {response.text}")
-
-def send_update_request(station):
-    url = "http://localhost:5000/api/updateSimulationsBeta"  #  A changer lors de l'utilisation sur le serveur
-    headers = {'Content-Type': 'application/json'}
-    data = {"station": station}
-    response = requests.post(url, json=data, headers=headers)
-    if response.status_code == 200:
-        print(f"Successfully updated simulation for station ID: {station}")
-    else:
-        print(f"Failed to update simulation for station ID: {station}: {response.text}")
-
-def update_database():
-    send_reset_request()  # Réinitialiser la base de données avant de la mettre à jour
-    for index, station in stations.iterrows():
-        send_update_request(station['ID'])
+
+# Cydre modules
+import libraries.simulation_jobs as JOBS
+from libraries import simulation_cache as SC
+from libraries import artifact_store as AS
+
+
+# Number of stations written per transaction
+BATCH_SIZE = 50
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Computes the default simulations of the stations (SimulationsBeta table)")
+    parser.add_argument('--date', default=datetime.date.today().isoformat(),
+                        help="date of the simulations (YYYY-MM-DD), today by default")
+    parser.add_argument('--stations', nargs='+', default=None,
+                        help="identifiers of the stations, all the stations by default")
+    parser.add_argument('--workers', type=int, default=JOBS.JOB_WORKERS,
+                        help="number of worker processes")
+    parser.add_argument('--force', action='store_true',
+                        help="computes the simulations again even if their data have not changed")
+    parser.add_argument('--report', default=None,
+                        help="csv file where the durations of the stages and the errors of each station are written")
+    return parser.parse_args()
+
+
+def station_column(SimulationsBeta):
+    """
+    Station of the rows, as a string (JSON_UNQUOTE(JSON_EXTRACT(...)) on MySQL, whose IN() does not compare JSON values)
+    """
+    return SimulationsBeta.Parameters['user_watershed_id'].as_string()
+
+
+def write_simulations(db, SimulationsBeta, simulations):
+    """
+    Replaces the rows of the stations by their new simulations, in one transaction,
+    then removes the matrices of the former rows that are no longer referenced
+    """
+    from api2 import release_artifacts
+
+    station_ids = [simulation['station'] for simulation in simulations]
+    former_rows = SimulationsBeta.query.filter(station_column(SimulationsBeta).in_(station_ids))
+    former_references = set().union(*(AS.references(results) for (results,) in former_rows.with_entities(SimulationsBeta.Results)))
+    former_rows.delete(synchronize_session=False)
+
+    db.session.execute(SimulationsBeta.__table__.insert(),
+                       [{'SimulationID': str(uuid.uuid4()),
+                         'Parameters': simulation['Parameters'],
+                         'SimulationDate': datetime.datetime.now(),
+                         'Indicators': simulation['Indicators'],
+                         'Results': simulation['Results']} for simulation in simulations])
+    db.session.commit()
+
+    new_references = set().union(*(AS.references(simulation['Results']) for simulation in simulations))
+    release_artifacts(former_references - new_references)
+
+
+def stations_to_update(db, SimulationsBeta, app_root, data_path, stations, date, station_ids):
+    """
+    Reason of the update of each station, None if its simulation is up to date: simulation of the same effective date
+    (date asked limited by the last dates of the data, see TimeManagement.define_simulation_date) whose series
+    (station and similar watersheds) have the same fingerprints as the current files
+    """
+    # Date effective et empreintes des simulations existantes (sans charger les résultats)
+    simulations = {}
+    for station_id, simulation_date, fingerprints in db.session.query(station_column(SimulationsBeta),
+                                                                      SimulationsBeta.Results['simulation_date'].as_string(),
+                                                                      db.func.json_extract(SimulationsBeta.Results, '$.data_fingerprints')):
+        if isinstance(fingerprints, str):
+            fingerprints = json.loads(fingerprints)
+        simulations[station_id] = (simulation_date, fingerprints)
+
+    # Empreintes actuelles, calculées une fois par station
+    piezometers = JOBS.bss_ids(stations)
+    current = {}
+    def fingerprint(station_id):
+        if station_id not in current:
+            current[station_id] = SC.station_fingerprint(data_path, station_id, piezometers.get(station_id))
+        return current[station_id]
+
+    reasons = {}
+    for station_id in station_ids:
+        simulation = simulations.get(station_id)
+        if simulation is None:
+            reasons[station_id] = 'no simulation'
+            continue
+        if not simulation[0] or not simulation[1]:
+            reasons[station_id] = 'no simulation date or fingerprints'
+            continue
+        try:
+            simulation_date = JOBS.simulation_date_from_parameters(app_root, stations, {'user_watershed_id': station_id, 'date': date})
+            simulation_date = simulation_date.strftime('%Y-%m-%d')
+        except Exception as e:
+            reasons[station_id] = f"simulation date: {e}"
+            continue
+        if simulation[0] != simulation_date:
+            reasons[station_id] = f"simulation of {simulation[0]}, now {simulation_date}"
+        else:
+            changed = [input_id for input_id, input_fingerprint in simulation[1].items() if fingerprint(input_id) != input_fingerprint]
+            reasons[station_id] = f"new data: {' '.join(changed)}" if changed else None
+    return reasons
+
+
+def check_rows(db, SimulationsBeta, station_ids):
+    """
+    Stations of station_ids which have not exactly one row in the table, with their number of rows
+    """
+    counts = dict(db.session.query(station_column(SimulationsBeta), db.func.count())
+                  .filter(station_column(SimulationsBeta).in_(station_ids))
+                  .group_by(station_column(SimulationsBeta)))
+    return {station_id: counts.get(station_id, 0) for station_id in station_ids if counts.get(station_id, 0) != 1}
+
+
+def update_database(date, station_ids=None, workers=JOBS.JOB_WORKERS, force=False):
+    """
+    Computes the simulations of the stations and writes them in the SimulationsBeta table
+
+    Parameters
+    ----------
+    date : string
+        date of the simulations (YYYY-MM-DD)
+    station_ids : list of strings, optional
+        stations to update, all the stations if None
+    workers : int
+        number of worker processes
+    force : bool
+        computes all the simulations, even those whose data have not changed
+
+    Returns
+    -------
+    report : DataFrame
+        reason of the update, durations (s) of the stages, total duration and error of each station
+    """
+    # Chargement unique des stations et de la base de données de l'API (pas dans les processus de calcul)
+    from api2 import app, db, SimulationsBeta, app_root, data_path, gdf_stations
+
+    if station_ids is None:
+        station_ids = gdf_stations['ID'].tolist()
+
+    start = time.time()
+    report, pending, written = [], [], []
+    context = multiprocessing.get_context('spawn')
+    with app.app_context(), ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                                initializer=JOBS._init_worker, initargs=(app_root, gdf_stations)) as executor:
+        if force:
+            reasons = {station_id: 'forced' for station_id in station_ids}
+        else:
+            reasons = stations_to_update(db, SimulationsBeta, app_root, data_path, gdf_stations, date, station_ids)
+        skipped = [station_id for station_id, reason in reasons.items() if reason is None]
+        report.extend({'station': station_id, 'update': 'skipped (unchanged data)'} for station_id in skipped)
+        if skipped:
+            print(f"{len(skipped)} stations skipped (unchanged data):", ' '.join(skipped))
+
+        futures = {executor.submit(JOBS.beta_simulation_job, {'user_watershed_id': station_id, 'date': date}): station_id
+                   for station_id, reason in reasons.items() if reason is not None}
+
+        for future in as_completed(futures):
+            try:
+                simulation = future.result()
+            except Exception as e:
+                # Processus de calcul interrompu
+                simulation = {'station': futures[future], 'timings': {}, 'error': str(e)}
+
+            row = dict(station=simulation['station'], update=reasons[simulation['station']], **simulation['timings'])
+            row['total'] = round(sum(simulation['timings'].values()), 3)
+            row['error'] = simulation.get('error')
+            report.append(row)
+            if row['error']:
+                print(f"{row['station']} : failed after {row['total']} s : {row['error']}")
+            else:
+                print(f"{row['station']} : {row['total']} s", dict(simulation['timings']))
+                pending.append(simulation)
+                written.append(simulation['station'])
+
+            if len(pending) >= BATCH_SIZE:
+                write_simulations(db, SimulationsBeta, pending)
+                pending = []
+
+        if pending:
+            write_simulations(db, SimulationsBeta, pending)
+
+        # Une ligne et une seule par station mise à jour
+        wrong_rows = check_rows(db, SimulationsBeta, written)
+
+    report = pd.DataFrame(report).set_index('station').reindex(station_ids)
+    report = report.reindex(columns=[column for column in report.columns if column not in ('total', 'error')] + ['total', 'error'])
+    failures = report[report['error'].notna()]
+    print(f"{len(futures) - len(failures)}/{len(futures)} stations updated in {round(time.time() - start, 1)} s, {len(skipped)} skipped")
+    for station_id, error in failures['error'].items():
+        print(f"Failed: {station_id} : {error}")
+    for station_id, count in wrong_rows.items():
+        print(f"Warning: {station_id} has {count} rows in the SimulationsBeta table")
+    return report
+
 
 if __name__ == "__main__":
-    update_database()
+    arguments = parse_arguments()
+    report = update_database(arguments.date, arguments.stations, arguments.workers, arguments.force)
+    if arguments.report:
+        report.to_csv(arguments.report)
@@ -128,7 +128,8 @@ export class RegionalMapComponent {
   * location du fichier origine :backend/data/stations.csv
   */
   initGDFWatersheds() {
-    this.jsonService.getGDFWatersheds().then(data => {
+    // Géométries simplifiées pour la carte régionale (zoom initial 6.8, marge pour agrandir la carte)
+    this.jsonService.getGDFWatersheds(8).then(data => {
     this.DataGDFWatersheds = data;  
     });
   }
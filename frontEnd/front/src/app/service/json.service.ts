@@ -32,10 +32,12 @@ export class JsonService {
   
 	/**
 	 * Méthode pour récupérer les bassins versants GDF.
+	 * @param zoom - Niveau de zoom de la carte (optionnel) : géométries simplifiées adaptées à ce niveau, pleine résolution sinon.
 	 * @returns Une promesse contenant un tableau de bassins versants.
 	 */
-	getGDFWatersheds(): Promise<Array<dataGDFWatersheds>> {
-	  return lastValueFrom(this.http.get<Array<dataGDFWatersheds>>("osur/GetGDFWatersheds")); // Envoi d'une requête GET pour récupérer les bassins versants.
+	getGDFWatersheds(zoom?: number): Promise<Array<dataGDFWatersheds>> {
+	  const params = zoom !== undefined ? new HttpParams().set('zoom', zoom) : undefined;
+	  return lastValueFrom(this.http.get<Array<dataGDFWatersheds>>("osur/GetGDFWatersheds", { params })); // Envoi d'une requête GET pour récupérer les bassins versants.
 	}
   
 	/**
@@ -172,13 +174,33 @@ export class JsonService {
 	 * @returns Une promesse contenant la réponse de l'API.
 	 */
 	runTimeseriesSimilarity(simulation_id: string): Promise<any> {
-	  return this.http.post(`${this.baseUrl}/api/run_timeseries_similarity/${simulation_id}`, { simulation_id }).toPromise()
+	  return this.http.post<any>(`${this.baseUrl}/api/run_timeseries_similarity/${simulation_id}`, { simulation_id }).toPromise()
 		.then(response => {
 		  console.log('Running timeseries similarity'); // Log lors de l'exécution.
-		  return response; // Retourner la réponse de l'API.
+		  return this.waitForJob(response.JobID); // Attendre la fin de la tâche de fond (résultats stockés dans la simulation).
 		});
 	}
   
+	/**
+	 * Méthode pour attendre la fin d'une tâche de fond de l'API (similarités temporelles, prévisions).
+	 * @param jobId - L'identifiant de la tâche renvoyé par l'API.
+	 * @param delay - L'intervalle entre deux interrogations de l'état de la tâche (ms).
+	 * @returns Une promesse contenant l'état final de la tâche (avancement et durée de chaque étape).
+	 */
+	waitForJob(jobId: string, delay: number = 1000): Promise<any> {
+	  return lastValueFrom(timer(0, delay).pipe(
+		switchMap(() => this.http.get<any>(`${this.baseUrl}/api/jobs/${jobId}`)),
+		takeWhile(status => status.state !== 'done' && status.state !== 'failed', true),
+		toArray(),
+		map(statuses => statuses[statuses.length - 1])
+	  )).then(status => {
+		if (status.state === 'failed') {
+		  throw new Error(status.error); // Propager l'erreur de la tâche.
+		}
+		return status;
+	  });
+	}
+  
 	/**
 	 * Méthode pour exécuter les scénarios associés à une simulation.
 	 * @param simulation_id - L'identifiant de la simulation.
@@ -198,10 +220,10 @@ export class JsonService {
 	 * @returns Une promesse contenant les résultats de prévision.
 	 */
 	getForecastResults(taskId: string): Promise<any> {
-	  return this.http.get(`${this.baseUrl}/api/simulateur/getForecastResults/` + taskId).toPromise()
+	  return this.http.get<any>(`${this.baseUrl}/api/simulateur/getForecastResults/` + taskId).toPromise()
 		.then(response => {
 		  console.log('Generating graph...'); // Log lors de la génération des résultats.
-		  return response; // Retourner la réponse de l'API.
+		  return this.waitForJob(response.JobID); // Attendre la fin de la tâche de fond (graphe stocké dans la simulation).
 		});
 	}
   